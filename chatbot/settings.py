@@ -89,6 +89,11 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 MONGO_COLLECTION_NAME = os.getenv("MONGO_COLLECTION_NAME")
+# One summary document per chat (title, timestamps, message count) for the sidebar.
+MONGO_SESSIONS_COLLECTION_NAME = os.getenv("MONGO_SESSIONS_COLLECTION_NAME", "chat_sessions")
+# Set MONGO_TLS=False for a local mongod; MONGO_URI=mongomock:// uses an in-process stand-in
+# (requires the mongomock package; sync driver only, so the async views fall back to threads).
+MONGO_TLS = os.getenv("MONGO_TLS", "True") == "True"
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
@@ -96,6 +101,18 @@ TUNED_MODEL_NAME = os.getenv("TUNED_MODEL_NAME")
 
 GEMINI_EMBEDDING_MODEL = os.getenv('GEMINI_EMBEDDING_MODEL', "models/text-embedding-004")
 
+# 'gemini' calls the real API; 'fake' swaps in the deterministic model and embeddings from
+# core.fakes (no API key needed), e.g. for `manage.py load_test`. Latency specs take the form
+# fixed:V, uniform:LOW,HIGH, normal:MEAN,STDDEV or lognormal:MEDIAN,SIGMA (seconds).
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+FAKE_LLM_FIRST_TOKEN_LATENCY = os.getenv('FAKE_LLM_FIRST_TOKEN_LATENCY', 'lognormal:0.5,0.35')
+FAKE_LLM_OUTPUT_TOKENS = os.getenv('FAKE_LLM_OUTPUT_TOKENS', 'uniform:80,400')
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv('FAKE_LLM_TOKENS_PER_SECOND', 60))
+FAKE_ROUTER_RAG_FRACTION = float(os.getenv('FAKE_ROUTER_RAG_FRACTION', 0.6))
+FAKE_EMBEDDING_LATENCY = os.getenv('FAKE_EMBEDDING_LATENCY', 'lognormal:0.08,0.3')
+FAKE_EMBEDDING_DIMENSION = int(os.getenv('FAKE_EMBEDDING_DIMENSION', 768))
+FAKE_SEED = int(os.getenv('FAKE_SEED', 0))
+
 GENERATION_CONFIG = {
     "temperature": float(os.getenv("GEMINI_TEMPERATURE", 0.7)),
     "top_p": float(os.getenv("GEMINI_TOP_P", 0.95)),
@@ -114,12 +131,150 @@ CUSTOM_SAFETY_SETTINGS = {
 LOCAL_DOCUMENTS_PATH = os.getenv('LOCAL_DOCUMENTS_PATH', BASE_DIR / 'local_docs')
 VECTORSTORE_PATH = os.getenv('VECTORSTORE_PATH', BASE_DIR / 'vectorstore_db')
 
+# Parsing and embedding stages of build_rag_index (overridable per run with command options).
+# RAG_PARSE_WORKERS=0 uses one process per CPU.
+RAG_PARSE_WORKERS = int(os.getenv('RAG_PARSE_WORKERS', 0))
+RAG_EMBED_BATCH_SIZE = int(os.getenv('RAG_EMBED_BATCH_SIZE', 64))
+RAG_EMBED_CONCURRENCY = int(os.getenv('RAG_EMBED_CONCURRENCY', 4))
+RAG_EMBED_REQUESTS_PER_MINUTE = float(os.getenv('RAG_EMBED_REQUESTS_PER_MINUTE', 120))
+
 
 CHAT_HISTORY_LIMIT = int(os.getenv('CHAT_HISTORY_LIMIT', 10))
+# Older messages fetched per request when scrolling up through a conversation.
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 20))
 CHAT_TITLE_MAX_LENGTH = int(os.getenv('CHAT_TITLE_MAX_LENGTH', 35))
+# Sidebar chats rendered with the page; more are fetched from /api/chats/ on scroll.
+CHAT_LIST_PAGE_SIZE = int(os.getenv('CHAT_LIST_PAGE_SIZE', 30))
+
+# Write-behind persistence: a turn's messages are queued and written by a background worker
+# in batches (insert_many + sessions bulk_write), so responses do not wait on MongoDB. Reads
+# in the same process see queued messages; a crash loses at most the queued writes (batches
+# that keep failing are appended to CHAT_WRITE_BEHIND_DEAD_LETTER_PATH).
+CHAT_WRITE_BEHIND_ENABLED = os.getenv('CHAT_WRITE_BEHIND_ENABLED', 'True') == 'True'
+CHAT_WRITE_BEHIND_QUEUE_SIZE = int(os.getenv('CHAT_WRITE_BEHIND_QUEUE_SIZE', 1000))
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(os.getenv('CHAT_WRITE_BEHIND_BATCH_SIZE', 100))
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('CHAT_WRITE_BEHIND_FLUSH_INTERVAL', 0.2))
+CHAT_WRITE_BEHIND_MAX_RETRIES = int(os.getenv('CHAT_WRITE_BEHIND_MAX_RETRIES', 5))
+
+# History compaction: older turns are folded into a rolling summary stored on the chat's
+# session document (updated in the background after each save). Prompts then carry the
+# summary plus the newest messages, kept under CHAT_HISTORY_TOKEN_CEILING estimated tokens.
+CHAT_HISTORY_COMPACTION_ENABLED = os.getenv('CHAT_HISTORY_COMPACTION_ENABLED', 'False') == 'True'
+CHAT_HISTORY_TOKEN_CEILING = int(os.getenv('CHAT_HISTORY_TOKEN_CEILING', 1500))
+# Newest messages always kept verbatim; older ones are summarized once this many have piled up.
+CHAT_SUMMARY_KEEP_RECENT_MESSAGES = int(os.getenv('CHAT_SUMMARY_KEEP_RECENT_MESSAGES', 4))
+CHAT_SUMMARY_MIN_BATCH_MESSAGES = int(os.getenv('CHAT_SUMMARY_MIN_BATCH_MESSAGES', 4))
+CHAT_SUMMARY_MAX_WORDS = int(os.getenv('CHAT_SUMMARY_MAX_WORDS', 250))
+
+# Recent messages per chat, cached so most turns need no MongoDB read. locmem is per
+# process; set CHAT_HISTORY_CACHE_BACKEND/LOCATION (e.g. django.core.cache.backends.redis.RedisCache)
+# to share it between workers.
+CHAT_HISTORY_CACHE_ENABLED = os.getenv('CHAT_HISTORY_CACHE_ENABLED', 'True') == 'True'
+CHAT_HISTORY_CACHE_MESSAGES = int(os.getenv('CHAT_HISTORY_CACHE_MESSAGES', 50))
+CHAT_HISTORY_CACHE_TTL_SECONDS = int(os.getenv('CHAT_HISTORY_CACHE_TTL_SECONDS', 300))
+
+CHAT_HISTORY_CACHE = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'chat-history',
+    'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CHAT_HISTORY_CACHE_MAX_CHATS', 2000))},
+}
+if os.getenv('CHAT_HISTORY_CACHE_BACKEND'):
+    CHAT_HISTORY_CACHE = {
+        'BACKEND': os.getenv('CHAT_HISTORY_CACHE_BACKEND'),
+        'LOCATION': os.getenv('CHAT_HISTORY_CACHE_LOCATION', ''),
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'chat_history': CHAT_HISTORY_CACHE,
+}
 
 GENERAL_SYSTEM_MESSAGE = os.getenv('GENERAL_SYSTEM_MESSAGE')
 
+# core.services connects to MongoDB/Gemini/Chroma in a background thread started by wsgi.py/asgi.py
+# (or lazily on the first request); /readyz reports 200 only once that has succeeded.
+SERVICE_WARMUP_ON_START = os.getenv('SERVICE_WARMUP_ON_START', 'True') == 'True'
+# Live generate_content/embed_query calls during initialization (slower start, earlier failure).
+SERVICE_STARTUP_SELF_TEST = os.getenv('SERVICE_STARTUP_SELF_TEST', 'False') == 'True'
+SERVICE_INIT_RETRY_SECONDS = float(os.getenv('SERVICE_INIT_RETRY_SECONDS', 30))
+
+# 'llm' always asks Gemini via router_chain; 'local' tries the local classifier first
+# and only falls back to router_chain when its confidence is below the threshold.
+ROUTER_MODE = os.getenv('ROUTER_MODE', 'llm')
+ROUTER_DATA_PATH = Path(os.getenv('ROUTER_DATA_PATH', BASE_DIR / 'router_data'))
+LOCAL_ROUTER_MODEL_PATH = ROUTER_DATA_PATH / 'local_router_model.json'
+ROUTER_DECISION_LOG_PATH = ROUTER_DATA_PATH / 'routing_decisions.jsonl'
+# Opt-in: the log holds raw user queries. It is written off the request thread and rotated
+# once it reaches ROUTER_DECISION_LOG_MAX_BYTES, keeping ROUTER_DECISION_LOG_BACKUPS old files.
+ROUTER_DECISION_LOG_ENABLED = os.getenv('ROUTER_DECISION_LOG_ENABLED', 'False') == 'True'
+ROUTER_DECISION_LOG_MAX_BYTES = int(os.getenv('ROUTER_DECISION_LOG_MAX_BYTES', 20 * 1024 * 1024))
+ROUTER_DECISION_LOG_BACKUPS = int(os.getenv('ROUTER_DECISION_LOG_BACKUPS', 3))
+LOCAL_ROUTER_MIN_CONFIDENCE = float(os.getenv('LOCAL_ROUTER_MIN_CONFIDENCE', 0.85))
+# Nearest-chunk similarity costs one embedding call per query.
+LOCAL_ROUTER_USE_SIMILARITY = os.getenv('LOCAL_ROUTER_USE_SIMILARITY', 'False') == 'True'
+
+# Run history loads concurrently and start RAG retrieval speculatively alongside routing.
+RESPONSE_CONCURRENT_STAGES = os.getenv('RESPONSE_CONCURRENT_STAGES', 'False') == 'True'
+RESPONSE_STAGE_WORKERS = int(os.getenv('RESPONSE_STAGE_WORKERS', 16))
+# Identical concurrent queries that do not depend on chat history (first messages, RAG answers)
+# share one in-flight router/generation call instead of each calling Gemini.
+REQUEST_COALESCING_ENABLED = os.getenv('REQUEST_COALESCING_ENABLED', 'True') == 'True'
+# Admission control: at most ADMISSION_MAX_CONCURRENT chat turns call Gemini at once per worker.
+# Others wait (follow-ups of existing chats first) in a queue of ADMISSION_QUEUE_SIZE for up to
+# ADMISSION_MAX_WAIT_SECONDS, then get 429 (queue full) / 503 (wait expired) with Retry-After.
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'True') == 'True'
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', 8))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 32))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv('ADMISSION_MAX_WAIT_SECONDS', 5.0))
+# Deadline for one chat request (router + retrieval + generation); stages that would start
+# after it are skipped and the request answers 504. 0 disables it. Every Gemini call also
+# gets a timeout of at most GEMINI_REQUEST_TIMEOUT_SECONDS, deadline or not.
+CHAT_REQUEST_DEADLINE_SECONDS = float(os.getenv('CHAT_REQUEST_DEADLINE_SECONDS', 45))
+GEMINI_REQUEST_TIMEOUT_SECONDS = float(os.getenv('GEMINI_REQUEST_TIMEOUT_SECONDS', 60))
+# Hedged LLM router calls: when the router call is still running after the observed
+# ROUTER_HEDGE_PERCENTILE latency (once ROUTER_HEDGE_MIN_SAMPLES calls were seen), a second
+# identical call is sent and the first answer wins; roughly (1 - percentile) extra router calls.
+ROUTER_HEDGING_ENABLED = os.getenv('ROUTER_HEDGING_ENABLED', 'False') == 'True'
+ROUTER_HEDGE_PERCENTILE = float(os.getenv('ROUTER_HEDGE_PERCENTILE', 0.95))
+ROUTER_HEDGE_MIN_SAMPLES = int(os.getenv('ROUTER_HEDGE_MIN_SAMPLES', 20))
+# Circuit breakers for gemini, embeddings, chroma and mongo: after CIRCUIT_BREAKER_FAILURE_THRESHOLD
+# consecutive failures calls to that dependency fail immediately (degraded mode: no RAG, no
+# history, queued writes, 503 for the model) until a probe after CIRCUIT_BREAKER_RESET_SECONDS succeeds.
+CIRCUIT_BREAKER_ENABLED = os.getenv('CIRCUIT_BREAKER_ENABLED', 'True') == 'True'
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5))
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv('CIRCUIT_BREAKER_RESET_SECONDS', 30))
+
+RAG_RETRIEVAL_K = int(os.getenv('RAG_RETRIEVAL_K', 5))
+# 'chroma' queries the Chroma collection; 'mmap' does exact search over the float32 matrix
+# exported by build_rag_index, shared by all worker processes through the page cache.
+RAG_RETRIEVER_BACKEND = os.getenv('RAG_RETRIEVER_BACKEND', 'chroma')
+# Hybrid retrieval: BM25 over the lexical index written by build_rag_index, fused with the
+# vector hits by reciprocal rank fusion. Falls back to vector-only when the index is missing.
+RAG_HYBRID_SEARCH_ENABLED = os.getenv('RAG_HYBRID_SEARCH_ENABLED', 'True') == 'True'
+RAG_HYBRID_CANDIDATES = int(os.getenv('RAG_HYBRID_CANDIDATES', 20))
+RAG_RRF_K = int(os.getenv('RAG_RRF_K', 60))
+RAG_LEXICAL_MAX_POSTINGS = int(os.getenv('RAG_LEXICAL_MAX_POSTINGS', 500))
+# Retrieved chunks are merged/de-duplicated and packed into this many (estimated) tokens; 0 = no limit.
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv('RAG_CONTEXT_TOKEN_BUDGET', 2000))
+RAG_CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv('RAG_CONTEXT_DUPLICATE_THRESHOLD', 0.85))
+
+CACHE_DIR = Path(os.getenv('CACHE_DIR', BASE_DIR / 'cache'))
+CHAT_WRITE_BEHIND_DEAD_LETTER_PATH = CACHE_DIR / 'unsaved_chat_messages.jsonl'
+
+# Semantic cache for RAG answers: a near-duplicate query that retrieves the same chunks reuses the answer.
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'True') == 'True'
+ANSWER_CACHE_PATH = CACHE_DIR / 'answer_cache.sqlite3'
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv('ANSWER_CACHE_SIMILARITY_THRESHOLD', 0.95))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv('ANSWER_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 1000))
+
+# Query/chunk embeddings cached in memory (LRU) and on disk, shared by serving and build_rag_index.
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'True') == 'True'
+EMBEDDING_CACHE_PATH = CACHE_DIR / 'embeddings.sqlite3'
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv('EMBEDDING_CACHE_MEMORY_SIZE', 4096))
+
 Path(LOCAL_DOCUMENTS_PATH).mkdir(parents=True, exist_ok=True)
 Path(VECTORSTORE_PATH).mkdir(parents=True, exist_ok=True)
 
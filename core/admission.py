@@ -0,0 +1,205 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+# Lower values are admitted first.
+PRIORITY_CONVERSATION = 0  # a follow-up turn of an existing chat
+PRIORITY_NEW_CHAT = 1
+PRIORITY_BACKGROUND = 2  # housekeeping (summaries); only ever takes an idle slot, never queues
+
+
+class AdmissionRejected(Exception):
+    """A request that was not admitted. `status` is the HTTP status to answer with (429 or 503)."""
+
+    def __init__(self, reason: str, retry_after: int, status: int = 503):
+        super().__init__(f"Request not admitted ({reason}); retry after {retry_after}s.")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+
+
+class AdmissionTicket:
+    """A held slot. `release` is idempotent, so several cleanup paths may call it."""
+
+    def __init__(self, controller: "AdmissionController", priority: int, waited: float = 0.0):
+        self._controller = controller
+        self.priority = priority
+        self.waited = waited
+        self.admitted_at = time.monotonic()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Caps how many requests do model work at once. A request that finds every slot taken
+    waits in a bounded priority queue (lowest priority value first, FIFO within a priority)
+    for at most `max_wait` seconds. When the queue is full, a newcomer displaces the newest
+    waiter of a lower priority or is rejected at once (429); a waiter whose deadline passes
+    is rejected with 503. Both carry a Retry-After estimate derived from the average slot
+    hold time. Works from threads (`acquire`) and event loops (`aacquire`) alike: waiters
+    are concurrent.futures.Future objects that `release` hands the slot to directly.
+    """
+
+    def __init__(self, max_concurrent: int, queue_size: int, max_wait: float, on_change=None):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.queue_size = max(0, int(queue_size))
+        self.max_wait = max_wait
+        self.on_change = on_change
+        self._active = 0
+        self._waiters = []  # heap of [priority, seq, future, enqueued_at]
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._avg_hold_seconds = None
+        self._stats = {"admitted": 0, "enqueued": 0, "queue_full": 0, "evicted": 0, "timeout": 0}
+
+    # --- Acquiring ---
+
+    def acquire(self, priority: int = PRIORITY_NEW_CHAT, timeout: float = None) -> AdmissionTicket:
+        """Blocks until a slot is free. Raises AdmissionRejected if the queue is full or the wait times out."""
+        ticket, waiter = self._enter(priority)
+        if ticket is not None:
+            return ticket
+        try:
+            return waiter[2].result(timeout=self.max_wait if timeout is None else timeout)
+        except FutureTimeoutError:
+            return self._give_up(waiter)
+
+    async def aacquire(self, priority: int = PRIORITY_NEW_CHAT, timeout: float = None) -> AdmissionTicket:
+        """Async counterpart of acquire; the event loop keeps running while the request waits."""
+        ticket, waiter = self._enter(priority)
+        if ticket is not None:
+            return ticket
+        try:
+            # shield: wait_for must not cancel the shared future, _give_up decides its fate.
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter[2])),
+                                          self.max_wait if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            return self._give_up(waiter)
+        except asyncio.CancelledError:
+            ticket = self._withdraw(waiter)
+            if ticket is not None:
+                ticket.release()
+            raise
+
+    def try_acquire(self, priority: int = PRIORITY_BACKGROUND):
+        """A slot if one is idle and nobody is waiting for it, else None. Never queues."""
+        with self._lock:
+            if self._active >= self.max_concurrent or self._waiters:
+                return None
+            self._active += 1
+            self._stats["admitted"] += 1
+        self._notify()
+        return AdmissionTicket(self, priority)
+
+    def _enter(self, priority: int):
+        """(ticket, None) when admitted at once, (None, waiter) when queued; raises when rejected."""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                self._stats["admitted"] += 1
+                ticket = AdmissionTicket(self, priority)
+            else:
+                ticket = None
+                if len(self._waiters) >= self.queue_size:
+                    evicted = self._lowest_priority_waiter()
+                    if evicted is None or evicted[0] <= priority:
+                        self._stats["queue_full"] += 1
+                        raise AdmissionRejected("queue_full", self._retry_after_locked(), status=429)
+                    self._remove_waiter(evicted)
+                    self._stats["evicted"] += 1
+                    evicted[2].set_exception(AdmissionRejected("evicted", self._retry_after_locked(), status=429))
+                waiter = [priority, next(self._seq), Future(), time.monotonic()]
+                heapq.heappush(self._waiters, waiter)
+                self._stats["enqueued"] += 1
+        self._notify()
+        return (ticket, None) if ticket is not None else (None, waiter)
+
+    def _withdraw(self, waiter: list):
+        """Takes a waiter out of the queue. Returns its ticket if a slot was handed to it meanwhile."""
+        with self._lock:
+            if waiter[2].done():
+                ticket = None if waiter[2].exception() else waiter[2].result()
+            else:
+                self._remove_waiter(waiter)
+                ticket = None
+        self._notify()
+        return ticket
+
+    def _give_up(self, waiter: list) -> AdmissionTicket:
+        ticket = self._withdraw(waiter)
+        if ticket is not None:
+            return ticket
+        if waiter[2].done():
+            raise waiter[2].exception()
+        with self._lock:
+            self._stats["timeout"] += 1
+            retry_after = self._retry_after_locked()
+        raise AdmissionRejected("timeout", retry_after, status=503)
+
+    # --- Releasing ---
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        held = time.monotonic() - ticket.admitted_at
+        with self._lock:
+            self._avg_hold_seconds = held if self._avg_hold_seconds is None else 0.9 * self._avg_hold_seconds + 0.1 * held
+            if self._waiters:
+                # Hand the slot straight to the next waiter; _active stays the same.
+                priority, _, future, enqueued_at = heapq.heappop(self._waiters)
+                self._stats["admitted"] += 1
+                future.set_result(AdmissionTicket(self, priority, waited=time.monotonic() - enqueued_at))
+            else:
+                self._active -= 1
+        self._notify()
+
+    # --- Helpers ---
+
+    def _lowest_priority_waiter(self):
+        return max(self._waiters, key=lambda waiter: (waiter[0], waiter[1]), default=None)
+
+    def _remove_waiter(self, waiter: list) -> None:
+        self._waiters.remove(waiter)
+        heapq.heapify(self._waiters)
+
+    def _retry_after_locked(self) -> int:
+        """Seconds until a slot is likely free for a request joining the back of the queue."""
+        hold = self._avg_hold_seconds if self._avg_hold_seconds is not None else 1.0
+        return max(1, math.ceil(hold * (len(self._waiters) + 1) / self.max_concurrent))
+
+    def retry_after(self) -> int:
+        with self._lock:
+            return self._retry_after_locked()
+
+    def _notify(self) -> None:
+        if self.on_change is not None:
+            self.on_change(self._active, len(self._waiters))
+
+    def state(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "active": self._active,
+                "queued": len(self._waiters),
+                "queue_size": self.queue_size,
+                "max_wait_seconds": self.max_wait,
+                "avg_hold_seconds": round(self._avg_hold_seconds, 3) if self._avg_hold_seconds is not None else None,
+                "retry_after_seconds": self._retry_after_locked(),
+                **self._stats,
+            }
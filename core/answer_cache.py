@@ -0,0 +1,197 @@
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION_FILENAME = "index_version"
+
+
+def read_index_version(vectorstore_path) -> str:
+    """Returns the version marker written by build_rag_index, or '' if the index predates it."""
+    try:
+        return (Path(vectorstore_path) / INDEX_VERSION_FILENAME).read_text(encoding="utf-8").strip()
+    except OSError:
+        return ""
+
+
+def write_index_version(vectorstore_path) -> str:
+    """Stamps the vector store with a new version so cached answers from older builds are dropped."""
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    path = Path(vectorstore_path) / INDEX_VERSION_FILENAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(version, encoding="utf-8")
+    return version
+
+
+def _normalize(vector) -> array:
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return array("f", (v / norm for v in vector))
+
+
+def _dot(a, b) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+class SemanticAnswerCache:
+    """
+    Caches RAG answers keyed on the query embedding and the retrieved chunk IDs.
+
+    A lookup hits only when an entry has exactly the same set of retrieved chunks and a
+    query embedding with cosine similarity >= similarity_threshold. Entries expire after
+    ttl_seconds, the in-memory layer is LRU-bounded to max_entries, and everything is
+    persisted in SQLite so the cache survives restarts. Entries written against another
+    index version (see write_index_version) are discarded.
+    """
+
+    VERSION_CHECK_INTERVAL = 30.0
+
+    def __init__(self, db_path, vectorstore_path, similarity_threshold: float = 0.95,
+                 ttl_seconds: int = 86400, max_entries: int = 1000):
+        self.db_path = str(db_path)
+        self.vectorstore_path = vectorstore_path
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # entry_id -> entry dict, in LRU order
+        self._by_chunks = {}            # chunk key -> set of entry_ids
+        self._index_version = read_index_version(vectorstore_path)
+        self._last_version_check = time.monotonic()
+
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id TEXT PRIMARY KEY, query TEXT, embedding BLOB, chunk_key TEXT, answer TEXT,"
+            " created_at REAL, last_access REAL, index_version TEXT)"
+        )
+        self._conn.commit()
+        self._load_from_disk()
+
+    @staticmethod
+    def chunk_key(chunk_ids) -> str:
+        return json.dumps(sorted(str(chunk_id) for chunk_id in chunk_ids))
+
+    def _load_from_disk(self) -> None:
+        with self._lock:
+            cutoff = time.time() - self.ttl_seconds
+            self._conn.execute("DELETE FROM answers WHERE created_at < ? OR index_version != ?", (cutoff, self._index_version))
+            rows = self._conn.execute(
+                "SELECT id, embedding, chunk_key, answer, created_at FROM answers ORDER BY last_access DESC LIMIT ?",
+                (self.max_entries,)
+            ).fetchall()
+            self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY last_access DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+            for entry_id, embedding_blob, chunk_key, answer, created_at in reversed(rows):
+                vector = array("f")
+                vector.frombytes(embedding_blob)
+                self._add_entry(entry_id, vector, chunk_key, answer, created_at)
+        logger.info(f"[ANSWER_CACHE] Loaded {len(self._entries)} cached answers from '{self.db_path}'.")
+
+    def _add_entry(self, entry_id, vector, chunk_key, answer, created_at) -> None:
+        self._entries[entry_id] = {"vector": vector, "chunk_key": chunk_key, "answer": answer, "created_at": created_at}
+        self._by_chunks.setdefault(chunk_key, set()).add(entry_id)
+
+    def _remove_entry(self, entry_id) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        ids = self._by_chunks.get(entry["chunk_key"])
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_chunks[entry["chunk_key"]]
+        self._conn.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+
+    def _check_index_version(self) -> None:
+        now = time.monotonic()
+        if now - self._last_version_check < self.VERSION_CHECK_INTERVAL:
+            return
+        self._last_version_check = now
+        current_version = read_index_version(self.vectorstore_path)
+        if current_version != self._index_version:
+            logger.info(f"[ANSWER_CACHE] Index version changed ('{self._index_version}' -> '{current_version}'). Clearing cached answers.")
+            self._index_version = current_version
+            self._entries.clear()
+            self._by_chunks.clear()
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def lookup(self, query_embedding, chunk_ids):
+        """Returns the cached answer for a near-duplicate query over the same chunks, or None."""
+        if not query_embedding or not chunk_ids:
+            return None
+        chunk_key = self.chunk_key(chunk_ids)
+        query_vector = _normalize(query_embedding)
+        with self._lock:
+            self._check_index_version()
+            now = time.time()
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in list(self._by_chunks.get(chunk_key, ())):
+                entry = self._entries[entry_id]
+                if now - entry["created_at"] > self.ttl_seconds:
+                    self._remove_entry(entry_id)
+                    continue
+                score = _dot(query_vector, entry["vector"])
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE id = ?", (now, best_id))
+            self._conn.commit()
+            logger.debug(f"[ANSWER_CACHE] Hit (similarity={best_score:.4f}).")
+            return self._entries[best_id]["answer"]
+
+    def store(self, query: str, query_embedding, chunk_ids, answer: str) -> None:
+        if not query_embedding or not chunk_ids or not answer:
+            return
+        entry_id = uuid.uuid4().hex
+        chunk_key = self.chunk_key(chunk_ids)
+        vector = _normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            self._add_entry(entry_id, vector, chunk_key, answer, now)
+            self._conn.execute(
+                "INSERT INTO answers (id, query, embedding, chunk_key, answer, created_at, last_access, index_version)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry_id, query, vector.tobytes(), chunk_key, answer, now, now, self._index_version)
+            )
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove_entry(oldest_id)
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    @staticmethod
+    def clear_store(db_path) -> None:
+        """Drops every persisted answer; used by build_rag_index after the collection changes."""
+        if not os.path.exists(db_path):
+            return
+        conn = sqlite3.connect(str(db_path))
+        try:
+            conn.execute("DELETE FROM answers")
+            conn.commit()
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.close()
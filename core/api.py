@@ -1,18 +1,50 @@
+import asyncio
 import json
 import time
 import logging
 import uuid
 import google.generativeai as genai
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
-from . import services
+from django.views.decorators.http import require_GET, require_POST
+from . import metrics, services
+from . import deadlines
+from .admission import AdmissionRejected
+from .deadlines import DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
+
+def _rejected_response(rejection: AdmissionRejected) -> JsonResponse:
+    """Fast 429/503 for a turn that was not admitted, telling the client when to retry."""
+    response = JsonResponse(
+        {"error": "The chatbot is busy right now. Please try again shortly.", "retry_after": rejection.retry_after},
+        status=rejection.status,
+    )
+    response["Retry-After"] = str(rejection.retry_after)
+    return response
+
+
+def _chat_request_fields(data) -> tuple:
+    """(message, chat_id) from a parsed chat request; the message is "" unless the body is an object with a string message."""
+    if not isinstance(data, dict):
+        return "", None
+    message = data.get("message")
+    return (message.strip() if isinstance(message, str) else ""), data.get("chat_id")
+
+
+def _pending_writes_response() -> JsonResponse:
+    """503 for a chat change that has to wait for the chat's queued messages to be saved."""
+    response = JsonResponse({"error": "This chat is still being saved. Please try again shortly."}, status=503)
+    response["Retry-After"] = "1"
+    return response
+
+
 @csrf_exempt
 @require_POST
 def chat_api(request):
+    services.ensure_initialized()
     if services.direct_genai_model is None or services.chat_collection is None or not hasattr(services, 'get_response'):
         core_error = services.initialization_error or "Chat service core components not ready."
         logger.error(f"[CHAT_API|SERVICE_UNAVAILABLE] Chat service unavailable on request: {core_error}")
@@ -26,8 +58,7 @@ def chat_api(request):
 
     try:
         data = json.loads(request.body)
-        user_message = data.get("message", "").strip()
-        chat_id = data.get("chat_id")
+        user_message, chat_id = _chat_request_fields(data)
         log_chat_id_str = chat_id if chat_id else "NEW_CHAT"
 
         if not user_message:
@@ -40,6 +71,14 @@ def chat_api(request):
         else:
             logger.info(f"[CHAT_API|{chat_id}] Request START (Existing Chat)")
 
+        # The request deadline starts before the admission wait, so it bounds the whole request.
+        with deadlines.deadline_scope(settings.CHAT_REQUEST_DEADLINE_SECONDS):
+            request_deadline = deadlines.current_deadline()
+            try:
+                admission_ticket = services.admit_turn(log_chat_id_str, is_new_chat)
+            except AdmissionRejected as e:
+                return _rejected_response(e)
+
         try:
             if is_new_chat:
                 chat_id = str(uuid.uuid4())
@@ -49,7 +88,12 @@ def chat_api(request):
             logger.info(f"[CHAT_API|{log_chat_id_str}] Processing query: '{user_message[:60]}...'")
             response_start_time = time.time()
 
-            response_text = services.get_response(user_message, chat_id)
+            try:
+                with deadlines.deadline_scope(deadline=request_deadline):
+                    response_text = services.get_response(user_message, chat_id)
+            finally:
+                if admission_ticket is not None:
+                    admission_ticket.release()
 
             response_end_time = time.time()
             logger.info(f"[CHAT_API|{log_chat_id_str}] -> Response generation successful, took: {response_end_time - response_start_time:.4f} seconds")
@@ -62,6 +106,14 @@ def chat_api(request):
              logger.debug(f"Safety block details: {e}")
              status_code = 200
 
+        except AdmissionRejected as e:
+             return _rejected_response(e)
+
+        except DeadlineExceeded as e:
+             logger.warning(f"[CHAT_API|{log_chat_id_str}] {e}")
+             response_text = "BOT: Sorry, this request took too long to answer. Please try again."
+             status_code = 504
+
         except ConnectionError as e:
              logger.error(f"[CHAT_API|{log_chat_id_str}] Service layer connection/processing error: {e}")
              response_text = f"BOT: Sorry, I encountered an issue processing your request. Please try again later. ({e})"
@@ -104,9 +156,209 @@ def chat_api(request):
         return JsonResponse({"error": "An unexpected server error occurred."}, status=500)
 
 
+@csrf_exempt
+@require_POST
+async def chat_api_async(request):
+    """Native async variant of chat_api for ASGI deployments; same request/response contract."""
+    await asyncio.to_thread(services.ensure_initialized)
+    if services.direct_genai_model is None or services.chat_collection is None or not hasattr(services, 'aget_response'):
+        core_error = services.initialization_error or "Chat service core components not ready."
+        logger.error(f"[CHAT_API_ASYNC|SERVICE_UNAVAILABLE] Chat service unavailable on request: {core_error}")
+        return JsonResponse({"error": f"Chatbot is currently unavailable. Please try again later."}, status=503)
+
+    request_start_time = time.time()
+    chat_id = None
+
+    try:
+        data = json.loads(request.body)
+        user_message, chat_id = _chat_request_fields(data)
+
+        if not user_message:
+            logger.warning(f"[CHAT_API_ASYNC|{chat_id or 'NEW_CHAT'}] Received empty message.")
+            return JsonResponse({"error": "Message cannot be empty"}, status=400)
+
+        is_new_chat = not chat_id
+        if is_new_chat:
+            chat_id = str(uuid.uuid4())
+            logger.info(f"[CHAT_API_ASYNC|{chat_id}] Request START (New chat ID generated)")
+        else:
+            logger.info(f"[CHAT_API_ASYNC|{chat_id}] Request START (Existing Chat)")
+
+        with deadlines.deadline_scope(settings.CHAT_REQUEST_DEADLINE_SECONDS):
+            request_deadline = deadlines.current_deadline()
+            try:
+                admission_ticket = await services.aadmit_turn(chat_id, is_new_chat)
+            except AdmissionRejected as e:
+                return _rejected_response(e)
+
+        try:
+            try:
+                with deadlines.deadline_scope(deadline=request_deadline):
+                    response_text = await services.aget_response(user_message, chat_id)
+            finally:
+                if admission_ticket is not None:
+                    admission_ticket.release()
+            status_code = 200
+        except AdmissionRejected as e:
+            return _rejected_response(e)
+        except DeadlineExceeded as e:
+            logger.warning(f"[CHAT_API_ASYNC|{chat_id}] {e}")
+            response_text = "BOT: Sorry, this request took too long to answer. Please try again."
+            status_code = 504
+        except genai.types.StopCandidateException as e:
+            logger.warning(f"[CHAT_API_ASYNC|{chat_id}] Response blocked by safety filter: {e}")
+            response_text = f"BOT: My safety filters blocked the response. Reason: {e}"
+            status_code = 200
+        except ConnectionError as e:
+            logger.error(f"[CHAT_API_ASYNC|{chat_id}] Service layer connection/processing error: {e}")
+            response_text = f"BOT: Sorry, I encountered an issue processing your request. Please try again later. ({e})"
+            status_code = 503
+        except Exception as e:
+            logger.error(f"[CHAT_API_ASYNC|{chat_id}] Unexpected error getting response: {e}", exc_info=True)
+            response_text = f"BOT: Sorry, an unexpected internal error occurred ({type(e).__name__})."
+            status_code = 500
+
+        if status_code < 400 and response_text and not response_text.startswith("BOT: "):
+            await services.asave_chat_messages(chat_id, user_message, response_text)
+            logger.debug(f"[CHAT_API_ASYNC|{chat_id}] -> Saved user message and bot response.")
+        else:
+            logger.info(f"[CHAT_API_ASYNC|{chat_id}] Skipping save. Status Code: {status_code}")
+
+        logger.info(f"[CHAT_API_ASYNC|{chat_id}] Request END. Total time: {time.time() - request_start_time:.4f} seconds. Status: {status_code}")
+
+        response_data = {"response": response_text or "Error: No response generated."}
+        if is_new_chat and status_code < 400:
+            response_data["new_chat_id"] = chat_id
+        return JsonResponse(response_data, status=status_code)
+
+    except json.JSONDecodeError:
+        logger.warning("[CHAT_API_ASYNC|BAD_REQUEST] Invalid JSON received", exc_info=True)
+        return JsonResponse({"error": "Invalid JSON format"}, status=400)
+    except Exception as e:
+        logger.error(f"[CHAT_API_ASYNC|{chat_id or 'UNKNOWN'}] Unhandled exception in outer scope: {e}", exc_info=True)
+        return JsonResponse({"error": "An unexpected server error occurred."}, status=500)
+
+
+def _sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class _ReleasingStream:
+    """
+    Streaming body that also releases the admission ticket when Django closes the response:
+    a generator closed before its first iteration never runs its finally block.
+    """
+
+    def __init__(self, generator, admission_ticket):
+        self._generator = generator
+        self._admission_ticket = admission_ticket
+
+    def __iter__(self):
+        return self._generator
+
+    def close(self):
+        self._generator.close()
+        if self._admission_ticket is not None:
+            self._admission_ticket.release()
+
+
+@csrf_exempt
+@require_POST
+def chat_stream_api(request):
+    """Server-sent events variant of chat_api: streams the answer as Gemini generates it."""
+    services.ensure_initialized()
+    if services.direct_genai_model is None or services.chat_collection is None or not hasattr(services, 'stream_response'):
+        core_error = services.initialization_error or "Chat service core components not ready."
+        logger.error(f"[CHAT_STREAM_API|SERVICE_UNAVAILABLE] Chat service unavailable on request: {core_error}")
+        return JsonResponse({"error": f"Chatbot is currently unavailable. Please try again later."}, status=503)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        logger.warning("[CHAT_STREAM_API|BAD_REQUEST] Invalid JSON received", exc_info=True)
+        return JsonResponse({"error": "Invalid JSON format"}, status=400)
+
+    user_message, chat_id = _chat_request_fields(data)
+    if not user_message:
+        logger.warning(f"[CHAT_STREAM_API|{chat_id or 'NEW_CHAT'}] Received empty message.")
+        return JsonResponse({"error": "Message cannot be empty"}, status=400)
+
+    is_new_chat = not chat_id
+    if is_new_chat:
+        chat_id = str(uuid.uuid4())
+        logger.info(f"[CHAT_STREAM_API|{chat_id}] Request START (New chat ID generated)")
+    else:
+        logger.info(f"[CHAT_STREAM_API|{chat_id}] Request START (Existing Chat)")
+
+    # Admission happens before the response starts, so a rejection is still a plain 429/503.
+    with deadlines.deadline_scope(settings.CHAT_REQUEST_DEADLINE_SECONDS):
+        request_deadline = deadlines.current_deadline()
+        try:
+            admission_ticket = services.admit_turn(chat_id, is_new_chat)
+        except AdmissionRejected as e:
+            return _rejected_response(e)
+
+    def event_stream():
+        request_start_time = time.time()
+        first_chunk_time = None
+        response_parts = []
+        yield _sse_event("meta", {"chat_id": chat_id, "new_chat": is_new_chat})
+
+        try:
+            with deadlines.deadline_scope(deadline=request_deadline):
+                for chunk in services.stream_response(user_message, chat_id):
+                    if first_chunk_time is None:
+                        first_chunk_time = time.time()
+                        logger.info(f"[CHAT_STREAM_API|{chat_id}] -> First chunk after {first_chunk_time - request_start_time:.4f} seconds")
+                    response_parts.append(chunk)
+                    yield _sse_event("chunk", {"text": chunk})
+        except AdmissionRejected as e:
+            yield _sse_event("error", {"error": "The chatbot is busy right now. Please try again shortly.", "retry_after": e.retry_after})
+            return
+        except DeadlineExceeded as e:
+            logger.warning(f"[CHAT_STREAM_API|{chat_id}] {e}")
+            yield _sse_event("error", {"error": "Sorry, this request took too long to answer. Please try again."})
+            return
+        except services.StreamFailed as e:
+            # The client keeps whatever was already shown, but nothing of this turn is saved.
+            yield _sse_event("error", {"error": str(e)})
+            return
+        except ConnectionError as e:
+            logger.error(f"[CHAT_STREAM_API|{chat_id}] Service layer connection/processing error: {e}")
+            yield _sse_event("error", {"error": f"Sorry, I encountered an issue processing your request. Please try again later. ({e})"})
+            return
+        except Exception as e:
+            logger.error(f"[CHAT_STREAM_API|{chat_id}] Unexpected error while streaming: {e}", exc_info=True)
+            yield _sse_event("error", {"error": f"Sorry, an unexpected internal error occurred ({type(e).__name__})."})
+            return
+        finally:
+            if admission_ticket is not None:
+                admission_ticket.release()
+
+        response_text = "".join(response_parts)
+        if response_text:
+            services.save_chat_messages(chat_id, user_message, response_text)
+            logger.debug(f"[CHAT_STREAM_API|{chat_id}] -> Saved user message and streamed bot response.")
+        else:
+            logger.info(f"[CHAT_STREAM_API|{chat_id}] Skipping save for empty streamed response.")
+
+        total_api_time = time.time() - request_start_time
+        logger.info(f"[CHAT_STREAM_API|{chat_id}] Request END. Total time: {total_api_time:.4f} seconds.")
+        done_payload = {"chat_id": chat_id}
+        if is_new_chat:
+            done_payload["new_chat_id"] = chat_id
+        yield _sse_event("done", done_payload)
+
+    response = StreamingHttpResponse(_ReleasingStream(event_stream(), admission_ticket), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 @csrf_exempt
 @require_POST
 def update_chat_title_api(request):
+    services.ensure_initialized()
     if services.chat_collection is None:
         db_error = services.initialization_error or "Database service not ready."
         logger.error(f"[TITLE_API|SERVICE_UNAVAILABLE] Update title failed: {db_error}")
@@ -136,6 +388,9 @@ def update_chat_title_api(request):
     except json.JSONDecodeError:
         logger.warning(f"[TITLE_API|{chat_id or 'UNKNOWN'}] Invalid JSON received.", exc_info=True)
         return JsonResponse({"error": "Invalid JSON format."}, status=400)
+    except services.PendingWritesError as e:
+        logger.warning(f"[TITLE_API|{chat_id}] {e}")
+        return _pending_writes_response()
     except Exception as e:
         logger.error(f"[TITLE_API|{chat_id or 'UNKNOWN'}] Unhandled exception: {e}", exc_info=True)
         return JsonResponse({"error": "An internal server error occurred."}, status=500)
@@ -144,6 +399,7 @@ def update_chat_title_api(request):
 @csrf_exempt
 @require_POST
 def delete_chat_api(request):
+    services.ensure_initialized()
     if services.chat_collection is None:
         db_error = services.initialization_error or "Database service not ready."
         logger.error(f"[DELETE_API|SERVICE_UNAVAILABLE] Delete chat failed: {db_error}")
@@ -167,6 +423,84 @@ def delete_chat_api(request):
     except json.JSONDecodeError:
         logger.warning(f"[DELETE_API|{chat_id or 'UNKNOWN'}] Invalid JSON received.", exc_info=True)
         return JsonResponse({"error": "Invalid JSON format."}, status=400)
+    except services.PendingWritesError as e:
+        logger.warning(f"[DELETE_API|{chat_id}] {e}")
+        return _pending_writes_response()
     except Exception as e:
         logger.error(f"[DELETE_API|{chat_id or 'UNKNOWN'}] Unhandled exception: {e}", exc_info=True)
-        return JsonResponse({"error": "An internal server error occurred during deletion."}, status=500)
\ No newline at end of file
+        return JsonResponse({"error": "An internal server error occurred during deletion."}, status=500)
+
+
+@require_GET
+def chat_list_api(request):
+    services.ensure_initialized()
+    if services.chat_collection is None:
+        db_error = services.initialization_error or "Database service not ready."
+        logger.error(f"[CHAT_LIST_API|SERVICE_UNAVAILABLE] Chat list failed: {db_error}")
+        return JsonResponse({"error": f"Service unavailable: {db_error}"}, status=503)
+
+    cursor = request.GET.get('cursor') or None
+    try:
+        limit = int(request.GET.get('limit', services.CHAT_LIST_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "'limit' must be an integer."}, status=400)
+    limit = max(1, min(limit, 100))
+
+    try:
+        chats, next_cursor = services.get_chat_list_page(limit=limit, cursor=cursor)
+    except ValueError as e:
+        logger.warning(f"[CHAT_LIST_API] Bad cursor: {e}")
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+    logger.debug(f"[CHAT_LIST_API] Returned {len(chats)} chats (more={next_cursor is not None}).")
+    return JsonResponse({"chats": chats, "next_cursor": next_cursor})
+
+
+@require_GET
+def chat_history_api(request):
+    services.ensure_initialized()
+    if services.chat_collection is None:
+        db_error = services.initialization_error or "Database service not ready."
+        logger.error(f"[HISTORY_API|SERVICE_UNAVAILABLE] History page failed: {db_error}")
+        return JsonResponse({"error": f"Service unavailable: {db_error}"}, status=503)
+
+    chat_id = request.GET.get('chat_id')
+    before = request.GET.get('before') or None
+    if not chat_id:
+        logger.warning("[HISTORY_API|NO_CHAT_ID] Request missing chat_id.")
+        return JsonResponse({"error": "'chat_id' is required."}, status=400)
+    try:
+        limit = int(request.GET.get('limit', services.HISTORY_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "'limit' must be an integer."}, status=400)
+    limit = max(1, min(limit, 100))
+
+    try:
+        raw_messages, next_cursor = services.load_chat_history_page(chat_id, before=before, limit=limit)
+    except ValueError as e:
+        logger.warning(f"[HISTORY_API|{chat_id}] Bad cursor: {e}")
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    messages = []
+    for msg in raw_messages:
+        role = msg.get("role")
+        content = msg.get("content")
+        if role and content is not None:
+            messages.append({"role": role, "parts": [str(content)]})
+    logger.debug(f"[HISTORY_API|{chat_id}] Returned {len(messages)} messages (more={next_cursor is not None}).")
+    return JsonResponse({"messages": messages, "next_cursor": next_cursor})
+
+
+def healthz(request):
+    """Liveness: the worker is up. Always 200, with per-component initialization status."""
+    return JsonResponse({"status": "ok", **services.service_status()})
+
+
+def readyz(request):
+    """Readiness: 200 only once every service component is initialized, so load balancers skip cold workers."""
+    status = services.service_status()
+    return JsonResponse(status, status=200 if status["ready"] else 503)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint with per-stage latency histograms and turn/fallback/safety counters."""
+    return HttpResponse(metrics.render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
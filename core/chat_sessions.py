@@ -0,0 +1,144 @@
+import base64
+import json
+from datetime import datetime
+
+import pymongo
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+
+# Session summary documents, one per chat:
+#   {chat_id, title, custom_title, created_at, last_activity, message_count}
+# `title` is derived from the first message; `custom_title` is set by the user and wins.
+
+
+def ensure_session_indexes(sessions_collection) -> None:
+    sessions_collection.create_index([("chat_id", pymongo.ASCENDING)], unique=True, background=True)
+    sessions_collection.create_index([("last_activity", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)], background=True)
+
+
+def derive_session_title(chat_id: str, first_role, first_content, first_timestamp, max_len: int) -> str:
+    """Sidebar title from the chat's first message (same rules the chat list has always used)."""
+    title = None
+    first_content = str(first_content or "").strip()
+    if first_role == 'user' and first_content:
+        title = first_content[:max_len] + ('...' if len(first_content) > max_len else '')
+    elif first_role == 'model' and first_content:
+        prefix = "Bot: "
+        available_len = max_len - len(prefix)
+        if available_len > 0:
+            title = prefix + first_content[:available_len] + ('...' if len(first_content) > available_len else '')
+        else:
+            title = first_content[:max_len] + ('...' if len(first_content) > max_len else '')
+
+    if not title:
+        title = f"Chat {chat_id[:6]}..."
+        if first_timestamp and isinstance(first_timestamp, datetime):
+            try:
+                title = first_timestamp.strftime("Chat %b %d, %H:%M")
+            except ValueError:
+                pass
+    return title
+
+
+def session_display_title(session: dict) -> str:
+    chat_id = session.get("chat_id", "")
+    return session.get("custom_title") or session.get("title") or f"Chat {chat_id[:6]}..."
+
+
+def mongo_timestamp(value: datetime) -> datetime:
+    """`value` truncated to the millisecond precision BSON dates store, so in-memory and stored copies compare equal."""
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def encode_keyset_cursor(sort_value, object_id) -> str:
+    """Opaque keyset cursor for a (datetime, _id) position, as used by the chat list and history pages."""
+    payload = {
+        "t": sort_value.isoformat() if isinstance(sort_value, datetime) else None,
+        "id": str(object_id),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_keyset_cursor(cursor: str) -> tuple:
+    """Returns (datetime or None, ObjectId) from a cursor; raises ValueError if it is malformed."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        sort_value = datetime.fromisoformat(payload["t"]) if payload.get("t") else None
+        return sort_value, ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+
+
+def encode_session_cursor(session: dict) -> str:
+    """Cursor pointing just after the given session document in the chat list."""
+    return encode_keyset_cursor(session.get("last_activity"), session["_id"])
+
+
+def session_page_filter(position: tuple) -> dict:
+    """Sessions strictly after `position` in (last_activity desc, _id desc) order."""
+    last_activity, object_id = position
+    if last_activity is None:
+        # Sessions without last_activity sort last; only _id orders them.
+        return {"last_activity": None, "_id": {"$lt": object_id}}
+    return {"$or": [
+        {"last_activity": {"$lt": last_activity}},
+        {"last_activity": last_activity, "_id": {"$lt": object_id}},
+        {"last_activity": None},
+    ]}
+
+
+def session_update_for_messages(chat_id: str, message_docs: list, max_title_len: int, message_count: int = None) -> dict:
+    """
+    Upsert update that records newly saved messages on the chat's session document. With
+    `message_count` (a recount of the chat's messages) the count is raised to it instead of
+    incremented, which makes re-applying the update harmless.
+    """
+    first_doc = message_docs[0]
+    update = {
+        "$setOnInsert": {
+            "chat_id": chat_id,
+            "title": derive_session_title(chat_id, first_doc["role"], first_doc["content"], first_doc["timestamp"], max_title_len),
+            "created_at": first_doc["timestamp"],
+        },
+        "$max": {"last_activity": max(doc["timestamp"] for doc in message_docs)},
+    }
+    if message_count is None:
+        update["$inc"] = {"message_count": len(message_docs)}
+    else:
+        update["$max"]["message_count"] = message_count
+    return update
+
+
+def backfill_session_operations(chat_collection, max_title_len: int):
+    """
+    Yields one UpdateOne per chat in the message collection, rebuilding its session document.
+    This is the one-off full scan that get_chat_list used to run on every page load.
+    """
+    pipeline = [
+        {"$sort": {"timestamp": pymongo.ASCENDING}},
+        {"$group": {
+            "_id": "$chat_id",
+            "first_doc": {"$first": "$$ROOT"},
+            "latest_ts": {"$last": "$timestamp"},
+            "message_count": {"$sum": 1},
+            "custom_title": {"$max": "$custom_title"},
+        }},
+    ]
+    for chat_data in chat_collection.aggregate(pipeline, allowDiskUse=True):
+        chat_id = chat_data.get("_id")
+        if not chat_id:
+            continue
+        first_doc = chat_data.get("first_doc") or {}
+        fields = {
+            "chat_id": chat_id,
+            "title": derive_session_title(chat_id, first_doc.get("role"), first_doc.get("content"),
+                                          first_doc.get("timestamp"), max_title_len),
+            "created_at": first_doc.get("timestamp"),
+            "last_activity": chat_data.get("latest_ts"),
+            "message_count": chat_data.get("message_count", 0),
+        }
+        custom_title = first_doc.get("custom_title") or chat_data.get("custom_title")
+        if custom_title:
+            fields["custom_title"] = custom_title
+        yield UpdateOne({"chat_id": chat_id}, {"$set": fields}, upsert=True)
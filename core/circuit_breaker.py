@@ -0,0 +1,167 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"{dependency} is unavailable (circuit open); next probe in {retry_after:.1f}s.")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one dependency. After `failure_threshold` failures
+    in a row the circuit opens and calls fail at once with CircuitOpenError. After
+    `reset_timeout` seconds it turns half-open and lets `half_open_max_calls` probe calls
+    through: a success closes it, a failure re-opens it for another reset_timeout.
+
+    Only exceptions in `failure_exceptions` count as failures, and `ignored_exceptions`
+    never do (e.g. a safety block means the model answered). Any other outcome counts as a
+    success, since the dependency responded. `on_state_change(name, old, new)` is called
+    outside the lock on every transition.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_max_calls: int = 1, failure_exceptions=(Exception,), ignored_exceptions=(),
+                 on_state_change=None):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.failure_exceptions = tuple(failure_exceptions)
+        self.ignored_exceptions = tuple(ignored_exceptions)
+        self.on_state_change = on_state_change
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_started_at = 0.0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    # --- State ---
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; in half-open state this takes a probe slot."""
+        transition = None
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN:
+                if now < self._opened_at + self.reset_timeout:
+                    self._rejected += 1
+                    return False
+                transition = self._set_state(HALF_OPEN)
+                self._probes = 0
+            if self._state == HALF_OPEN:
+                # A probe that never reported back (e.g. its thread died) must not wedge the circuit.
+                if self._probes >= self.half_open_max_calls and now - self._probe_started_at < self.reset_timeout:
+                    self._rejected += 1
+                    allowed = False
+                else:
+                    if self._probes >= self.half_open_max_calls:
+                        self._probes = 0
+                    self._probes += 1
+                    self._probe_started_at = now
+                    allowed = True
+            else:
+                allowed = True
+        self._notify(transition)
+        return allowed
+
+    def is_open(self) -> bool:
+        """True while calls are being refused outright (open and not yet due for a probe)."""
+        with self._lock:
+            return self._state == OPEN and time.monotonic() < self._opened_at + self.reset_timeout
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed (0 unless open)."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probes = max(0, self._probes - 1)
+            transition = self._set_state(CLOSED) if self._state != CLOSED else None
+        self._notify(transition)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probes = max(0, self._probes - 1)
+            transition = None
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self._state != OPEN:
+                    transition = self._set_state(OPEN)
+        self._notify(transition)
+
+    def _release_probe(self) -> None:
+        with self._lock:
+            self._probes = max(0, self._probes - 1)
+
+    def _set_state(self, state: str) -> tuple:
+        previous, self._state = self._state, state
+        return previous, state
+
+    def _notify(self, transition) -> None:
+        if transition is not None and self.on_state_change is not None:
+            self.on_state_change(self.name, *transition)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "rejected": self._rejected,
+                "retry_after_seconds": round(max(0.0, self._opened_at + self.reset_timeout - time.monotonic()), 1)
+                if self._state == OPEN else 0.0,
+            }
+
+    # --- Guarded calls ---
+
+    def _reject(self):
+        return CircuitOpenError(self.name, self.retry_after())
+
+    def _record_error(self, error: BaseException) -> None:
+        if isinstance(error, self.ignored_exceptions):
+            self.record_success()
+        elif isinstance(error, self.failure_exceptions):
+            self.record_failure()
+        elif isinstance(error, Exception):
+            self.record_success()
+        else:
+            # Cancellation / interpreter exit: the dependency's health is unknown.
+            self._release_probe()
+
+    def call(self, func, *args, **kwargs):
+        """func(*args, **kwargs) through the breaker; raises CircuitOpenError without calling it when open."""
+        if not self.allow():
+            raise self._reject()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._record_error(e)
+            raise
+        self.record_success()
+        return result
+
+    async def acall(self, coroutine_func, *args, **kwargs):
+        if not self.allow():
+            raise self._reject()
+        try:
+            result = await coroutine_func(*args, **kwargs)
+        except BaseException as e:
+            self._record_error(e)
+            raise
+        self.record_success()
+        return result
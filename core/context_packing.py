@@ -0,0 +1,141 @@
+import math
+import re
+from pathlib import Path
+
+# Gemini tokenizes Vietnamese at roughly 3 characters per token (English is closer to 4);
+# the lower figure keeps the estimate from undercounting on mixed-language documents.
+CHARS_PER_TOKEN = 3.0
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _containment(a: set, b: set) -> float:
+    """Share of a's shingles that also occur in b (a chunk already covered by a longer excerpt scores 1.0)."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a)
+
+
+def _text_overlap(left: str, right: str, min_overlap: int = 30) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right` (0 if under min_overlap)."""
+    for length in range(min(len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+class _Excerpt:
+    """A contiguous span of one source page built from one or more retrieved chunks."""
+
+    # Adjacent chunks are separated by at most the whitespace the splitter stripped.
+    MAX_GAP = 2
+
+    def __init__(self, doc, rank: int):
+        self.source = doc.metadata.get("source", "Unknown Source")
+        self.page = doc.metadata.get("page")
+        self.text = doc.page_content
+        self.start = doc.metadata.get("start_index")
+        self.end = None if self.start is None else self.start + len(self.text)
+        self.rank = rank
+        self.chunk_count = 1
+
+    def merge(self, doc):
+        """(text, start, end) of this excerpt extended by `doc` if the two are adjacent or overlap, else None."""
+        if doc.metadata.get("source", "Unknown Source") != self.source or doc.metadata.get("page") != self.page:
+            return None
+        text, start = doc.page_content, doc.metadata.get("start_index")
+        if self.start is not None and start is not None:
+            end = start + len(text)
+            if start > self.end + self.MAX_GAP or end < self.start - self.MAX_GAP:
+                return None
+            if start >= self.start:
+                if start >= self.end:
+                    merged = self.text + " " + text if start > self.end else self.text + text
+                else:
+                    merged = self.text + text[self.end - start:] if end > self.end else self.text
+            elif self.start >= end:
+                merged = text + " " + self.text if self.start > end else text + self.text
+            else:
+                merged = text + self.text[end - self.start:] if self.end > end else text
+            return merged, min(self.start, start), max(self.end, end)
+        # Chunks indexed before start_index was recorded: stitch on the literal overlap.
+        if text in self.text:
+            return self.text, self.start, self.end
+        overlap = _text_overlap(self.text, text)
+        if overlap:
+            return self.text + text[overlap:], None, None
+        overlap = _text_overlap(text, self.text)
+        if overlap:
+            return text + self.text[overlap:], None, None
+        return None
+
+
+def pack_context(docs: list, token_budget: int = 0, duplicate_threshold: float = 0.85) -> tuple[list, dict]:
+    """
+    Packs retrieved chunks (best first) into excerpts for the RAG prompt.
+
+    Chunks from the same source page that are adjacent or overlap (the splitter repeats
+    RAG_CHUNK_OVERLAP characters) are merged into one excerpt, chunks whose word shingles
+    mostly occur in an already selected excerpt are dropped, and excerpts are added
+    in relevance order until token_budget (estimated tokens, 0 = unlimited) is reached.
+    The first chunk is truncated to the budget rather than dropped, so the prompt always
+    has context. Returns (excerpts, stats); excerpts keep the relevance order of their best chunk.
+    """
+    excerpts = []
+    stats = {"chunks": len(docs), "merged": 0, "duplicates": 0, "over_budget": 0, "tokens": 0}
+    for rank, doc in enumerate(docs):
+        text = doc.page_content or ""
+        if not text.strip():
+            continue
+        merge_target, merged = None, None
+        for excerpt in excerpts:
+            merged = excerpt.merge(doc)
+            if merged is not None:
+                merge_target = excerpt
+                break
+
+        if merge_target is None:
+            shingles = _shingles(text)
+            if any(_containment(shingles, _shingles(excerpt.text)) >= duplicate_threshold for excerpt in excerpts):
+                stats["duplicates"] += 1
+                continue
+            added_tokens = estimate_tokens(text)
+        else:
+            added_tokens = estimate_tokens(merged[0]) - estimate_tokens(merge_target.text)
+
+        if token_budget and stats["tokens"] + added_tokens > token_budget:
+            if excerpts:
+                stats["over_budget"] += 1
+                continue
+            excerpt = _Excerpt(doc, rank)
+            excerpt.text = text[:int(token_budget * CHARS_PER_TOKEN)]
+            excerpt.end = None if excerpt.start is None else excerpt.start + len(excerpt.text)
+            excerpts.append(excerpt)
+            stats["tokens"] = estimate_tokens(excerpt.text)
+            continue
+
+        if merge_target is not None:
+            merge_target.text, merge_target.start, merge_target.end = merged
+            merge_target.chunk_count += 1
+            stats["merged"] += 1
+        else:
+            excerpts.append(_Excerpt(doc, rank))
+        stats["tokens"] += added_tokens
+    return excerpts, stats
+
+
+def format_excerpt_header(excerpt, number: int) -> str:
+    source_name = Path(excerpt.source).name
+    page = f", page {excerpt.page + 1}" if isinstance(excerpt.page, int) else ""
+    return f"--- Context from: {source_name}{page} (Chunk {number}) ---\n"
@@ -0,0 +1,65 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Per-request deadline, carried in a context variable so it follows the request through the
+# router, retrieval and generation stages without changing their signatures. asyncio tasks
+# and asyncio.to_thread inherit it; work handed to a ThreadPoolExecutor must be submitted
+# through contextvars.copy_context().run to see it.
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request deadline passed before (or while) `stage` ran."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded during '{stage}'.")
+        self.stage = stage
+
+
+@contextmanager
+def deadline_scope(seconds: float = None, deadline: float = None):
+    """
+    Sets the request deadline for the enclosed code: `seconds` from now, or the absolute
+    time.monotonic() value `deadline` (e.g. current_deadline() captured by the caller).
+    None or 0 seconds leaves it unchanged. A nested scope only tightens the deadline.
+    """
+    previous = _deadline.get()
+    if deadline is None and seconds and seconds > 0:
+        deadline = time.monotonic() + seconds
+    if deadline is not None:
+        _deadline.set(deadline if previous is None else min(deadline, previous))
+    try:
+        yield
+    finally:
+        # set() rather than reset(token): a streaming generator may be closed from another context.
+        _deadline.set(previous)
+
+
+def current_deadline():
+    """The absolute (time.monotonic()) request deadline, or None."""
+    return _deadline.get()
+
+
+def remaining():
+    """Seconds left until the request deadline (negative once passed), or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check(stage: str) -> None:
+    """Raises DeadlineExceeded if the request deadline has passed; call it before starting a stage."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(stage)
+
+
+def call_timeout(stage: str, cap: float = None):
+    """Timeout for a blocking call in `stage`: the time left, at most `cap`. None means no limit at all."""
+    left = remaining()
+    if left is None:
+        return cap or None
+    if left <= 0:
+        raise DeadlineExceeded(stage)
+    return min(left, cap) if cap else left
@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper with an in-memory LRU layer and an on-disk SQLite layer.
+
+    Keys are a SHA-256 of the model name, the task kind ('query' or 'document', since
+    Gemini embeds them with different task types) and the text, so repeated queries and
+    re-indexed chunks never reach the embedding API.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, db_path=None, memory_size: int = 4096):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self._conn.commit()
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: list) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _get_cached(self, keys: list) -> dict:
+        found = {}
+        with self._lock:
+            disk_keys = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+                else:
+                    disk_keys.append(key)
+            if disk_keys and self._conn is not None:
+                for start in range(0, len(disk_keys), 500):
+                    batch = disk_keys[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        stored = array("f")
+                        stored.frombytes(blob)
+                        vector = stored.tolist()
+                        found[key] = vector
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+        return found
+
+    def _put(self, items: list) -> None:
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+            if self._conn is not None:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, array("f", vector).tobytes()) for key, vector in items]
+                )
+                self._conn.commit()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key("document", text) for text in texts]
+        found = self._get_cached(keys)
+        missing = [(key, text) for key, text in zip(keys, texts) if key not in found]
+        if missing:
+            # Several identical chunks in one batch only need one API embedding.
+            unique_missing = list(dict.fromkeys(missing))
+            with self._lock:
+                self.misses += len(unique_missing)
+            vectors = self.underlying.embed_documents([text for _, text in unique_missing])
+            new_items = [(key, list(vector)) for (key, _), vector in zip(unique_missing, vectors)]
+            self._put(new_items)
+            found.update(new_items)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        key = self._key("query", text)
+        found = self._get_cached([key])
+        if key in found:
+            return found[key]
+        with self._lock:
+            self.misses += 1
+        vector = list(self.underlying.embed_query(text))
+        self._put([(key, vector)])
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / total) if total else 0.0,
+                "memory_entries": len(self._memory),
+            }
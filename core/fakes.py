@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import math
+import random
+import time
+
+# Deterministic stand-ins for the Gemini model and embeddings, used when LLM_BACKEND=fake
+# (load tests, local development without an API key). Outputs and latencies are derived
+# from a hash of the prompt, so the same conversation replays identically.
+
+_VOCABULARY = (
+    "học phần tín chỉ sinh viên quy chế đào tạo điểm đánh giá chương trình môn học giảng viên "
+    "the course credit student regulation training grade assessment program lecturer semester "
+    "thời khóa biểu đăng ký kết quả tốt nghiệp requirement schedule registration result graduation"
+).split()
+
+
+class LatencyDistribution:
+    """
+    A non-negative random quantity parsed from a spec string:
+    'fixed:V', 'uniform:LOW,HIGH', 'normal:MEAN,STDDEV' or 'lognormal:MEDIAN,SIGMA'.
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, spec: str):
+        kind, _, params = str(spec).partition(":")
+        kind = kind.strip().lower()
+        try:
+            values = [float(value) for value in params.split(",") if value.strip()]
+        except ValueError as e:
+            raise ValueError(f"Invalid distribution spec '{spec}': {e}") from e
+        expected = 1 if kind == "fixed" else 2
+        if kind not in self.KINDS or len(values) != expected:
+            raise ValueError(f"Invalid distribution spec '{spec}'; expected one of "
+                             f"fixed:V, uniform:LOW,HIGH, normal:MEAN,STDDEV, lognormal:MEDIAN,SIGMA.")
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.values[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.values)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.values)
+        else:
+            median, sigma = self.values
+            value = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return max(value, 0.0)
+
+
+def _rng_for(*parts) -> random.Random:
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def _prompt_text(contents) -> str:
+    """Flattens a generate_content argument (string or Gemini `contents` list) into text."""
+    if isinstance(contents, str):
+        return contents
+    parts = []
+    for entry in contents or []:
+        if isinstance(entry, dict):
+            parts.extend(str(part) for part in entry.get("parts", []))
+        else:
+            parts.append(str(entry))
+    return "\n".join(parts)
+
+
+def _timeout(request_options):
+    return (request_options or {}).get("timeout")
+
+
+class _FakeCandidate:
+    finish_reason = "STOP"
+    safety_ratings = []
+
+
+class FakeResponse:
+    """Mimics the parts of a google.generativeai response the services layer reads."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.candidates = [_FakeCandidate()]
+        self.prompt_feedback = None
+
+
+class _FakeStream:
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.prompt_feedback = None
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in for genai.GenerativeModel: generate_content (optionally streamed) and
+    generate_content_async. Each call waits a first-token latency, then emits its output
+    tokens at tokens_per_second. Router prompts get a SEARCH_DOCS / GENERAL_CHAT label,
+    SEARCH_DOCS for about rag_fraction of the queries. A call that would outlast
+    request_options["timeout"] waits that long and raises TimeoutError, like a timed-out RPC.
+    """
+
+    def __init__(self, first_token_latency: str = "lognormal:0.5,0.35", output_tokens: str = "uniform:80,400",
+                 tokens_per_second: float = 60.0, rag_fraction: float = 0.6, seed: int = 0):
+        self.first_token_latency = LatencyDistribution(first_token_latency)
+        self.output_tokens = LatencyDistribution(output_tokens)
+        self.tokens_per_second = tokens_per_second
+        self.rag_fraction = rag_fraction
+        self.seed = seed
+        self.model_name = "fake"
+
+    def _plan(self, contents) -> tuple[float, list, float]:
+        """(first-token delay, output tokens, seconds per token) for a prompt."""
+        prompt = _prompt_text(contents)
+        rng = _rng_for(self.seed, prompt)
+        delay = self.first_token_latency.sample(rng)
+        if prompt.rstrip().endswith("Classification:"):
+            query = prompt.rstrip().rsplit("User Query:", 1)[-1]
+            label = "SEARCH_DOCS" if _rng_for(self.seed, "route", query).random() < self.rag_fraction else "GENERAL_CHAT"
+            return delay, [label], 0.0
+        token_count = max(1, int(self.output_tokens.sample(rng)))
+        tokens = [rng.choice(_VOCABULARY) for _ in range(token_count)]
+        per_token = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        return delay, tokens, per_token
+
+    def generate_content(self, contents, stream: bool = False, request_options=None, **kwargs):
+        delay, tokens, per_token = self._plan(contents)
+        timeout = _timeout(request_options)
+        if stream:
+            return _FakeStream(self._stream_chunks(delay, tokens, per_token, timeout))
+        duration = delay + per_token * len(tokens)
+        if timeout is not None and duration > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake model call timed out after {timeout:.2f}s.")
+        time.sleep(duration)
+        return FakeResponse(" ".join(tokens))
+
+    def _stream_chunks(self, delay: float, tokens: list, per_token: float, timeout: float = None, chunk_tokens: int = 8):
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        time.sleep(delay)
+        for start in range(0, len(tokens), chunk_tokens):
+            chunk = tokens[start:start + chunk_tokens]
+            if start:
+                time.sleep(per_token * len(chunk))
+            if expires_at is not None and time.monotonic() > expires_at:
+                raise TimeoutError(f"Fake model stream timed out after {timeout:.2f}s.")
+            yield FakeResponse(("" if start == 0 else " ") + " ".join(chunk))
+
+    async def generate_content_async(self, contents, request_options=None, **kwargs):
+        delay, tokens, per_token = self._plan(contents)
+        timeout = _timeout(request_options)
+        duration = delay + per_token * len(tokens)
+        if timeout is not None and duration > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError(f"Fake model call timed out after {timeout:.2f}s.")
+        await asyncio.sleep(duration)
+        return FakeResponse(" ".join(tokens))
+
+
+class FakeEmbeddings:
+    """
+    Drop-in for GoogleGenerativeAIEmbeddings: unit vectors derived from the text hash (the
+    same text always maps to the same vector), after a sampled latency per call. The default
+    dimension matches text-embedding-004, so an existing Chroma index can still be queried.
+    """
+
+    def __init__(self, dimension: int = 768, latency: str = "lognormal:0.08,0.3", seed: int = 0):
+        self.dimension = dimension
+        self.latency = LatencyDistribution(latency)
+        self.seed = seed
+
+    def _vector(self, text: str) -> list:
+        rng = _rng_for(self.seed, "embedding", text)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimension)]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_query(self, text: str) -> list:
+        time.sleep(self.latency.sample(_rng_for(self.seed, "latency", text)))
+        return self._vector(text)
+
+    def embed_documents(self, texts: list) -> list:
+        if texts:
+            time.sleep(self.latency.sample(_rng_for(self.seed, "latency", len(texts), texts[0])))
+        return [self._vector(text) for text in texts]
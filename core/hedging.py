@@ -0,0 +1,119 @@
+import asyncio
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+
+class LatencyTracker:
+    """Latencies of the last `window` calls, for percentile-based hedge delays."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float):
+        """The `fraction` percentile of the window, or None until min_samples calls were seen."""
+        with self._lock:
+            if len(self._samples) < max(self.min_samples, 1):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class HedgePool:
+    """Bounded thread pool for hedge attempts; a hedge is only sent while a worker is idle."""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "hedge"):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+    def try_submit(self, func):
+        """Runs func() in a copy of the caller's context if a worker is free. Returns its future, or None."""
+        if not self._slots.acquire(blocking=False):
+            return None
+
+        def run():
+            try:
+                return func()
+            finally:
+                self._slots.release()
+
+        try:
+            return self._executor.submit(contextvars.copy_context().run, run)
+        except BaseException:
+            self._slots.release()
+            raise
+
+
+def _start_thread(func, name: str) -> Future:
+    """func() on a new daemon thread, in a copy of the caller's context; never queued behind a pool."""
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(func))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+
+def hedged_call(func, hedge_after: float, pool: HedgePool) -> tuple:
+    """
+    Runs func(); if it has not finished after `hedge_after` seconds, starts a second func()
+    on `pool` and returns whichever succeeds first. The first attempt starts at once on its
+    own thread, so time queued in a saturated pool never counts as slowness, and no hedge is
+    sent while the pool has no idle worker. A sync call cannot be cancelled, so the loser
+    runs to completion in the background (its own timeout bounds it). Raises the first
+    error only if every attempt fails. Returns (result, outcome), outcome being "single",
+    "hedged" or "skipped" (a hedge was due but the pool was busy).
+    """
+    attempts = {_start_thread(func, "hedged-primary")}
+    done, _ = wait(attempts, timeout=hedge_after)
+    outcome = "single"
+    if not done:
+        hedge = pool.try_submit(func)
+        if hedge is None:
+            outcome = "skipped"
+        else:
+            attempts.add(hedge)
+            outcome = "hedged"
+    errors = []
+    while attempts:
+        done, attempts = wait(attempts, return_when=FIRST_COMPLETED)
+        for attempt in done:
+            if attempt.exception() is None:
+                return attempt.result(), outcome
+            errors.append(attempt.exception())
+    raise errors[0]
+
+
+async def ahedged_call(coroutine_func, hedge_after: float) -> tuple:
+    """Async counterpart of hedged_call (outcome "single" or "hedged"); the losing attempt is cancelled."""
+    attempts = {asyncio.ensure_future(coroutine_func())}
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+        outcome = "single" if done else "hedged"
+        if not done:
+            attempts.add(asyncio.ensure_future(coroutine_func()))
+        errors = []
+        while attempts:
+            done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result(), outcome
+                errors.append(attempt.exception())
+        raise errors[0]
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
@@ -0,0 +1,107 @@
+import logging
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class ChatHistoryCache:
+    """
+    Keeps the most recent `capacity` messages of each chat in a Django cache.
+
+    One MongoDB read fills an entry, after which any history limit up to `capacity`
+    (or any limit at all, when the chat is shorter than `capacity`) is served from
+    memory. save_chat_messages appends to the entry (write-through) and
+    delete_session_history drops it. With the default locmem backend each worker process
+    has its own copy, so `ttl_seconds` bounds how stale a chat can look from a worker that
+    did not handle its last turn; point the cache alias at a shared backend (e.g. Redis)
+    to avoid that entirely.
+
+    The chat's rolling-summary fields are cached next to its history under their own key
+    (None is cached too, for chats without a summary), so a turn needs no MongoDB read
+    for either; update_conversation_summary drops that key when it writes a new summary.
+    """
+
+    def __init__(self, cache_alias: str, capacity: int, ttl_seconds: int = 300):
+        self.cache = caches[cache_alias]
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(chat_id: str) -> str:
+        return f"chat_history:{chat_id}"
+
+    @staticmethod
+    def _summary_key(chat_id: str) -> str:
+        return f"chat_summary:{chat_id}"
+
+    def _serve(self, entry, limit: int):
+        if entry is None or (limit > self.capacity and not entry["complete"]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(entry["messages"][-limit:]) if limit > 0 else []
+
+    def _entry(self, messages: list) -> dict:
+        """Entry for the newest messages of a chat, given at most `capacity` of them from the DB."""
+        return {"messages": list(messages[-self.capacity:]), "complete": len(messages) < self.capacity}
+
+    def _appended(self, entry: dict, new_messages: list) -> dict:
+        messages = entry["messages"] + list(new_messages)
+        return {
+            "messages": messages[-self.capacity:],
+            "complete": entry["complete"] and len(messages) <= self.capacity,
+        }
+
+    def get(self, chat_id: str, limit: int):
+        """Cached history (oldest first) for the given limit, or None if it has to come from the DB."""
+        return self._serve(self.cache.get(self._key(chat_id)), limit)
+
+    def fill(self, chat_id: str, messages: list) -> None:
+        self.cache.set(self._key(chat_id), self._entry(messages), self.ttl_seconds)
+
+    def append(self, chat_id: str, new_messages: list) -> None:
+        """Write-through for saved messages; chats that are not cached stay uncached."""
+        key = self._key(chat_id)
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.cache.set(key, self._appended(entry, new_messages), self.ttl_seconds)
+
+    def invalidate(self, chat_id: str) -> None:
+        self.cache.delete_many([self._key(chat_id), self._summary_key(chat_id)])
+
+    def get_summary(self, chat_id: str) -> tuple:
+        """(True, summary fields or None) when cached, (False, None) when it has to come from the DB."""
+        entry = self.cache.get(self._summary_key(chat_id))
+        return (True, entry["summary"]) if entry is not None else (False, None)
+
+    def set_summary(self, chat_id: str, summary) -> None:
+        self.cache.set(self._summary_key(chat_id), {"summary": summary}, self.ttl_seconds)
+
+    def invalidate_summary(self, chat_id: str) -> None:
+        self.cache.delete(self._summary_key(chat_id))
+
+    async def aget(self, chat_id: str, limit: int):
+        return self._serve(await self.cache.aget(self._key(chat_id)), limit)
+
+    async def afill(self, chat_id: str, messages: list) -> None:
+        await self.cache.aset(self._key(chat_id), self._entry(messages), self.ttl_seconds)
+
+    async def aappend(self, chat_id: str, new_messages: list) -> None:
+        key = self._key(chat_id)
+        entry = await self.cache.aget(key)
+        if entry is not None:
+            await self.cache.aset(key, self._appended(entry, new_messages), self.ttl_seconds)
+
+    async def aget_summary(self, chat_id: str) -> tuple:
+        entry = await self.cache.aget(self._summary_key(chat_id))
+        return (True, entry["summary"]) if entry is not None else (False, None)
+
+    async def aset_summary(self, chat_id: str, summary) -> None:
+        await self.cache.aset(self._summary_key(chat_id), {"summary": summary}, self.ttl_seconds)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": (self.hits / total) if total else 0.0}
@@ -0,0 +1,121 @@
+from datetime import datetime
+
+from .context_packing import CHARS_PER_TOKEN, estimate_tokens
+
+# Rolling conversation summaries. The session document of a chat carries
+#   {summary, summary_until, summary_message_id, summary_updated_at}
+# where (summary_until, summary_message_id) is the (timestamp, _id) of the last message
+# folded into the summary. Prompts use the summary plus the messages after that position,
+# trimmed to a token ceiling, instead of the raw last CHAT_HISTORY_LIMIT messages.
+
+SUMMARY_FIELDS = {"summary": 1, "summary_until": 1, "summary_message_id": 1}
+
+# Messages longer than this are cut before being sent to the summarizer.
+MAX_SUMMARIZED_MESSAGE_CHARS = 4000
+# At most this many messages are folded per update; long backlogs catch up over later turns.
+MAX_MESSAGES_PER_UPDATE = 40
+
+SUMMARY_PROMPT_TEMPLATE = """You maintain a running summary of a conversation between a user and an assistant.
+Update the summary with the new messages below. Keep the facts, names, numbers, decisions and open questions the
+assistant will need to continue the conversation; drop greetings and repetition. Write at most {max_words} words,
+in the same language the conversation is held in. Return only the summary.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{messages}
+
+UPDATED SUMMARY:"""
+
+
+def summary_position(session: dict):
+    """(timestamp, _id) of the last summarized message, or None if the chat has no summary yet."""
+    if not session or session.get("summary_message_id") is None:
+        return None
+    return session.get("summary_until"), session["summary_message_id"]
+
+
+def messages_after_filter(position) -> dict:
+    """Mongo filter for messages strictly after `position` in (timestamp, _id) order."""
+    if position is None:
+        return {}
+    timestamp, object_id = position
+    return {"$or": [{"timestamp": {"$gt": timestamp}}, {"timestamp": timestamp, "_id": {"$gt": object_id}}]}
+
+
+def _millis(value):
+    # MongoDB keeps milliseconds; an in-memory copy of the same message may still carry microseconds.
+    if isinstance(value, datetime):
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+def _is_after(message: dict, position) -> bool:
+    if position is None or message.get("_id") is None:
+        return True
+    timestamp, summary_timestamp = _millis(message.get("timestamp")), _millis(position[0])
+    if timestamp is None or summary_timestamp is None or timestamp == summary_timestamp:
+        return message["_id"] > position[1]
+    return timestamp > summary_timestamp
+
+
+def messages_to_fold(pending: list, keep_recent: int, min_batch: int) -> list:
+    """
+    The oldest unsummarized messages that should be folded into the summary now: everything
+    but the last `keep_recent`, once at least `min_batch` messages have accumulated.
+    """
+    foldable = pending[:-keep_recent] if keep_recent > 0 else pending
+    return foldable if len(foldable) >= max(min_batch, 1) else []
+
+
+def build_summary_prompt(previous_summary: str, messages: list, max_words: int) -> str:
+    lines = []
+    for message in messages:
+        content = str(message.get("content", "")).strip()
+        if len(content) > MAX_SUMMARIZED_MESSAGE_CHARS:
+            content = content[:MAX_SUMMARIZED_MESSAGE_CHARS] + "..."
+        lines.append(f"{message.get('role', 'unknown')}: {content}")
+    return SUMMARY_PROMPT_TEMPLATE.format(
+        max_words=max_words,
+        summary=previous_summary or "(none yet)",
+        messages="\n".join(lines),
+    )
+
+
+def summary_context_messages(summary: str) -> list:
+    """
+    The summary as a leading user/model exchange: Gemini `contents` carry no system role
+    (prompt_value_to_genai_history drops SystemMessages), so it travels as conversation.
+    """
+    return [
+        {"role": "user", "content": f"Summary of our conversation so far:\n{summary}"},
+        {"role": "model", "content": "Understood, I will continue the conversation with that context."},
+    ]
+
+
+def compact_history(messages: list, session: dict, token_ceiling: int) -> list:
+    """
+    Chat history for the prompt: the rolling summary (if any) plus the newest messages not
+    yet folded into it, dropping older ones so the whole stays under token_ceiling. The
+    newest message is truncated rather than dropped. Messages are plain history dicts.
+    """
+    summary = (session or {}).get("summary") or ""
+    position = summary_position(session)
+    head = summary_context_messages(summary) if summary else []
+    remaining = token_ceiling - sum(estimate_tokens(message["content"]) for message in head) if token_ceiling else None
+
+    recent = []
+    for message in reversed([message for message in messages if _is_after(message, position)]):
+        content = str(message.get("content", "")).strip()
+        tokens = estimate_tokens(content)
+        if remaining is not None and tokens > remaining:
+            if recent or remaining <= 0:
+                break
+            message = {**message, "content": "..." + content[-int(remaining * CHARS_PER_TOKEN):]}
+            tokens = remaining
+        recent.append(message)
+        if remaining is not None:
+            remaining -= tokens
+    recent.reverse()
+    return head + recent
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+from langchain_community.document_loaders import Docx2txtLoader, PyMuPDFLoader
+from langchain.docstore.document import Document
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "index_manifest.json"
+SUPPORTED_LOADERS = {
+    ".pdf": PyMuPDFLoader,
+    ".docx": Docx2txtLoader,
+}
+
+
+def discover_source_files(docs_path) -> list[Path]:
+    """All supported documents under docs_path, in a stable order."""
+    root = Path(docs_path)
+    return sorted(
+        (path for path in root.rglob("*") if path.is_file() and path.suffix.lower() in SUPPORTED_LOADERS),
+        key=lambda path: path.relative_to(root).as_posix(),
+    )
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source_file:
+        for block in iter(lambda: source_file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_source_file(path) -> list[Document]:
+    """Parses one PDF/DOCX file. Metadata 'source' is the bare file name, as the RAG prompt expects."""
+    path = Path(path)
+    loader_cls = SUPPORTED_LOADERS[path.suffix.lower()]
+    docs = loader_cls(str(path)).load()
+    for doc in docs:
+        doc.metadata['source'] = path.name
+    return docs
+
+
+def parse_source_file(path):
+    """
+    Process-pool entry point: parses one file and returns (path, docs, elapsed_seconds, error).
+    Exceptions are returned as text rather than raised so one bad file does not abort the map.
+    """
+    started_at = time.perf_counter()
+    try:
+        docs = load_source_file(path)
+        return path, docs, time.perf_counter() - started_at, None
+    except Exception as e:
+        return path, [], time.perf_counter() - started_at, f"{type(e).__name__}: {e}"
+
+
+def chunk_ids_for(rel_path: str, file_hash: str, chunk_count: int) -> list[str]:
+    """
+    Deterministic chunk IDs, so re-indexing the same file content upserts instead of duplicating.
+    The relative path is part of the key: two files with identical content must not share IDs,
+    or deleting one copy would delete the other's vectors.
+    """
+    file_key = hashlib.sha256(f"{rel_path}\0{file_hash}".encode("utf-8")).hexdigest()
+    return [f"{file_key[:16]}-{i:05d}" for i in range(chunk_count)]
+
+
+def load_manifest(vectorstore_path) -> dict:
+    """Manifest format: {"files": {relative_path: {"sha256": ..., "chunk_ids": [...]}}}."""
+    path = Path(vectorstore_path) / MANIFEST_FILENAME
+    if not path.exists():
+        return {"files": {}}
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+        manifest.setdefault("files", {})
+        return manifest
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Index manifest at '{path}' is unreadable ({e}); treating the index as empty.")
+        return {"files": {}}
+
+
+def save_manifest(vectorstore_path, manifest: dict) -> None:
+    path = Path(vectorstore_path) / MANIFEST_FILENAME
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+CHECKPOINT_FILENAME = "index_build_checkpoint.json"
+
+
+def load_checkpoint(vectorstore_path) -> dict:
+    path = Path(vectorstore_path) / CHECKPOINT_FILENAME
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Build checkpoint at '{path}' is unreadable ({e}); starting from scratch.")
+        return {}
+
+
+def save_checkpoint(vectorstore_path, checkpoint: dict) -> None:
+    path = Path(vectorstore_path) / CHECKPOINT_FILENAME
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(checkpoint), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def clear_checkpoint(vectorstore_path) -> None:
+    path = Path(vectorstore_path) / CHECKPOINT_FILENAME
+    if path.exists():
+        path.unlink()
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available."""
+
+    def __init__(self, rate_per_second: float, capacity: float = None):
+        self.rate = rate_per_second
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_second)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_seconds = (tokens - self._tokens) / self.rate
+            time.sleep(wait_seconds)
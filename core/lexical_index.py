@@ -0,0 +1,194 @@
+import base64
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILENAME = "lexical_index.json.gz"
+
+# Syllables, numbers and codes; keeps "15/2023/tt-bgdđt", "1.2" or "mat101" in one piece.
+_TOKEN_RE = re.compile(r"\w+(?:[./-]\w+)*")
+
+
+def fold_accents(text: str) -> str:
+    """'Điều khoản' -> 'dieu khoan', so queries typed without diacritics still match."""
+    decomposed = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+def tokenize_vi(text: str) -> list[str]:
+    """
+    Vietnamese-aware terms: NFC-normalized lowercase syllables, syllable bigrams (most
+    Vietnamese words are two syllables, e.g. 'học phần'), and the accent-folded form of
+    each when it differs. Compound codes are also indexed by their parts.
+    """
+    syllables = []
+    code_parts = []
+    for token in _TOKEN_RE.findall(unicodedata.normalize("NFC", text).lower()):
+        syllables.append(token)
+        if not token.isalnum():
+            code_parts.extend(part for part in re.split(r"[./-]", token) if part)
+
+    terms = []
+    for i, syllable in enumerate(syllables):
+        terms.append(syllable)
+        if i + 1 < len(syllables):
+            terms.append(f"{syllable}_{syllables[i + 1]}")
+    terms.extend(code_parts)
+    folded = [fold_accents(term) for term in terms]
+    terms.extend(term for term, original in zip(folded, terms) if term != original)
+    return terms
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk texts, keyed by the Chroma chunk IDs.
+
+    Each posting stores its precomputed BM25 contribution ("impact"), and every term's
+    postings are kept in descending impact order in two flat arrays. A query only sums
+    impacts, reading at most `max_postings_per_term` postings per term: very common terms
+    have tiny impacts, so the cut-off bounds query time with no visible effect on ranking.
+    On disk the arrays are stored as raw bytes inside a gzipped JSON file.
+    """
+
+    def __init__(self, chunk_ids: list, terms: dict, doc_numbers: array, impacts: array,
+                 max_postings_per_term: int = 500):
+        self.chunk_ids = chunk_ids
+        self.terms = terms                # term -> (offset, length) into the arrays below
+        self.doc_numbers = doc_numbers    # array('I')
+        self.impacts = impacts            # array('f')
+        self.max_postings_per_term = max_postings_per_term
+
+    @classmethod
+    def build(cls, chunk_ids: list, texts: list, k1: float = 1.5, b: float = 0.75) -> "LexicalIndex":
+        term_postings = {}
+        doc_lengths = []
+        for doc_number, text in enumerate(texts):
+            term_counts = Counter(tokenize_vi(text or ""))
+            doc_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                term_postings.setdefault(term, []).append((doc_number, count))
+
+        n_docs = len(doc_lengths)
+        avg_length = (sum(doc_lengths) / n_docs) if n_docs else 0.0
+        norms = [k1 * (1 - b + b * (length / avg_length)) if avg_length else k1 for length in doc_lengths]
+        terms, doc_numbers, impacts = {}, array("I"), array("f")
+        for term, postings in term_postings.items():
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            scored = sorted(
+                ((doc_number, idf * count * (k1 + 1) / (count + norms[doc_number])) for doc_number, count in postings),
+                key=lambda posting: posting[1],
+                reverse=True,
+            )
+            terms[term] = (len(doc_numbers), len(scored))
+            doc_numbers.extend(doc_number for doc_number, _ in scored)
+            impacts.extend(impact for _, impact in scored)
+        return cls(list(chunk_ids), terms, doc_numbers, impacts)
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """Top-k (chunk_id, bm25 score) pairs for the query, best first."""
+        scores = {}
+        for term in set(tokenize_vi(query)):
+            location = self.terms.get(term)
+            if location is None:
+                continue
+            offset, length = location
+            end = offset + min(length, self.max_postings_per_term)
+            for doc_number, impact in zip(self.doc_numbers[offset:end], self.impacts[offset:end]):
+                scores[doc_number] = scores.get(doc_number, 0.0) + impact
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.chunk_ids[doc_number], score) for doc_number, score in best]
+
+    def save(self, path) -> None:
+        payload = {
+            "version": 2,
+            "chunk_ids": self.chunk_ids,
+            "terms": self.terms,
+            "doc_numbers": base64.b64encode(self.doc_numbers.tobytes()).decode("ascii"),
+            "impacts": base64.b64encode(self.impacts.tobytes()).decode("ascii"),
+        }
+        path = Path(path)
+        tmp_path = path.with_suffix(".tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as index_file:
+            json.dump(payload, index_file, ensure_ascii=False, separators=(",", ":"))
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path, max_postings_per_term: int = 500) -> "LexicalIndex":
+        with gzip.open(path, "rt", encoding="utf-8") as index_file:
+            payload = json.load(index_file)
+        if payload.get("version") != 2:
+            raise ValueError(f"Unsupported lexical index version {payload.get('version')}; rebuild the index.")
+        doc_numbers, impacts = array("I"), array("f")
+        doc_numbers.frombytes(base64.b64decode(payload["doc_numbers"]))
+        impacts.frombytes(base64.b64decode(payload["impacts"]))
+        terms = {term: tuple(location) for term, location in payload["terms"].items()}
+        return cls(payload["chunk_ids"], terms, doc_numbers, impacts, max_postings_per_term=max_postings_per_term)
+
+
+class LexicalIndexHandle:
+    """Loads the index file and transparently reloads it after build_rag_index rewrites it."""
+
+    RELOAD_CHECK_INTERVAL = 30.0
+
+    def __init__(self, path, max_postings_per_term: int = 500):
+        self.path = str(path)
+        self.max_postings_per_term = max_postings_per_term
+        self._index = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._reload_if_changed(force=True)
+
+    def _reload_if_changed(self, force: bool = False) -> None:
+        # Only claiming the check and swapping the index hold the lock; the stat and the
+        # (multi-second) load run outside it, so searches keep using the current index meanwhile.
+        now = time.monotonic()
+        if not force and now - self._last_check < self.RELOAD_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if not force and now - self._last_check < self.RELOAD_CHECK_INTERVAL:
+                return
+            self._last_check = now
+            loaded_mtime = self._mtime
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            with self._lock:
+                self._index, self._mtime = None, None
+            return
+        if mtime == loaded_mtime:
+            return
+        try:
+            started_at = time.perf_counter()
+            index = LexicalIndex.load(self.path, max_postings_per_term=self.max_postings_per_term)
+        except Exception as e:
+            logger.error(f"[RAG] Failed to load lexical index '{self.path}': {e}", exc_info=True)
+            return
+        with self._lock:
+            self._index, self._mtime = index, mtime
+        logger.info(f"[RAG] Lexical index loaded from '{self.path}' ({len(index.chunk_ids)} chunks, "
+                    f"{len(index.terms)} terms) in {time.perf_counter() - started_at:.2f}s.")
+
+    def get(self):
+        self._reload_if_changed()
+        return self._index
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> list[str]:
+    """Fuses several best-first lists of IDs; each ID scores sum(1 / (k + rank))."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
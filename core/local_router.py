@@ -0,0 +1,210 @@
+import json
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DOCS = "SEARCH_DOCS"
+GENERAL_CHAT = "GENERAL_CHAT"
+ROUTE_LABELS = (SEARCH_DOCS, GENERAL_CHAT)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_log_lock = threading.Lock()
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens plus adjacent-word bigrams (Vietnamese words are often two syllables)."""
+    normalized = unicodedata.normalize("NFC", str(text or "")).lower()
+    words = _TOKEN_RE.findall(normalized)
+    bigrams = [f"{a}_{b}" for a, b in zip(words, words[1:])]
+    return words + bigrams
+
+
+class NaiveBayesRouterModel:
+    """Multinomial naive Bayes over query tokens, small enough to load in every worker."""
+
+    def __init__(self, class_counts: dict, token_counts: dict, alpha: float = 1.0):
+        self.class_counts = {label: int(class_counts.get(label, 0)) for label in ROUTE_LABELS}
+        self.token_counts = {label: dict(token_counts.get(label, {})) for label in ROUTE_LABELS}
+        self.alpha = alpha
+        self.vocab_size = len(set().union(*(counts.keys() for counts in self.token_counts.values()))) or 1
+        self.total_tokens = {label: sum(counts.values()) for label, counts in self.token_counts.items()}
+
+    @classmethod
+    def train(cls, samples, alpha: float = 1.0) -> "NaiveBayesRouterModel":
+        class_counts = Counter()
+        token_counts = {label: Counter() for label in ROUTE_LABELS}
+        for query, label in samples:
+            if label not in ROUTE_LABELS:
+                continue
+            class_counts[label] += 1
+            token_counts[label].update(tokenize(query))
+        return cls(class_counts, token_counts, alpha=alpha)
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.class_counts.values())
+
+    def predict_proba(self, query: str) -> dict:
+        tokens = tokenize(query)
+        total_samples = self.sample_count
+        log_scores = {}
+        for label in ROUTE_LABELS:
+            prior = (self.class_counts[label] + self.alpha) / (total_samples + self.alpha * len(ROUTE_LABELS))
+            score = math.log(prior)
+            denominator = self.total_tokens[label] + self.alpha * self.vocab_size
+            label_counts = self.token_counts[label]
+            for token in tokens:
+                score += math.log((label_counts.get(token, 0) + self.alpha) / denominator)
+            log_scores[label] = score
+        max_score = max(log_scores.values())
+        exp_scores = {label: math.exp(score - max_score) for label, score in log_scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+    def to_dict(self) -> dict:
+        return {
+            "version": 1,
+            "alpha": self.alpha,
+            "class_counts": self.class_counts,
+            "token_counts": self.token_counts,
+            "trained_at": datetime.utcnow().isoformat(),
+        }
+
+    def save(self, path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(self.to_dict(), ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path) -> "NaiveBayesRouterModel":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(data.get("class_counts", {}), data.get("token_counts", {}), alpha=data.get("alpha", 1.0))
+
+
+class LocalRouter:
+    """
+    Decides SEARCH_DOCS vs GENERAL_CHAT without an LLM call. Combines the lexical model's
+    posterior with (optionally) the relevance score of the nearest vector-store chunk, and
+    returns no decision when the combined confidence is below min_confidence.
+    """
+
+    def __init__(self, model: NaiveBayesRouterModel = None, min_confidence: float = 0.85,
+                 similarity_fn=None, similarity_low: float = 0.3, similarity_high: float = 0.7,
+                 similarity_weight: float = 0.5):
+        self.model = model
+        self.min_confidence = min_confidence
+        self.similarity_fn = similarity_fn
+        self.similarity_low = similarity_low
+        self.similarity_high = similarity_high
+        self.similarity_weight = similarity_weight if model is not None else 1.0
+
+    def _similarity_probability(self, query: str):
+        try:
+            score = self.similarity_fn(query)
+        except Exception as e:
+            logger.warning(f"[LOCAL_ROUTER] Nearest-chunk similarity lookup failed: {e}")
+            return None
+        if score is None:
+            return None
+        span = max(self.similarity_high - self.similarity_low, 1e-6)
+        return min(1.0, max(0.0, (score - self.similarity_low) / span))
+
+    def classify(self, query: str) -> tuple:
+        """Returns (decision or None, confidence in [0.5, 1])."""
+        p_search_parts = []
+        if self.model is not None and self.model.sample_count > 0:
+            p_search_parts.append((1.0 - self.similarity_weight, self.model.predict_proba(query)[SEARCH_DOCS]))
+        if self.similarity_fn is not None:
+            p_sim = self._similarity_probability(query)
+            if p_sim is not None:
+                p_search_parts.append((self.similarity_weight, p_sim))
+        if not p_search_parts:
+            return None, 0.0
+
+        total_weight = sum(weight for weight, _ in p_search_parts) or 1.0
+        p_search = sum(weight * p for weight, p in p_search_parts) / total_weight
+        decision = SEARCH_DOCS if p_search >= 0.5 else GENERAL_CHAT
+        confidence = max(p_search, 1.0 - p_search)
+        if confidence < self.min_confidence:
+            return None, confidence
+        return decision, confidence
+
+
+def _backup_path(path: Path, number: int) -> Path:
+    return path.with_name(f"{path.name}.{number}")
+
+
+def _rotate_log(path: Path, backups: int) -> None:
+    """routing_decisions.jsonl -> .1 -> .2 ... keeping `backups` old files (none: the log is dropped)."""
+    if backups <= 0:
+        path.unlink()
+        return
+    for number in range(backups - 1, 0, -1):
+        if _backup_path(path, number).exists():
+            _backup_path(path, number).replace(_backup_path(path, number + 1))
+    path.replace(_backup_path(path, 1))
+
+
+def log_routing_decision(log_path, query: str, decision: str, source: str, confidence: float = None,
+                         max_bytes: int = 0, backups: int = 0) -> None:
+    """
+    Appends one routing decision to the JSONL log used by train_local_router. With `max_bytes`
+    the log is rotated once it reaches that size, keeping `backups` older files.
+    """
+    record = {
+        "ts": datetime.utcnow().isoformat(),
+        "query": query,
+        "decision": decision,
+        "source": source,
+    }
+    if confidence is not None:
+        record["confidence"] = round(confidence, 4)
+    try:
+        path = Path(log_path)
+        with _log_lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if max_bytes > 0 and path.exists() and path.stat().st_size >= max_bytes:
+                _rotate_log(path, backups)
+            with path.open("a", encoding="utf-8") as log_file:
+                log_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        logger.warning(f"[LOCAL_ROUTER] Could not write routing decision log: {e}")
+
+
+def routing_log_files(log_path) -> list:
+    """The routing log and its rotated backups that exist on disk, oldest first."""
+    path = Path(log_path)
+    backups = []
+    for candidate in path.parent.glob(f"{path.name}.*"):
+        suffix = candidate.name[len(path.name) + 1:]
+        if suffix.isdigit():
+            backups.append((int(suffix), candidate))
+    files = [candidate for _, candidate in sorted(backups, reverse=True)]
+    return files + [path] if path.exists() else files
+
+
+def read_routing_log(log_path, sources=("llm", "manual")) -> list:
+    """
+    Reads (query, decision) pairs from the routing log and its rotated backups, oldest first,
+    keeping only the given label sources.
+    """
+    samples = []
+    for path in routing_log_files(log_path):
+        with path.open(encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("source") in sources and record.get("decision") in ROUTE_LABELS and record.get("query"):
+                    samples.append((record["query"], record["decision"]))
+    return samples
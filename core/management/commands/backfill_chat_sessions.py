@@ -0,0 +1,56 @@
+import logging
+import pymongo
+from pymongo.errors import PyMongoError
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from core.chat_sessions import backfill_session_operations, ensure_session_indexes
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Builds the chat_sessions summary collection from the existing chat messages (one-off migration; safe to re-run).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Session upserts sent per bulk_write (default: 500).')
+
+    def handle(self, *args, **options) -> None:
+        # --- 1. Connect ---
+        if not settings.MONGO_URI or not settings.MONGO_DB_NAME or not settings.MONGO_COLLECTION_NAME:
+            self.stderr.write(self.style.ERROR("MongoDB configuration missing in settings."))
+            return
+        try:
+            client = pymongo.MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=5000, tls=settings.MONGO_TLS)
+            client.server_info()
+        except PyMongoError as e:
+            self.stderr.write(self.style.ERROR(f"Failed to connect to MongoDB: {e}"))
+            return
+        db = client[settings.MONGO_DB_NAME]
+        chat_collection = db[settings.MONGO_COLLECTION_NAME]
+        sessions_collection = db[settings.MONGO_SESSIONS_COLLECTION_NAME]
+
+        # --- 2. Rebuild Session Documents ---
+        self.stdout.write(f"Backfilling '{settings.MONGO_SESSIONS_COLLECTION_NAME}' from '{settings.MONGO_COLLECTION_NAME}'...")
+        try:
+            ensure_session_indexes(sessions_collection)
+            batch, written = [], 0
+            for operation in backfill_session_operations(chat_collection, settings.CHAT_TITLE_MAX_LENGTH):
+                batch.append(operation)
+                if len(batch) >= options['batch_size']:
+                    sessions_collection.bulk_write(batch, ordered=False)
+                    written += len(batch)
+                    batch = []
+                    self.stdout.write(f" -> {written} sessions written...")
+            if batch:
+                sessions_collection.bulk_write(batch, ordered=False)
+                written += len(batch)
+        except PyMongoError as e:
+            self.stderr.write(self.style.ERROR(f"Backfill failed: {e}"))
+            logger.error("chat_sessions backfill failed", exc_info=True)
+            return
+        finally:
+            client.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {written} chat sessions."))
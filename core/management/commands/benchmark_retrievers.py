@@ -0,0 +1,165 @@
+import multiprocessing
+import queue
+import resource
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+import numpy as np
+
+from core.vector_index import MmapVectorIndex
+
+
+def _memory_usage_mb() -> dict:
+    """Current RSS split into anonymous (private) and file-backed (shareable page cache) memory, in MB."""
+    usage = {}
+    try:
+        with open("/proc/self/status", encoding="ascii") as status_file:
+            for line in status_file:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile"):
+                    usage[key] = int(value.split()[0]) / 1024
+    except OSError:
+        # Not Linux: only the peak RSS is available (kB on Linux, bytes on macOS; treated as kB).
+        usage["VmRSS"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return usage
+
+
+def _run_backend(backend: str, vectorstore_path: str, queries, k: int, result_queue) -> None:
+    """Runs in a fresh process so each backend's load time and memory are measured in isolation."""
+    try:
+        baseline = _memory_usage_mb()
+        started_at = time.perf_counter()
+        if backend == "mmap":
+            index = MmapVectorIndex.load(vectorstore_path)
+
+            def search(query):
+                return [index.chunk_ids[row] for row, _ in index.search(query, k)]
+        else:
+            try:
+                from langchain_chroma import Chroma
+            except ImportError:
+                from langchain_community.vectorstores import Chroma
+            collection = Chroma(persist_directory=vectorstore_path)._collection
+            collection.count()
+
+            def search(query):
+                return collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0]
+        load_seconds = time.perf_counter() - started_at
+        after_load = _memory_usage_mb()
+
+        latencies, results = [], []
+        for query in queries:
+            query_started_at = time.perf_counter()
+            results.append(search(query))
+            latencies.append(time.perf_counter() - query_started_at)
+        result_queue.put({
+            "backend": backend,
+            "load_seconds": load_seconds,
+            "latencies": latencies,
+            "results": results,
+            "baseline": baseline,
+            "after_load": after_load,
+            "after_queries": _memory_usage_mb(),
+        })
+    except Exception as e:
+        result_queue.put({"backend": backend, "error": f"{type(e).__name__}: {e}"})
+
+
+def _wait_for_report(process, result_queue, backend: str, timeout: float) -> dict:
+    """The child's report, or an error report if it dies without one (e.g. killed for memory) or overruns `timeout`."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return result_queue.get(timeout=1.0)
+        except queue.Empty:
+            pass
+        if process.exitcode is not None:
+            try:
+                # The report may still be in the pipe when the child exits right after putting it.
+                return result_queue.get(timeout=1.0)
+            except queue.Empty:
+                return {"backend": backend, "error": f"process exited with code {process.exitcode} without a report"}
+        if time.monotonic() >= deadline:
+            process.terminate()
+            return {"backend": backend, "error": f"no report within {timeout:.0f}s; process terminated"}
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ('Compares the Chroma and memory-mapped (mmap) retriever backends on load time, query latency, '
+            'memory and recall. Queries are perturbed copies of stored chunk embeddings, so no API calls are made.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Number of benchmark queries (default: 200).')
+        parser.add_argument('-k', type=int, default=settings.RAG_RETRIEVAL_K,
+                            help='Neighbours per query (default: RAG_RETRIEVAL_K).')
+        parser.add_argument('--noise', type=float, default=0.05,
+                            help='Relative Gaussian noise added to each sampled embedding (default: 0.05).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--timeout', type=float, default=600.0,
+                            help='Seconds to wait for each backend process before giving up on it (default: 600).')
+
+    def handle(self, *args, **options) -> None:
+        vectorstore_path = str(settings.VECTORSTORE_PATH)
+        k = options['k']
+
+        # --- 1. Sample Queries ---
+        try:
+            index = MmapVectorIndex.load(vectorstore_path)
+        except (OSError, ValueError) as e:
+            self.stderr.write(self.style.ERROR(f"Cannot open the exported vector matrix ({e}). Run build_rag_index first."))
+            return
+        if not len(index):
+            self.stderr.write(self.style.ERROR("The exported vector matrix is empty."))
+            return
+        rng = np.random.default_rng(options['seed'])
+        rows = rng.integers(0, len(index), size=options['queries'])
+        sampled = np.asarray(index.matrix[rows], dtype=np.float32)
+        scale = options['noise'] * np.linalg.norm(sampled, axis=1, keepdims=True) / np.sqrt(sampled.shape[1])
+        queries = sampled + rng.standard_normal(sampled.shape).astype(np.float32) * scale
+        self.stdout.write(f"Benchmarking {len(queries)} queries (k={k}) against {len(index)} vectors of dimension {index.matrix.shape[1]}...")
+        del index, sampled
+
+        # --- 2. Run Each Backend In Its Own Process ---
+        context = multiprocessing.get_context("spawn")
+        reports = {}
+        for backend in ("chroma", "mmap"):
+            result_queue = context.Queue()
+            process = context.Process(target=_run_backend, args=(backend, vectorstore_path, queries, k, result_queue))
+            process.start()
+            report = _wait_for_report(process, result_queue, backend, options['timeout'])
+            process.join()
+            if "error" in report:
+                self.stderr.write(self.style.ERROR(f" -> {backend}: failed: {report['error']}"))
+                continue
+            reports[backend] = report
+
+        # --- 3. Report ---
+        for backend, report in reports.items():
+            latencies_ms = [seconds * 1000 for seconds in report["latencies"]]
+            baseline, after_load, after_queries = report["baseline"], report["after_load"], report["after_queries"]
+            self.stdout.write(self.style.SUCCESS(f"{backend}:"))
+            self.stdout.write(f"   load: {report['load_seconds']:.2f}s")
+            self.stdout.write(
+                f"   latency ms: mean={statistics.mean(latencies_ms):.2f} p50={_percentile(latencies_ms, 0.5):.2f} "
+                f"p95={_percentile(latencies_ms, 0.95):.2f} p99={_percentile(latencies_ms, 0.99):.2f}"
+            )
+            memory_line = f"   RSS MB: +{after_load['VmRSS'] - baseline['VmRSS']:.1f} after load, {after_queries['VmRSS']:.1f} total after queries"
+            if "RssAnon" in after_queries:
+                memory_line += (f" (private {after_queries['RssAnon']:.1f}, "
+                                f"file-backed/shared {after_queries['RssFile']:.1f})")
+            self.stdout.write(memory_line)
+
+        if "chroma" in reports and "mmap" in reports:
+            overlaps = [
+                len(set(approximate) & set(exact)) / max(len(exact), 1)
+                for approximate, exact in zip(reports["chroma"]["results"], reports["mmap"]["results"])
+            ]
+            self.stdout.write(f"Chroma recall@{k} against exact mmap search: {statistics.mean(overlaps):.3f}")
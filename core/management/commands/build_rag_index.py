@@ -1,11 +1,14 @@
+import hashlib
 import os
 import logging
 import re # Import regex for potential cleaning
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 try:
@@ -14,18 +17,66 @@ except ImportError:
     logging.warning("langchain-chroma not found, falling back to Chroma from langchain_community.")
     from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import (
-    Docx2txtLoader,
-    DirectoryLoader,
-    PyMuPDFLoader,
-)
 from langchain.docstore.document import Document
 
+from core.answer_cache import SemanticAnswerCache, write_index_version
+from core.embedding_cache import CachedEmbeddings
+from core.lexical_index import LEXICAL_INDEX_FILENAME, LexicalIndex
+from core.vector_index import export_vector_index
+from core.indexing import (
+    TokenBucket,
+    chunk_ids_for,
+    clear_checkpoint,
+    discover_source_files,
+    file_sha256,
+    load_checkpoint,
+    load_manifest,
+    parse_source_file,
+    save_checkpoint,
+    save_manifest,
+)
+
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
     help = 'Builds or rebuilds the RAG vectorstore index from LOCAL documents using PyMuPDF for PDFs.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only re-index new or changed files and drop vectors of removed files, using the index manifest.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'RAG_PARSE_WORKERS', None) or os.cpu_count() or 1,
+            help='Processes used to parse PDF/DOCX files; 1 parses in this process (default: RAG_PARSE_WORKERS or CPU count).',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted build from its checkpoint, skipping chunks that were already upserted.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'RAG_EMBED_BATCH_SIZE', 64),
+            help='Chunks per embedding request (default: RAG_EMBED_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, 'RAG_EMBED_CONCURRENCY', 4),
+            help='Embedding requests in flight at once (default: RAG_EMBED_CONCURRENCY).',
+        )
+        parser.add_argument(
+            '--requests-per-minute',
+            type=float,
+            default=getattr(settings, 'RAG_EMBED_REQUESTS_PER_MINUTE', 120),
+            help='Rate limit for embedding requests; 0 disables it (default: RAG_EMBED_REQUESTS_PER_MINUTE).',
+        )
+
     def _validate_settings(self) -> None:
         """Checks if required settings are configured."""
         required_settings = [
@@ -45,121 +96,136 @@ class Command(BaseCommand):
             )
         self.stdout.write(self.style.HTTP_INFO("Required settings validated."))
 
-    def _load_local_docs(self, docs_path: str) -> List[Document]:
-        """Loads PDF (using PyMuPDF) and DOCX documents recursively."""
-        all_docs: List[Document] = []
-        processed_pdf_sources: set[str] = set()
-        processed_docx_sources: set[str] = set() # Separate set for DOCX sources
-
-        path_obj = Path(docs_path)
-
-        if not path_obj.is_dir():
-            self.stderr.write(self.style.ERROR(f"Local documents directory not found or not a directory: {docs_path}"))
-            return []
-
-        self.stdout.write(f"Scanning for documents in local directory: {docs_path}")
-
-        pdf_glob = "**/*.pdf"
-        docx_glob = "**/*.docx"
-
-        # --- PDF Loader ---
-        self.stdout.write(self.style.HTTP_INFO("Configuring PDF loader using PyMuPDFLoader."))
-        pdf_loader = DirectoryLoader(
-            str(path_obj),
-            glob=pdf_glob,
-            loader_cls=PyMuPDFLoader,
-            recursive=True,
-            show_progress=True,
-            silent_errors=True
-        )
-        # --- DOCX Loader ---
-        self.stdout.write(self.style.HTTP_INFO("Configuring DOCX loader using Docx2txtLoader (error reporting enabled)."))
-        docx_loader = DirectoryLoader(
-            str(path_obj),
-            glob=docx_glob,
-            loader_cls=Docx2txtLoader,
-            recursive=True,
-            show_progress=True,
-            use_multithreading=True, # Keep enabled unless issues arise
-            silent_errors=False # Keep False to see errors during debugging
-        )
-        # -----------------------------
-
+    def _load_local_docs(self, files: List[Path], workers: int = 1) -> Dict[Path, List[Document]]:
+        """
+        Parses the given PDF (using PyMuPDF) and DOCX files across a process pool.
+        Results come back in input order; files that fail are reported and left out.
+        """
+        loaded: Dict[Path, List[Document]] = {}
         loaded_pdf_sections_count = 0
-        loaded_docx_sections_count = 0 # Separate count for DOCX
-        errors_occurred_pdf = False
-        errors_occurred_docx = False
-
-        # --- Loading PDF Files ---
-        try:
-            self.stdout.write(" -> Loading PDF files using PyMuPDFLoader...")
-            pdf_docs = pdf_loader.load()
-            loaded_pdf_sections_count = len(pdf_docs) # Update specific count
-            self.stdout.write(f" -> Found {loaded_pdf_sections_count} sections in PDF files.")
-            for doc in pdf_docs:
-                 source_name = Path(doc.metadata.get('source', 'unknown')).name
-                 doc.metadata['source'] = source_name
-                 if source_name != 'unknown':
-                    processed_pdf_sources.add(source_name)
-            all_docs.extend(pdf_docs)
-        except Exception as e:
-            self.stderr.write(self.style.ERROR(f"Unexpected error during PDF loading phase (PyMuPDF): {e}"))
-            logger.error("PDF loading with PyMuPDF failed", exc_info=True)
-            errors_occurred_pdf = True
-        # -----------------------
+        loaded_docx_sections_count = 0
+        failed_files = []
+        if not files:
+            return loaded
+
+        workers = max(1, min(workers, len(files)))
+        self.stdout.write(f"Parsing {len(files)} files with {workers} worker process(es)...")
+        started_at = time.monotonic()
+        if workers == 1:
+            results = map(parse_source_file, files)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            # chunksize > 1 cuts IPC round-trips on large corpora of small files.
+            results = executor.map(parse_source_file, files, chunksize=max(1, len(files) // (workers * 8)))
 
-        # --- Loading DOCX Files ---
         try:
-            # ADDED: Explicit log before attempting to load DOCX
-            self.stdout.write(" -> Attempting to load DOCX files (errors will be shown)...")
-            docx_docs = docx_loader.load()
-            loaded_docx_sections_count = len(docx_docs) # Update specific count
-            # ADDED: Clearer log message for DOCX success/failure
-            if loaded_docx_sections_count > 0:
-                self.stdout.write(self.style.SUCCESS(f" -> Successfully loaded {loaded_docx_sections_count} sections from DOCX files."))
-            else:
-                # If no error occurred but count is 0, it means no DOCX files were found or they were empty
-                self.stdout.write(self.style.WARNING(" -> No sections loaded from DOCX files (either none found or files were empty/unreadable)."))
-
-            for doc in docx_docs: # Process metadata even if count is 0 (though loop won't run)
-                 source_name = Path(doc.metadata.get('source', 'unknown')).name
-                 doc.metadata['source'] = source_name
-                 if source_name != 'unknown':
-                     processed_docx_sources.add(source_name)
-            all_docs.extend(docx_docs)
-        except Exception as e:
-            self.stderr.write(self.style.ERROR(f"Error during DOCX loading phase: {e}"))
-            logger.error("DOCX loading failed", exc_info=True)
-            errors_occurred_docx = True
-        # ------------------------
-
-        # --- Summary ---
-        total_loaded_sections = loaded_pdf_sections_count + loaded_docx_sections_count
-        processed_files_sources = processed_pdf_sources.union(processed_docx_sources)
-        processed_count = len(processed_files_sources)
-
-        total_files_in_dir = sum(1 for f in path_obj.rglob("*") if f.is_file() and f.suffix.lower() in ['.pdf', '.docx'])
-        skipped_files = total_files_in_dir - processed_count if total_files_in_dir >= processed_count else 0
-        errors_occurred = errors_occurred_pdf or errors_occurred_docx
-
-        summary_style = self.style.SUCCESS if not errors_occurred else self.style.WARNING
-        # UPDATED: More detailed summary
+            for path, docs, elapsed, error in results:
+                if error is not None:
+                    self.stderr.write(self.style.ERROR(f" -> Failed to load '{path.name}' after {elapsed:.2f}s: {error}"))
+                    logger.error(f"Loading '{path}' failed: {error}")
+                    failed_files.append(path)
+                    continue
+                self.stdout.write(f" -> Parsed '{path.name}': {len(docs)} sections in {elapsed:.2f}s")
+                loaded[path] = docs
+                if path.suffix.lower() == '.pdf':
+                    loaded_pdf_sections_count += len(docs)
+                else:
+                    loaded_docx_sections_count += len(docs)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        summary_style = self.style.SUCCESS if not failed_files else self.style.WARNING
         self.stdout.write(summary_style(
-            f"Finished loading local files. "
-            f"Total sections loaded: {total_loaded_sections} ({loaded_pdf_sections_count} PDF, {loaded_docx_sections_count} DOCX). "
-            f"Processed unique source files (approx): {processed_count}. "
-            f"Potential skipped/error files (approx): {skipped_files}"
+            f"Finished loading local files in {time.monotonic() - started_at:.1f}s. "
+            f"Total sections loaded: {loaded_pdf_sections_count + loaded_docx_sections_count} "
+            f"({loaded_pdf_sections_count} PDF, {loaded_docx_sections_count} DOCX) from {len(loaded)} files. "
+            f"Failed files: {len(failed_files)}"
         ))
-        if errors_occurred:
-             self.stdout.write(self.style.WARNING("Note: Errors occurred during the loading phase. Check specific error messages above or logs for details."))
-        # ---------------
+        for path in failed_files:
+            self.stdout.write(self.style.WARNING(f"    failed: {path}"))
+        return loaded
+
+    def _delete_vectors(self, vector_store, ids: List[str]) -> None:
+        for start in range(0, len(ids), 500):
+            vector_store.delete(ids=ids[start:start + 500])
+
+    def _embed_batch(self, embeddings, batch: List[tuple], rate_limiter: TokenBucket, max_retries: int = 5):
+        """Embeds one batch of (chunk_id, chunk) pairs, retrying with exponential backoff."""
+        texts = [chunk.page_content for _, chunk in batch]
+        for attempt in range(max_retries + 1):
+            rate_limiter.acquire()
+            try:
+                return batch, embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                backoff = min(60.0, 2.0 ** attempt)
+                logger.warning(f"Embedding batch failed (attempt {attempt + 1}/{max_retries + 1}): {e}. Retrying in {backoff:.0f}s.")
+                time.sleep(backoff)
+
+    def _embed_and_upsert(self, vector_store, embeddings, chunks: List[Document], chunk_ids: List[str],
+                          checkpoint: dict, vectorstore_path: str, options: dict) -> None:
+        """
+        Embeds chunks in batches with bounded concurrency and a token-bucket rate limit,
+        upserting each batch into Chroma as it completes and checkpointing the finished IDs.
+        """
+        completed_ids = set(checkpoint.setdefault("completed_ids", []))
+        pending = [(chunk_id, chunk) for chunk_id, chunk in zip(chunk_ids, chunks) if chunk_id not in completed_ids]
+        if completed_ids:
+            self.stdout.write(f" -> Resuming: {len(chunks) - len(pending)} chunks already indexed, {len(pending)} remaining.")
+        if not pending:
+            return
 
-        return all_docs
+        batch_size = max(1, options['batch_size'])
+        batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+        rate_limiter = TokenBucket(options['requests_per_minute'] / 60.0)
+        self.stdout.write(
+            f" -> Embedding {len(pending)} chunks in {len(batches)} batches "
+            f"(batch_size={batch_size}, concurrency={options['concurrency']}, rpm={options['requests_per_minute']:g})..."
+        )
+
+        started_at = time.monotonic()
+        done_count = 0
+        executor = ThreadPoolExecutor(max_workers=max(1, options['concurrency']), thread_name_prefix="embed")
+        try:
+            futures = [executor.submit(self._embed_batch, embeddings, batch, rate_limiter) for batch in batches]
+            for future in as_completed(futures):
+                batch, vectors = future.result()
+                # Chroma writes stay on this thread; only the API calls run concurrently.
+                vector_store._collection.upsert(
+                    ids=[chunk_id for chunk_id, _ in batch],
+                    embeddings=vectors,
+                    documents=[chunk.page_content for _, chunk in batch],
+                    metadatas=[chunk.metadata for _, chunk in batch],
+                )
+                completed_ids.update(chunk_id for chunk_id, _ in batch)
+                checkpoint["completed_ids"] = sorted(completed_ids)
+                save_checkpoint(vectorstore_path, checkpoint)
+
+                done_count += len(batch)
+                elapsed = time.monotonic() - started_at
+                rate = done_count / elapsed if elapsed > 0 else 0.0
+                eta = (len(pending) - done_count) / rate if rate > 0 else 0.0
+                self.stdout.write(
+                    f"    {done_count}/{len(pending)} chunks ({done_count / len(pending):.0%}) | "
+                    f"{rate:.1f} chunks/s | ETA {eta:.0f}s"
+                )
+        except Exception:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.stderr.write(self.style.ERROR(
+                f" -> Embedding stopped after {done_count} chunks. Progress is checkpointed; re-run with --resume to continue."
+            ))
+            raise
+        executor.shutdown(wait=True)
 
 
     def handle(self, *args, **options) -> None:
         """Main command execution logic."""
-        self.stdout.write(self.style.NOTICE("Starting LOCAL RAG index build process..."))
+        incremental = options['incremental']
+        mode_label = "INCREMENTAL" if incremental else "FULL"
+        self.stdout.write(self.style.NOTICE(f"Starting LOCAL RAG index build process ({mode_label})..."))
 
         # --- 1. Validate Settings ---
         try:
@@ -168,16 +234,37 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR(f"Configuration error: {e}"))
             return
 
-        # --- 2. Load Documents ---
-        docs_path = settings.LOCAL_DOCUMENTS_PATH
+        # --- 2. Scan Documents and Plan Changes ---
+        docs_path = Path(settings.LOCAL_DOCUMENTS_PATH)
+        vectorstore_path = str(settings.VECTORSTORE_PATH)
         self.stdout.write(f"DEBUG: Using LOCAL_DOCUMENTS_PATH = {docs_path}")
-        documents = self._load_local_docs(docs_path)
+        if not docs_path.is_dir():
+            self.stderr.write(self.style.ERROR(f"Local documents directory not found or not a directory: {docs_path}"))
+            return
 
-        if not documents:
+        source_files = discover_source_files(docs_path)
+        current_hashes = {path.relative_to(docs_path).as_posix(): (path, file_sha256(path)) for path in source_files}
+        manifest = load_manifest(vectorstore_path) if incremental else {"files": {}}
+        previous_files = manifest["files"]
+
+        to_index = {rel: entry for rel, entry in current_hashes.items()
+                    if previous_files.get(rel, {}).get("sha256") != entry[1]}
+        removed = [rel for rel in previous_files if rel not in current_hashes]
+        unchanged_count = len(current_hashes) - len(to_index)
+        self.stdout.write(
+            f"Found {len(source_files)} source files: {len(to_index)} new/changed, "
+            f"{unchanged_count} unchanged, {len(removed)} removed."
+        )
+        if incremental and not to_index and not removed:
+            self.stdout.write(self.style.SUCCESS("Index is already up to date. Nothing to do."))
+            return
+
+        # --- 3. Load and Split Documents ---
+        loaded_docs = self._load_local_docs([path for path, _ in to_index.values()], workers=options['workers'])
+        if not incremental and not loaded_docs:
             self.stdout.write(self.style.WARNING("No document sections loaded or an error prevented loading. Index build aborted."))
             return
 
-        # --- 3. Split Documents ---
         self.stdout.write("Splitting documents into chunks...")
         chunk_size = getattr(settings, 'RAG_CHUNK_SIZE', 1000)
         chunk_overlap = getattr(settings, 'RAG_CHUNK_OVERLAP', 150)
@@ -187,16 +274,30 @@ class Command(BaseCommand):
             chunk_overlap=chunk_overlap,
             length_function=len,
             is_separator_regex=False,
+            # Lets serving merge overlapping neighbours back into one excerpt (core.context_packing).
+            add_start_index=True,
         )
+        chunks: List[Document] = []
+        chunk_ids: List[str] = []
+        new_manifest_entries = {}
         try:
-            chunks = text_splitter.split_documents(documents)
+            for rel, (path, file_hash) in to_index.items():
+                if path not in loaded_docs:
+                    continue
+                file_chunks = text_splitter.split_documents(loaded_docs[path])
+                file_chunk_ids = chunk_ids_for(rel, file_hash, len(file_chunks))
+                for chunk, chunk_id in zip(file_chunks, file_chunk_ids):
+                    chunk.metadata['chunk_id'] = chunk_id
+                chunks.extend(file_chunks)
+                chunk_ids.extend(file_chunk_ids)
+                new_manifest_entries[rel] = {"sha256": file_hash, "chunk_ids": file_chunk_ids}
             self.stdout.write(f"Split documents into {len(chunks)} chunks.")
         except Exception as e:
              self.stderr.write(self.style.ERROR(f"Error during document splitting: {e}"))
              logger.error("Document splitting failed", exc_info=True)
              return
 
-        if not chunks:
+        if not incremental and not chunks:
              self.stdout.write(self.style.WARNING("No chunks created after splitting (perhaps documents were empty?). Index build aborted."))
              return
 
@@ -207,6 +308,14 @@ class Command(BaseCommand):
                 model=settings.GEMINI_EMBEDDING_MODEL,
                 google_api_key=settings.GEMINI_API_KEY
             )
+            if getattr(settings, 'EMBEDDING_CACHE_ENABLED', False):
+                embeddings = CachedEmbeddings(
+                    embeddings,
+                    settings.GEMINI_EMBEDDING_MODEL,
+                    db_path=settings.EMBEDDING_CACHE_PATH,
+                    memory_size=settings.EMBEDDING_CACHE_MEMORY_SIZE,
+                )
+                self.stdout.write(f" -> Using embedding cache at: {settings.EMBEDDING_CACHE_PATH}")
             self.stdout.write(" -> Testing embedding model connection...")
             _ = embeddings.embed_query("test query for embedding model")
             self.stdout.write(self.style.SUCCESS(" -> Embeddings initialized and tested successfully."))
@@ -216,30 +325,89 @@ class Command(BaseCommand):
             logger.error("Embedding initialization failed", exc_info=True)
             return
 
-        # --- 5. Build and Persist Vector Store ---
-        vectorstore_path = str(settings.VECTORSTORE_PATH)
+        # --- 5. Update and Persist Vector Store ---
         self.stdout.write(f"Preparing Chroma vector store at: {vectorstore_path}")
-        self.stdout.write(self.style.WARNING("WARNING: This will create/update the index in the target directory."))
-        self.stdout.write(self.style.WARNING("Existing data in that Chroma index directory might be replaced or merged depending on Chroma's behavior."))
+        # The plan digest ties a checkpoint to the exact chunk set; if documents changed since, start over.
+        plan_digest = hashlib.sha256("\n".join(chunk_ids).encode("utf-8")).hexdigest()
+        checkpoint = load_checkpoint(vectorstore_path) if options['resume'] else {}
+        if checkpoint and (checkpoint.get("mode") != mode_label or checkpoint.get("plan") != plan_digest):
+            self.stdout.write(self.style.WARNING("Checkpoint does not match this build (mode or documents changed); ignoring it."))
+            checkpoint = {}
+        elif options['resume'] and not checkpoint:
+            self.stdout.write(" -> No checkpoint found; starting from scratch.")
+        checkpoint.update({"mode": mode_label, "plan": plan_digest})
+        if not incremental:
+            self.stdout.write(self.style.WARNING("WARNING: Full rebuild. All existing vectors in the target Chroma collection will be replaced."))
+
+        final_files = {rel: entry for rel, entry in previous_files.items() if rel not in removed}
+        final_files.update(new_manifest_entries)
 
         try:
             os.makedirs(vectorstore_path, exist_ok=True)
-
-            self.stdout.write(f" -> Building Chroma index with {len(chunks)} chunks... (This might take a while)")
-            vector_store = Chroma.from_documents(
-                documents=chunks,
-                embedding=embeddings,
-                persist_directory=vectorstore_path
+            vector_store = Chroma(
+                persist_directory=vectorstore_path,
+                embedding_function=embeddings
             )
 
+            # New vectors are upserted before any old ones are deleted, so a serving process never
+            # sees an empty or partial index, and a failed build leaves the previous one intact.
+            if chunks:
+                self._embed_and_upsert(vector_store, embeddings, chunks, chunk_ids, checkpoint, vectorstore_path, options)
+
+            if incremental:
+                stale_ids = set()
+                for rel in removed:
+                    stale_ids.update(previous_files[rel].get("chunk_ids", []))
+                for rel in new_manifest_entries:
+                    stale_ids.update(previous_files.get(rel, {}).get("chunk_ids", []))
+            else:
+                stale_ids = set(vector_store._collection.get(include=[])["ids"])
+            # Never delete an ID the final index still references (older manifests could share IDs between files).
+            stale_ids -= {chunk_id for entry in final_files.values() for chunk_id in entry.get("chunk_ids", [])}
+            if stale_ids:
+                self.stdout.write(f" -> Deleting {len(stale_ids)} stale vectors of removed/changed files...")
+                self._delete_vectors(vector_store, sorted(stale_ids))
+
+            if isinstance(embeddings, CachedEmbeddings):
+                cache_stats = embeddings.stats()
+                self.stdout.write(
+                    f" -> Embedding cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits, "
+                    f"{cache_stats['misses']} API embeddings (hit rate {cache_stats['hit_rate']:.1%})."
+                )
+
+            manifest["files"] = final_files
+            save_manifest(vectorstore_path, manifest)
+
+            expected_count = sum(len(entry.get("chunk_ids", [])) for entry in final_files.values())
             final_count = vector_store._collection.count()
-            if final_count != len(chunks):
-                self.stdout.write(self.style.WARNING(f" -> Initial chunk count ({len(chunks)}) differs from final vector count ({final_count}). This might indicate issues during embedding/indexing."))
-            self.stdout.write(self.style.SUCCESS(f" -> Successfully built and persisted Chroma index. Final vector count: {final_count}"))
+            if final_count != expected_count:
+                self.stdout.write(self.style.WARNING(f" -> Manifest chunk count ({expected_count}) differs from final vector count ({final_count}). This might indicate issues during embedding/indexing."))
+            self.stdout.write(self.style.SUCCESS(f" -> Successfully updated and persisted Chroma index. Final vector count: {final_count}"))
+
+            # The lexical index and the mmap vector matrix are rebuilt from the stored chunks so
+            # they always mirror the final collection.
+            export_started_at = time.perf_counter()
+            stored = vector_store._collection.get(include=["embeddings", "documents", "metadatas"])
+            lexical_index = LexicalIndex.build(stored["ids"], stored["documents"])
+            lexical_index.save(Path(vectorstore_path) / LEXICAL_INDEX_FILENAME)
+            self.stdout.write(
+                f" -> Lexical (BM25) index written: {len(lexical_index.chunk_ids)} chunks, "
+                f"{len(lexical_index.terms)} terms in {time.perf_counter() - export_started_at:.1f}s."
+            )
+            # Exported even when empty, so the mmap retriever stops serving vectors of deleted documents.
+            export_started_at = time.perf_counter()
+            exported = export_vector_index(vectorstore_path, stored["ids"], stored["embeddings"],
+                                           stored["documents"], stored["metadatas"])
+            self.stdout.write(f" -> Memory-mapped vector matrix written: {exported} rows in {time.perf_counter() - export_started_at:.1f}s.")
+
+            clear_checkpoint(vectorstore_path)
+            index_version = write_index_version(vectorstore_path)
+            SemanticAnswerCache.clear_store(settings.ANSWER_CACHE_PATH)
+            self.stdout.write(f" -> Index version set to {index_version}; cached RAG answers invalidated.")
 
         except Exception as e:
             self.stderr.write(self.style.ERROR(f"Failed to build or persist Chroma index: {e}"))
             logger.error("Chroma index build failed", exc_info=True)
             return
 
-        self.stdout.write(self.style.SUCCESS("LOCAL RAG index build process completed successfully."))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS("LOCAL RAG index build process completed successfully."))
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.test import RequestFactory
+
+from core import api, metrics, services
+
+SYNTHETIC_QUERIES = (
+    "Điều kiện tốt nghiệp của sinh viên là gì?",
+    "Quy chế đào tạo quy định bao nhiêu tín chỉ mỗi học kỳ?",
+    "Cách tính điểm trung bình học phần như thế nào?",
+    "What are the criteria for academic warning?",
+    "List the steps to register for a course.",
+    "Xin chào, bạn có thể giúp gì cho tôi?",
+    "Hello! What can you do?",
+    "Tóm tắt giúp tôi những điểm chính chúng ta vừa nói.",
+    "Sinh viên được phép nghỉ học tạm thời trong trường hợp nào?",
+    "Thanks, that helps a lot.",
+)
+MODES = ("sync", "stream", "async")
+# Fast refusals from admission control; reported separately from failures.
+REJECTED_STATUSES = (429, 503)
+ENDPOINTS = {"sync": "/api/chat/", "stream": "/api/chat/stream/", "async": "/api/chat/async/"}
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ('Drives the chat API views with N concurrent synthetic conversations and reports throughput '
+            'and p50/p95/p99 latency per stage. Uses the fake Gemini backend (core.fakes) unless --backend=configured.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=20,
+                            help='Concurrent synthetic conversations (default: 20).')
+        parser.add_argument('--turns', type=int, default=5,
+                            help='Turns per conversation (default: 5).')
+        parser.add_argument('--mode', choices=MODES, default='sync',
+                            help='Endpoint to drive: sync (chat_api), stream (chat_stream_api) or async (chat_api_async).')
+        parser.add_argument('--backend', choices=('fake', 'configured'), default='fake',
+                            help="'fake' forces LLM_BACKEND=fake; 'configured' uses the settings as they are (real API costs).")
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Seconds a synthetic user waits between turns (default: 0).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Keep the synthetic chats in MongoDB instead of deleting them afterwards.')
+
+    def handle(self, *args, **options) -> None:
+        # --- 1. Configure Backend ---
+        if options['backend'] == 'fake':
+            # Read by services when the model and embeddings are initialized, which happens below.
+            settings.LLM_BACKEND = 'fake'
+            # Synthetic vectors and answers must not reach the caches real users are served from.
+            settings.EMBEDDING_CACHE_ENABLED = False
+            settings.ANSWER_CACHE_ENABLED = False
+        # The synthetic queries are not real traffic; keep them out of the router's training log.
+        settings.ROUTER_DECISION_LOG_ENABLED = False
+        services.ROUTER_DECISION_LOG_ENABLED = False
+
+        self.stdout.write(f"Initializing services (LLM_BACKEND={settings.LLM_BACKEND})...")
+        started_at = time.perf_counter()
+        services.ensure_initialized()
+        if not services.is_ready():
+            self.stderr.write(self.style.ERROR(f"Services not ready: {services.initialization_error}"))
+            return
+        self.stdout.write(f" -> Ready in {time.perf_counter() - started_at:.2f}s (RAG {'on' if services.rag_available else 'off'}).")
+
+        # --- 2. Collect Stage Timings ---
+        stage_samples = defaultdict(list)
+        route_counts = defaultdict(int)
+        samples_lock = threading.Lock()
+
+        def record_turn(timings, route, mode):
+            with samples_lock:
+                route_counts[route] += 1
+                for stage, seconds in timings.items():
+                    stage_samples[stage].append(seconds)
+
+        metrics.add_turn_observer(record_turn)
+        conversations = [
+            (f"loadtest-{uuid.uuid4()}", random.Random(options['seed'] + i).choices(SYNTHETIC_QUERIES, k=options['turns']))
+            for i in range(options['conversations'])
+        ]
+        request_latencies, errors = [], []
+        mode = options['mode']
+        self.stdout.write(f"Running {len(conversations)} conversations x {options['turns']} turns against {ENDPOINTS[mode]}...")
+
+        # --- 3. Run Conversations ---
+        run_started_at = time.perf_counter()
+        try:
+            if mode == 'async':
+                asyncio.run(self._run_async(conversations, options['think_time'], request_latencies, errors))
+            else:
+                with ThreadPoolExecutor(max_workers=len(conversations) or 1, thread_name_prefix="loadtest") as executor:
+                    for future in [executor.submit(self._run_conversation, mode, chat_id, queries, options['think_time'])
+                                   for chat_id, queries in conversations]:
+                        latencies, conversation_errors = future.result()
+                        request_latencies.extend(latencies)
+                        errors.extend(conversation_errors)
+        finally:
+            metrics.remove_turn_observer(record_turn)
+        elapsed = time.perf_counter() - run_started_at
+
+        # --- 4. Report ---
+        completed = len(request_latencies)
+        rejected = sum(1 for error in errors if error.endswith("(rejected)"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{completed} turns in {elapsed:.2f}s: {completed / elapsed if elapsed else 0.0:.2f} turns/s, "
+            f"{len(errors) - rejected} errors, {rejected} rejected by admission control."
+        ))
+        if services.admission is not None:
+            self.stdout.write(f" -> Admission: {services.admission.state()}")
+        if route_counts:
+            self.stdout.write(" -> Routes: " + ", ".join(f"{route}={count}" for route, count in sorted(route_counts.items())))
+        rows = [("request", request_latencies)] + sorted(stage_samples.items())
+        self.stdout.write(f"   {'stage':<16}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}   (ms)")
+        for stage, values in rows:
+            if not values:
+                continue
+            values_ms = [seconds * 1000 for seconds in values]
+            self.stdout.write(
+                f"   {stage:<16}{len(values_ms):>7}{statistics.mean(values_ms):>10.1f}{_percentile(values_ms, 0.5):>10.1f}"
+                f"{_percentile(values_ms, 0.95):>10.1f}{_percentile(values_ms, 0.99):>10.1f}"
+            )
+        for error in errors[:5]:
+            self.stdout.write(self.style.WARNING(f" -> {error}"))
+
+        # --- 5. Clean Up ---
+        if not options['keep_data']:
+            deleted = 0
+            for chat_id, _ in conversations:
+                try:
+                    services.delete_session_history(chat_id)
+                    deleted += 1
+                except services.PendingWritesError as e:
+                    self.stdout.write(self.style.WARNING(f" -> {e}"))
+            self.stdout.write(f" -> Deleted {deleted} of {len(conversations)} synthetic chats.")
+
+    def _request(self, mode: str, chat_id: str, query: str):
+        return RequestFactory().post(ENDPOINTS[mode], data=json.dumps({"message": query, "chat_id": chat_id}),
+                                     content_type="application/json")
+
+    def _run_conversation(self, mode: str, chat_id: str, queries: list, think_time: float):
+        latencies, errors = [], []
+        for query in queries:
+            started_at = time.perf_counter()
+            try:
+                if mode == 'stream':
+                    response = api.chat_stream_api(self._request(mode, chat_id, query))
+                    body = b"".join(response.streaming_content) if response.streaming else response.content
+                    failed = response.status_code >= 400 or b"event: error" in body
+                else:
+                    response = api.chat_api(self._request(mode, chat_id, query))
+                    failed = response.status_code >= 400
+                if response.status_code in REJECTED_STATUSES:
+                    errors.append(f"[{chat_id}] HTTP {response.status_code} (rejected)")
+                elif failed:
+                    errors.append(f"[{chat_id}] HTTP {response.status_code}")
+                else:
+                    latencies.append(time.perf_counter() - started_at)
+            except Exception as e:
+                errors.append(f"[{chat_id}] {type(e).__name__}: {e}")
+            if think_time:
+                time.sleep(think_time)
+        return latencies, errors
+
+    async def _run_async(self, conversations: list, think_time: float, request_latencies: list, errors: list):
+        async def run_conversation(chat_id, queries):
+            for query in queries:
+                started_at = time.perf_counter()
+                try:
+                    response = await api.chat_api_async(self._request('async', chat_id, query))
+                    if response.status_code in REJECTED_STATUSES:
+                        errors.append(f"[{chat_id}] HTTP {response.status_code} (rejected)")
+                    elif response.status_code >= 400:
+                        errors.append(f"[{chat_id}] HTTP {response.status_code}")
+                    else:
+                        request_latencies.append(time.perf_counter() - started_at)
+                except Exception as e:
+                    errors.append(f"[{chat_id}] {type(e).__name__}: {e}")
+                if think_time:
+                    await asyncio.sleep(think_time)
+
+        await asyncio.gather(*(run_conversation(chat_id, queries) for chat_id, queries in conversations))
@@ -0,0 +1,54 @@
+import random
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from core.local_router import NaiveBayesRouterModel, read_routing_log, ROUTE_LABELS
+
+
+class Command(BaseCommand):
+    help = 'Trains the local query router from the logged routing decisions (ROUTER_DECISION_LOG_PATH).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-samples', type=int, default=50,
+                            help='Minimum number of labelled decisions required to train (default: 50).')
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Fraction of samples held out to report accuracy (default: 0.2).')
+        parser.add_argument('--include-local', action='store_true',
+                            help="Also train on decisions made by the local router itself (not recommended).")
+
+    def handle(self, *args, **options) -> None:
+        log_path = settings.ROUTER_DECISION_LOG_PATH
+        model_path = settings.LOCAL_ROUTER_MODEL_PATH
+        sources = ("llm", "manual", "local") if options['include_local'] else ("llm", "manual")
+
+        self.stdout.write(f"Reading routing decisions from: {log_path}")
+        samples = read_routing_log(log_path, sources=sources)
+        # The same query is often logged many times; keep the latest label for each one.
+        deduplicated = {query.strip().lower(): (query, label) for query, label in samples}
+        samples = list(deduplicated.values())
+
+        label_counts = Counter(label for _, label in samples)
+        self.stdout.write(f" -> {len(samples)} unique labelled queries: " +
+                          ", ".join(f"{label}={label_counts.get(label, 0)}" for label in ROUTE_LABELS))
+        if len(samples) < options['min_samples']:
+            self.stdout.write(self.style.WARNING(
+                f"Not enough samples to train (need at least {options['min_samples']}). Model not updated."))
+            return
+
+        random.Random(42).shuffle(samples)
+        holdout_size = int(len(samples) * options['holdout'])
+        if holdout_size > 0:
+            eval_model = NaiveBayesRouterModel.train(samples[holdout_size:])
+            holdout = samples[:holdout_size]
+            correct = 0
+            for query, label in holdout:
+                probabilities = eval_model.predict_proba(query)
+                if max(probabilities, key=probabilities.get) == label:
+                    correct += 1
+            self.stdout.write(f" -> Holdout accuracy: {correct / len(holdout):.3f} on {len(holdout)} queries.")
+
+        model = NaiveBayesRouterModel.train(samples)
+        model.save(model_path)
+        self.stdout.write(self.style.SUCCESS(f"Local router model trained on {len(samples)} queries and saved to: {model_path}"))
+        self.stdout.write("Restart the workers (or set ROUTER_MODE=local) to use the new model.")
@@ -0,0 +1,288 @@
+import math
+import threading
+
+# Minimal in-process Prometheus instrumentation (text exposition format 0.0.4), so the
+# /metrics endpoint needs no extra dependency. Values are per worker process; Prometheus
+# aggregates across workers when each one is scraped (or behind a per-pod target).
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+
+_registry = []
+# Callbacks run before each scrape to refresh metrics mirrored from a component's own counters.
+_collectors = []
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labelvalues, extra=None) -> str:
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def _header(self) -> list:
+        # In the 0.0.4 text format the family is named after its (only) sample, name_total.
+        return [f"# HELP {self.name}_total {self.documentation}", f"# TYPE {self.name}_total {self.metric_type}"]
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels) -> None:
+        """Mirrors a running total kept by the component itself (see add_collector)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list:
+        lines = self._header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> list:
+        lines = self._header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self) -> list:
+        lines = self._header()
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["counts"]):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+                lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+def add_collector(callback) -> None:
+    _collectors.append(callback)
+
+
+def render_metrics() -> str:
+    for callback in list(_collectors):
+        callback()
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Chatbot metrics ---
+
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_duration_seconds",
+    "Time spent in each stage of a chat turn (history, router, embedding, vector_search, generation, ..., total).",
+    ("stage", "route"),
+)
+TURNS = Counter(
+    "chatbot_turns",
+    "Chat turns handled, by routing decision and entry point (sync, stream, async).",
+    ("route", "mode"),
+)
+ROUTING_DECISIONS = Counter(
+    "chatbot_routing_decisions",
+    "Router decisions by outcome and by which router made them (local or llm).",
+    ("decision", "source"),
+)
+RAG_FALLBACKS = Counter(
+    "chatbot_rag_fallbacks",
+    "SEARCH_DOCS turns answered by general chat instead (reason: rag_unavailable, circuit_open or rag_error).",
+    ("reason",),
+)
+SAFETY_BLOCKS = Counter(
+    "chatbot_safety_blocks",
+    "Responses blocked or cut off by Gemini safety filters.",
+    ("where",),
+)
+ANSWER_CACHE_LOOKUPS = Counter(
+    "chatbot_answer_cache_lookups",
+    "Semantic answer cache lookups by result (hit or miss).",
+    ("result",),
+)
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "chatbot_embedding_cache_lookups",
+    "Texts looked up in the embedding cache, by outcome (memory_hit, disk_hit, miss).",
+    ("result",),
+)
+EMBEDDING_CACHE_MEMORY_ENTRIES = Gauge(
+    "chatbot_embedding_cache_memory_entries",
+    "Embeddings held in the in-memory LRU layer of the embedding cache.",
+)
+RAG_CONTEXT_TOKENS = Histogram(
+    "chatbot_rag_context_tokens",
+    "Estimated tokens of retrieved context packed into each RAG prompt.",
+    buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000),
+)
+COALESCED_CALLS = Counter(
+    "chatbot_coalesced_calls",
+    "History-independent calls by kind (router, rag, general) and role: each follower joined an "
+    "identical in-flight call, i.e. one upstream call saved.",
+    ("kind", "role"),
+)
+WRITE_BEHIND_MESSAGES = Counter(
+    "chatbot_write_behind_messages",
+    "Chat messages by persistence outcome (queued, written, sync_fallback, dead_lettered).",
+    ("result",),
+)
+WRITE_BEHIND_QUEUE_DEPTH = Gauge(
+    "chatbot_write_behind_queue_depth",
+    "Turns waiting in the write-behind persistence queue.",
+)
+ADMISSION_DECISIONS = Counter(
+    "chatbot_admission_decisions",
+    "Chat turns by admission outcome (admitted, queue_full, evicted, timeout, upstream_quota) and priority.",
+    ("result", "priority"),
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "chatbot_admission_wait_seconds",
+    "Time an admitted chat turn waited in the admission queue for a model slot.",
+)
+ADMISSION_ACTIVE = Gauge(
+    "chatbot_admission_active",
+    "Chat turns currently holding a model slot.",
+)
+ADMISSION_QUEUED = Gauge(
+    "chatbot_admission_queued",
+    "Chat turns waiting for a model slot.",
+)
+DEADLINE_EXCEEDED = Counter(
+    "chatbot_deadline_exceeded",
+    "Chat requests cut off by their deadline, by the stage that was running or about to start.",
+    ("stage",),
+)
+HEDGED_CALLS = Counter(
+    "chatbot_hedged_calls",
+    "Hedgeable model calls by kind and outcome (single: answered before the hedge delay, hedged: a second "
+    "call was sent, skipped: a hedge was due but no hedge worker was idle).",
+    ("kind", "outcome"),
+)
+CIRCUIT_STATE = Gauge(
+    "chatbot_circuit_state",
+    "Circuit breaker state per dependency (0 closed, 1 half-open, 2 open).",
+    ("dependency",),
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "chatbot_circuit_transitions",
+    "Circuit breaker state changes per dependency, by the state entered.",
+    ("dependency", "state"),
+)
+DEGRADED_RESPONSES = Counter(
+    "chatbot_degraded_responses",
+    "Requests served in a degraded mode because a dependency's circuit was open (no_history, no_rag, "
+    "no_summary), or failed fast with 503 (<dependency>_unavailable).",
+    ("mode",),
+)
+MONGO_WRITE_SECONDS = Histogram(
+    "chatbot_mongo_write_duration_seconds",
+    "Time to persist messages and session summaries to MongoDB (per turn, or per batch for write_behind).",
+    ("mode",),
+)
+
+
+# Callbacks receiving (timings, route, mode) for every finished turn, e.g. the load_test command.
+_turn_observers = []
+
+
+def add_turn_observer(callback) -> None:
+    _turn_observers.append(callback)
+
+
+def remove_turn_observer(callback) -> None:
+    if callback in _turn_observers:
+        _turn_observers.remove(callback)
+
+
+def observe_turn(timings: dict, route: str, mode: str) -> None:
+    """Records one finished turn: every stage timing plus the turn counter."""
+    route = route or "UNROUTED"
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage, route=route)
+    TURNS.inc(route=route, mode=mode)
+    for callback in list(_turn_observers):
+        callback(dict(timings), route, mode)
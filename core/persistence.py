@@ -0,0 +1,187 @@
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Bounded in-process write-behind queue drained by one background thread.
+
+    Items are handed to `flush_func(batch)` in batches of up to `batch_size`, collected for
+    at most `flush_interval` seconds. A failing batch is retried with exponential backoff;
+    after `max_retries` it is appended to `dead_letter_path` (JSON lines) so nothing is
+    silently lost, and `on_discard(batch)` lets the owner undo any optimistic state.
+    `submit` never blocks: it returns False when the queue is full so the caller can write
+    synchronously instead. `close` (registered with atexit by the owner) drains what is left.
+    While `gate()` returns False (e.g. the storage circuit is open) the worker holds its batch
+    without spending retries, so writes queue up during an outage instead of being dead-lettered.
+    """
+
+    def __init__(self, flush_func, max_size: int = 1000, batch_size: int = 100, flush_interval: float = 0.2,
+                 max_retries: int = 5, retry_backoff: float = 0.5, dead_letter_path=None, on_discard=None,
+                 gate=None, name: str = "write-behind"):
+        self.flush_func = flush_func
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.dead_letter_path = Path(dead_letter_path) if dead_letter_path else None
+        self.on_discard = on_discard
+        self.gate = gate
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stopping = threading.Event()
+        self._idle = threading.Condition()
+        self._in_flight = 0
+        self._stats = {"submitted": 0, "rejected": 0, "flushed": 0, "batches": 0, "retries": 0, "dead_lettered": 0, "paused": 0}
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> bool:
+        if self._stopping.is_set():
+            return False
+        try:
+            with self._idle:
+                self._queue.put_nowait(item)
+                self._in_flight += 1
+        except queue.Full:
+            self._count("rejected")
+            return False
+        self._count("submitted")
+        return True
+
+    def purge(self, predicate) -> list:
+        """
+        Removes and returns the queued items matching `predicate` (e.g. those of a chat being
+        deleted). A batch the worker has already taken is not affected; flush() waits for it.
+        """
+        with self._idle:
+            with self._queue.mutex:
+                removed = [item for item in self._queue.queue if predicate(item)]
+                if removed:
+                    kept = [item for item in self._queue.queue if not predicate(item)]
+                    self._queue.queue.clear()
+                    self._queue.queue.extend(kept)
+                    self._queue.not_full.notify(len(removed))
+            if removed:
+                self._in_flight -= len(removed)
+                self._idle.notify_all()
+        return removed
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {**self._stats, "queued": self._queue.qsize()}
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until every submitted item has been written (or dead-lettered). Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stops accepting items and drains the queue."""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"[{self.name}] Shutdown timed out with {self._queue.qsize()} items still queued.")
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _next_batch(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            self._write(batch)
+            with self._idle:
+                self._in_flight -= len(batch)
+                self._idle.notify_all()
+
+    def _wait_for_gate(self) -> bool:
+        """Blocks while the gate is shut. False if the queue is stopping meanwhile (the batch is then dead-lettered)."""
+        if self.gate is None or self.gate():
+            return True
+        self._count("paused")
+        logger.warning(f"[{self.name}] Storage unavailable; holding writes ({self._queue.qsize()} queued) until it recovers.")
+        while not self.gate():
+            if self._stopping.is_set():
+                return False
+            time.sleep(max(self.flush_interval, 0.5))
+        logger.info(f"[{self.name}] Storage available again; resuming writes.")
+        return True
+
+    def _write(self, batch: list) -> None:
+        attempt = 0
+        while True:
+            if not self._wait_for_gate():
+                logger.error(f"[{self.name}] Shutting down while storage is unavailable.")
+                break
+            try:
+                self.flush_func(batch)
+                self._count("flushed", len(batch))
+                self._count("batches")
+                return
+            except Exception as e:
+                if self.gate is not None and not self.gate():
+                    # The failure shut the gate: wait for recovery instead of spending a retry.
+                    logger.warning(f"[{self.name}] Batch of {len(batch)} failed ({e}); storage marked unavailable.")
+                    continue
+                if attempt == self.max_retries:
+                    logger.error(f"[{self.name}] Batch of {len(batch)} failed after {attempt + 1} attempts: {e}", exc_info=True)
+                    break
+                delay = self.retry_backoff * (2 ** attempt)
+                attempt += 1
+                self._count("retries")
+                logger.warning(f"[{self.name}] Batch of {len(batch)} failed ({e}); retrying in {delay:.1f}s.")
+                time.sleep(delay)
+        self._dead_letter(batch)
+        if self.on_discard is not None:
+            try:
+                self.on_discard(batch)
+            except Exception as e:
+                logger.error(f"[{self.name}] on_discard callback failed: {e}", exc_info=True)
+
+    def _dead_letter(self, batch: list) -> None:
+        self._count("dead_lettered", len(batch))
+        if self.dead_letter_path is None:
+            return
+        try:
+            self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letter_file:
+                for item in batch:
+                    dead_letter_file.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+            logger.error(f"[{self.name}] Wrote {len(batch)} unsaved items to '{self.dead_letter_path}'.")
+        except Exception as e:
+            logger.error(f"[{self.name}] Could not write dead-letter file '{self.dead_letter_path}': {e}", exc_info=True)
@@ -1,12 +1,24 @@
+import atexit
 import pymongo
 import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold, StopCandidateException
-from pymongo.errors import ConnectionFailure, OperationFailure
+from google.generativeai.types import HarmCategory, HarmBlockThreshold, StopCandidateException, BlockedPromptException
+from google.api_core.exceptions import DeadlineExceeded as GeminiTimeout, TooManyRequests
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure
 from datetime import datetime
 from django.conf import settings
 import logging
 import os
 from pathlib import Path
+import asyncio
+import contextvars
+import hashlib
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
 
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 logger = logging.getLogger(__name__)
@@ -15,6 +27,11 @@ try:
 except ImportError:
     logger.warning("langchain-chroma not found, falling back to Chroma from langchain_community.")
     from langchain_community.vectorstores import Chroma
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    logger.warning("motor not found, async MongoDB access will run the sync driver in a thread.")
+    AsyncIOMotorClient = None
 from langchain.prompts import PromptTemplate, ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema.runnable import RunnablePassthrough, RunnableLambda, RunnableBranch
 from langchain.schema.output_parser import StrOutputParser
@@ -25,277 +42,474 @@ from langchain.schema import SystemMessage, HumanMessage, AIMessage
 # Import ChatPromptValue from its correct core location
 from langchain_core.prompt_values import ChatPromptValue
 
+from . import deadlines, metrics
+from .local_router import LocalRouter, NaiveBayesRouterModel, log_routing_decision
+from .answer_cache import SemanticAnswerCache
+from .embedding_cache import CachedEmbeddings
+from .fakes import FakeEmbeddings, FakeGenerativeModel
+from .singleflight import SingleFlight, normalize_query
+from .persistence import WriteBehindQueue
+from .admission import PRIORITY_CONVERSATION, PRIORITY_NEW_CHAT, AdmissionController, AdmissionRejected
+from .circuit_breaker import HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from .deadlines import DeadlineExceeded
+from .hedging import HedgePool, LatencyTracker, ahedged_call, hedged_call
+from .lexical_index import LEXICAL_INDEX_FILENAME, LexicalIndexHandle, reciprocal_rank_fusion
+from .vector_index import MmapVectorIndexHandle
+from .context_packing import format_excerpt_header, pack_context
+from .history_cache import ChatHistoryCache
+from .chat_sessions import (
+    decode_keyset_cursor,
+    encode_keyset_cursor,
+    encode_session_cursor,
+    ensure_session_indexes,
+    mongo_timestamp,
+    session_display_title,
+    session_page_filter,
+    session_update_for_messages,
+)
+from .history_compaction import (
+    MAX_MESSAGES_PER_UPDATE,
+    SUMMARY_FIELDS,
+    build_summary_prompt,
+    compact_history,
+    messages_after_filter,
+    messages_to_fold,
+    summary_position,
+)
+
 
 MONGO_URI = settings.MONGO_URI
 MONGO_DB_NAME = settings.MONGO_DB_NAME
 MONGO_COLLECTION_NAME = settings.MONGO_COLLECTION_NAME
+MONGO_SESSIONS_COLLECTION_NAME = settings.MONGO_SESSIONS_COLLECTION_NAME
 GEMINI_API_KEY = settings.GEMINI_API_KEY
 TUNED_MODEL_NAME = settings.TUNED_MODEL_NAME
 HISTORY_LIMIT = settings.CHAT_HISTORY_LIMIT
+HISTORY_PAGE_SIZE = settings.CHAT_HISTORY_PAGE_SIZE
 CHAT_TITLE_MAX_LENGTH = settings.CHAT_TITLE_MAX_LENGTH
+CHAT_LIST_PAGE_SIZE = settings.CHAT_LIST_PAGE_SIZE
+HISTORY_COMPACTION = settings.CHAT_HISTORY_COMPACTION_ENABLED
+# With compaction the token ceiling, not HISTORY_LIMIT, bounds prompt history, so a turn loads
+# enough messages to reach back past the summary position (which trails by up to one fold batch).
+TURN_HISTORY_LOAD_LIMIT = (
+    max(HISTORY_LIMIT, 4, settings.CHAT_SUMMARY_KEEP_RECENT_MESSAGES + MAX_MESSAGES_PER_UPDATE)
+    if HISTORY_COMPACTION else max(HISTORY_LIMIT, 4)
+)
 GENERATION_CONFIG = settings.GENERATION_CONFIG
 CUSTOM_SAFETY_SETTINGS = settings.CUSTOM_SAFETY_SETTINGS
 VECTORSTORE_PATH = str(settings.VECTORSTORE_PATH)
 GEMINI_EMBEDDING_MODEL = settings.GEMINI_EMBEDDING_MODEL
 # Ensure GENERAL_SYSTEM_MESSAGE in settings.py also has language instruction
 GENERAL_SYSTEM_MESSAGE = settings.GENERAL_SYSTEM_MESSAGE
+ROUTER_MODE = settings.ROUTER_MODE
+LOCAL_ROUTER_MODEL_PATH = settings.LOCAL_ROUTER_MODEL_PATH
+ROUTER_DECISION_LOG_PATH = settings.ROUTER_DECISION_LOG_PATH
+ROUTER_DECISION_LOG_ENABLED = settings.ROUTER_DECISION_LOG_ENABLED
+CONCURRENT_STAGES = settings.RESPONSE_CONCURRENT_STAGES
+RAG_RETRIEVAL_K = settings.RAG_RETRIEVAL_K
+RAG_RETRIEVER_BACKEND = settings.RAG_RETRIEVER_BACKEND
+RAG_HYBRID_CANDIDATES = settings.RAG_HYBRID_CANDIDATES
 
 
 mongo_client = None
 chat_collection = None
+sessions_collection = None
+async_mongo_client = None
+async_chat_collection = None
+async_sessions_collection = None
 initialization_error = None
 vector_store = None
 rag_chain = None
 general_chat_chain = None
 router_chain = None
+local_router = None
+rag_prompt_chain = None
+rag_prompt_from_context = None
+rag_answer_chain = None
+general_prompt = None
 embeddings = None
 retriever = None
+answer_cache = None
+history_cache = None
+write_behind = None
+lexical_index = None
+vector_index = None
 rag_available = False
 direct_genai_model = None
+# Shared pool for the concurrent execution mode (history loads + speculative retrieval).
+_stage_executor = ThreadPoolExecutor(max_workers=settings.RESPONSE_STAGE_WORKERS, thread_name_prefix="chat-stage") if CONCURRENT_STAGES else None
+# Coalesces identical in-flight calls that do not depend on chat history.
+_single_flight = SingleFlight() if settings.REQUEST_COALESCING_ENABLED else None
+# Recent LLM router latencies and the pool running hedged router attempts (ROUTER_HEDGING_ENABLED).
+_router_latency = LatencyTracker(min_samples=settings.ROUTER_HEDGE_MIN_SAMPLES) if settings.ROUTER_HEDGING_ENABLED else None
+_hedge_pool = HedgePool(settings.RESPONSE_STAGE_WORKERS, thread_name_prefix="router-hedge") if settings.ROUTER_HEDGING_ENABLED else None
+# Single background writer for the routing-decision log, so turns never wait on its file I/O.
+_decision_log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="router-log") if ROUTER_DECISION_LOG_ENABLED else None
+# Single background worker that folds old turns into each chat's rolling summary.
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary") if HISTORY_COMPACTION else None
+_summary_pending = set()
+_summary_lock = threading.Lock()
+# Messages queued for write-behind but not yet in MongoDB, by chat_id, so reads stay read-your-writes.
+_pending_writes = {}
+_pending_lock = threading.Lock()
+
+
+def _record_admission_state(active: int, queued: int) -> None:
+    metrics.ADMISSION_ACTIVE.set(active)
+    metrics.ADMISSION_QUEUED.set(queued)
+
+
+# Caps concurrent model-calling turns; see admit_turn.
+admission = AdmissionController(
+    settings.ADMISSION_MAX_CONCURRENT,
+    settings.ADMISSION_QUEUE_SIZE,
+    settings.ADMISSION_MAX_WAIT_SECONDS,
+    on_change=_record_admission_state,
+) if settings.ADMISSION_CONTROL_ENABLED else None
+
+_CIRCUIT_STATE_VALUES = {OPEN: 2, HALF_OPEN: 1}
+
+
+def _record_circuit_transition(dependency: str, previous: str, state: str) -> None:
+    metrics.CIRCUIT_STATE.set(_CIRCUIT_STATE_VALUES.get(state, 0), dependency=dependency)
+    metrics.CIRCUIT_TRANSITIONS.inc(dependency=dependency, state=state)
+    log = logger.warning if state == OPEN else logger.info
+    log(f"[CIRCUIT|{dependency}] {previous} -> {state}")
+
+
+def _make_breaker(dependency: str, **kwargs) -> CircuitBreaker:
+    return CircuitBreaker(
+        dependency,
+        failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=settings.CIRCUIT_BREAKER_RESET_SECONDS,
+        on_state_change=_record_circuit_transition,
+        **kwargs,
+    )
+
+
+# One breaker per remote dependency; see _guarded. A safety block is an answer, not an outage,
+# nor is a timeout the request deadline cut short (see _timeout_error), and for MongoDB only
+# connection-level errors count (a duplicate key means the server is up).
+breakers = {
+    "gemini": _make_breaker("gemini", ignored_exceptions=(StopCandidateException, BlockedPromptException, DeadlineExceeded)),
+    "embeddings": _make_breaker("embeddings"),
+    "chroma": _make_breaker("chroma"),
+    "mongo": _make_breaker("mongo", failure_exceptions=(ConnectionFailure,)),
+} if settings.CIRCUIT_BREAKER_ENABLED else {}
+# Startup components whose outcome also feeds a breaker, so /healthz shows one view of each dependency.
+_COMPONENT_BREAKERS = {"mongo": "mongo", "model": "gemini", "embeddings": "embeddings", "vector_store": "chroma"}
+
+# Nothing above does network I/O. The components below are brought up by initialize_services(),
+# either from the background warm-up thread started in wsgi.py/asgi.py or lazily by the first
+# request that calls ensure_initialized().
+SERVICE_COMPONENTS = ("mongo", "model", "embeddings", "vector_store", "chains")
+component_status = {name: {"status": "pending", "error": None, "seconds": None} for name in SERVICE_COMPONENTS}
+_init_lock = threading.RLock()
+_init_attempted_at = None
+_init_completed = False
+_warmup_thread = None
+_reinit_thread = None
+_reinit_lock = threading.Lock()
+
+
+# --- RAG Prompt & Helpers ---
+
+rag_template = """Answer the following question using the provided context. Try to base your answer directly on the information found.
+If the context clearly doesn't contain the information needed to answer, state that the provided documents do not seem to contain the answer.
+***Importantly, present the answer in the same language as the QUESTION is asked.***
 
+CONTEXT:
+{context}
+
+QUESTION:
+{question}
+
+ANSWER:"""
+
+
+def format_docs(docs: list[Document]) -> str:
+    if not docs:
+        logger.warning("[RAG] Retriever returned NO documents for the query.")
+        return "No relevant context found in documents."
+
+    # Overlapping/adjacent chunks are merged, near-duplicates dropped and the rest packed
+    # into RAG_CONTEXT_TOKEN_BUDGET in relevance order.
+    excerpts, stats = pack_context(
+        docs,
+        token_budget=settings.RAG_CONTEXT_TOKEN_BUDGET,
+        duplicate_threshold=settings.RAG_CONTEXT_DUPLICATE_THRESHOLD,
+    )
+    metrics.RAG_CONTEXT_TOKENS.observe(stats["tokens"])
+    formatted = []
+    sources = set()
+    logger.debug(f"[RAG] Retriever returned {len(docs)} document chunks:")
+    for i, excerpt in enumerate(excerpts):
+        source_name = Path(excerpt.source).name
+        sources.add(source_name)
+        logger.debug(f"[RAG] Chunk {i+1} (Source: {source_name}, {excerpt.chunk_count} merged) Content Start:\n{excerpt.text[:300]}...\n")
+        formatted.append(f"{format_excerpt_header(excerpt, i + 1)}{excerpt.text}")
+
+    log_sources = ', '.join(sorted(list(sources))) if sources else "None"
+    logger.debug(f"[RAG] Formatted context from sources: [{log_sources}] for prompt.")
+    logger.info(
+        f"[RAG] Context packed: {stats['chunks']} chunks -> {len(excerpts)} excerpts, ~{stats['tokens']} tokens "
+        f"(merged={stats['merged']}, duplicates={stats['duplicates']}, over_budget={stats['over_budget']})."
+    )
+    return "\n\n".join(formatted)
+
+
+def _guarded(dependency: str, func, *args, **kwargs):
+    """func(*args, **kwargs) through the dependency's circuit breaker (a plain call when breakers are off)."""
+    breaker = breakers.get(dependency)
+    if breaker is None:
+        return func(*args, **kwargs)
+    return breaker.call(func, *args, **kwargs)
+
+
+async def _aguarded(dependency: str, coroutine_func, *args, **kwargs):
+    breaker = breakers.get(dependency)
+    if breaker is None:
+        return await coroutine_func(*args, **kwargs)
+    return await breaker.acall(coroutine_func, *args, **kwargs)
+
+
+def _circuit_open(dependency: str) -> bool:
+    breaker = breakers.get(dependency)
+    return breaker is not None and breaker.is_open()
+
+
+def _rag_circuit_open() -> bool:
+    """True while retrieval would fail fast anyway: the embedding API or Chroma is open-circuited."""
+    return _circuit_open("embeddings") or _circuit_open("chroma")
+
+
+def _gemini_request_options(stage: str) -> dict:
+    """Per-call timeout: what is left of the request deadline, at most GEMINI_REQUEST_TIMEOUT_SECONDS."""
+    timeout = deadlines.call_timeout(stage, settings.GEMINI_REQUEST_TIMEOUT_SECONDS)
+    return {"timeout": timeout} if timeout else {}
+
+
+def _timeout_error(stage: str, request_options: dict, error: Exception) -> Exception:
+    """
+    The exception a timed-out Gemini call raises inside the circuit breaker: DeadlineExceeded
+    (ignored by the breaker) when the request deadline shortened the timeout, since a slow
+    client says nothing about Gemini's health; the original error otherwise.
+    """
+    if request_options.get("timeout", math.inf) < settings.GEMINI_REQUEST_TIMEOUT_SECONDS:
+        return DeadlineExceeded(stage)
+    return error
+
+
+def generate_content(contents, stage: str, **kwargs):
+    """direct_genai_model.generate_content bounded by the request deadline; a timeout raises DeadlineExceeded."""
+    request_options = _gemini_request_options(stage)
+
+    def call():
+        try:
+            return direct_genai_model.generate_content(contents, request_options=request_options, **kwargs)
+        except (GeminiTimeout, TimeoutError) as e:
+            raise _timeout_error(stage, request_options, e) from e
 
-# --- MongoDB Connection ---
-try:
-    if not MONGO_URI or not MONGO_DB_NAME or not MONGO_COLLECTION_NAME:
-        raise ValueError("MongoDB configuration missing in settings.")
-    mongo_client = pymongo.MongoClient(
-                    MONGO_URI,
-                    serverSelectionTimeoutMS=5000,
-                    tls=True)
-    mongo_client.server_info()
-    mongo_db = mongo_client[MONGO_DB_NAME]
-    chat_collection = mongo_db[MONGO_COLLECTION_NAME]
-    chat_collection.create_index([("chat_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)], background=True)
-    chat_collection.create_index([("timestamp", pymongo.DESCENDING)], background=True)
-    logger.info("MongoDB connected and indexes ensured.")
-except (ConnectionFailure, ValueError, OperationFailure) as e:
-    initialization_error = f"MongoDB connection/configuration/index failed: {e}"
-    logger.error(initialization_error, exc_info=True)
-    chat_collection = None
-except Exception as e:
-    initialization_error = f"Unexpected error during MongoDB setup: {e}"
-    logger.error(initialization_error, exc_info=True)
-    chat_collection = None
-
-# --- Gemini Model Initialization ---
-if not initialization_error:
     try:
-        if not GEMINI_API_KEY: raise ValueError("GEMINI_API_KEY missing.")
-        if not TUNED_MODEL_NAME: raise ValueError("TUNED_MODEL_NAME missing.")
-        if not GEMINI_EMBEDDING_MODEL: raise ValueError("GEMINI_EMBEDDING_MODEL missing.")
+        return _guarded("gemini", call)
+    except DeadlineExceeded:
+        raise
+    except (GeminiTimeout, TimeoutError) as e:
+        raise DeadlineExceeded(stage) from e
 
-        genai.configure(api_key=GEMINI_API_KEY)
 
-        direct_genai_model = genai.GenerativeModel(
-            model_name=TUNED_MODEL_NAME,
-            generation_config=GENERATION_CONFIG,
-            safety_settings=CUSTOM_SAFETY_SETTINGS
-            )
+async def agenerate_content(contents, stage: str):
+    request_options = _gemini_request_options(stage)
 
-        logger.info("Testing direct genai model generate_content...")
-        response = direct_genai_model.generate_content("Test: Generate a short confirmation.")
-        _ = response.text
-        logger.info(f"Successfully initialized and tested direct genai model '{TUNED_MODEL_NAME}'.")
+    async def call():
+        try:
+            return await direct_genai_model.generate_content_async(contents, request_options=request_options)
+        except (GeminiTimeout, TimeoutError) as e:
+            raise _timeout_error(stage, request_options, e) from e
 
+    try:
+        return await _aguarded("gemini", call)
+    except DeadlineExceeded:
+        raise
+    except (GeminiTimeout, TimeoutError) as e:
+        raise DeadlineExceeded(stage) from e
+
+
+def invoke_direct_model_rag(prompt_value: str):
+    try:
+        response = generate_content(prompt_value, "generation")
+        return extract_response_text(response, "[RAG] Model call")
+    except (TooManyRequests, DeadlineExceeded, CircuitOpenError):
+        # Quota exhausted, out of time or model circuit open: a fallback call would only add load, so let the turn fail fast.
+        raise
     except Exception as e:
-        sdk_init_error = f"Failed to initialize or test direct genai.GenerativeModel('{TUNED_MODEL_NAME}'): {e}"
-        logger.error(sdk_init_error, exc_info=True)
-        initialization_error = sdk_init_error
-        direct_genai_model = None
+        logger.error(f"[RAG] Unexpected error invoking model during RAG: {e}", exc_info=True)
+        return f"Error during RAG generation process: {e}"
 
-# --- RAG Setup ---
-if not initialization_error and direct_genai_model and os.path.exists(VECTORSTORE_PATH):
-    if not os.listdir(VECTORSTORE_PATH):
-         logger.warning(f"Vector store path '{VECTORSTORE_PATH}' exists but is empty. RAG IS DISABLED.")
-         rag_available = False
-    else:
-        try:
-            logger.info("[RAG] Initializing RAG components...")
-            logger.debug(f"[RAG] Loading embeddings model: {GEMINI_EMBEDDING_MODEL}")
-            embeddings = GoogleGenerativeAIEmbeddings(
-                model=GEMINI_EMBEDDING_MODEL,
-                google_api_key=GEMINI_API_KEY
-            )
-            _ = embeddings.embed_query("test embedding")
-            logger.info("[RAG] Embeddings model loaded and tested.")
 
-            logger.debug(f"[RAG] Loading vector store from: {VECTORSTORE_PATH}")
-            vector_store = Chroma(
-                persist_directory=VECTORSTORE_PATH,
-                embedding_function=embeddings
-            )
-            collection_count = vector_store._collection.count()
-            logger.info(f"[RAG] Chroma collection count: {collection_count}")
-            if collection_count == 0:
-                logger.warning(f"[RAG] Vector store at '{VECTORSTORE_PATH}' loaded but returned 0 documents via count. RAG disabled.")
-                rag_available = False
+async def ainvoke_direct_model_rag(prompt_value: str):
+    try:
+        response = await agenerate_content(prompt_value, "generation")
+        return extract_response_text(response, "[RAG] Async model call")
+    except (TooManyRequests, DeadlineExceeded, CircuitOpenError):
+        raise
+    except Exception as e:
+        logger.error(f"[RAG] Unexpected error invoking model asynchronously during RAG: {e}", exc_info=True)
+        return f"Error during RAG generation process: {e}"
+
+
+def log_final_rag_prompt(prompt_str: str) -> str:
+    logger.debug(f"[RAG] Final combined prompt string being sent to LLM:\n--- START RAG PROMPT ---\n{prompt_str}\n--- END RAG PROMPT ---")
+    return prompt_str
+
+
+# --- Direct Model Helpers ---
+
+def prompt_value_to_genai_history(prompt_value: ChatPromptValue) -> list:
+    """Converts a LangChain chat prompt into the Gemini `contents` history format."""
+    history_for_api = []
+    for msg in prompt_value.to_messages():
+        role = "user" if isinstance(msg, HumanMessage) else "model"
+        if isinstance(msg, SystemMessage):
+            # System instruction handled via settings.py and potentially model tuning
+            logger.debug(f"General/Router extracted system instruction (first 100 chars): {msg.content[:100]}...")
+            # Check if GENERAL_SYSTEM_MESSAGE already contains language instruction
+            if "respond in the same language" not in msg.content.lower():
+                logger.warning("GENERAL_SYSTEM_MESSAGE in settings.py might be missing language instruction!")
+            continue
+        if msg.content:
+            history_for_api.append({'role': role, 'parts': [msg.content]})
+    return history_for_api
+
+
+def extract_response_text(response, log_prefix: str) -> str:
+    """Returns the text of a Gemini response, or an 'Error: ...' string if it was blocked or cut off."""
+    if not response.candidates:
+        block_reason = response.prompt_feedback.block_reason if response.prompt_feedback else 'Unknown'
+        safety_ratings = response.prompt_feedback.safety_ratings if response.prompt_feedback else 'None'
+        logger.warning(f"{log_prefix} returned no candidates. Block Reason: {block_reason}. Ratings: {safety_ratings}")
+        if block_reason != HarmBlockThreshold.BLOCK_REASON_UNSPECIFIED:
+             metrics.SAFETY_BLOCKS.inc(where="prompt")
+             return f"Error: Response blocked due to safety settings (Reason: {block_reason})."
+        return "Error: Model returned no response (Reason unknown)."
+    try:
+        return response.text
+    except ValueError as ve:
+        finish_reason = response.candidates[0].finish_reason
+        safety_ratings = response.candidates[0].safety_ratings
+        logger.warning(f"{log_prefix} failed accessing .text (ValueError: {ve}). Finish Reason: {finish_reason}. Safety: {safety_ratings}")
+        if getattr(finish_reason, "name", str(finish_reason)) == "SAFETY":
+            metrics.SAFETY_BLOCKS.inc(where="response")
+        return f"Error: Response generation stopped prematurely (Reason: {finish_reason})."
+    except StopCandidateException as sce:
+        logger.warning(f"{log_prefix} stopped by StopCandidateException: {sce}")
+        metrics.SAFETY_BLOCKS.inc(where="response")
+        return f"Error: Response generation stopped (Reason: {sce})"
+
+
+class StreamFailed(RuntimeError):
+    """A streamed answer failed part-way (or before its first chunk); the message is shown to the user."""
+
+
+def _checked_stream(stream):
+    """Passes chunks through, raising StreamFailed on the 'Error...' chunk stream_direct_model ends with."""
+    for chunk in stream:
+        if chunk.startswith("Error"):
+            raise StreamFailed(chunk)
+        yield chunk
+
+
+def stream_direct_model(contents, log_prefix: str):
+    """
+    Streams a Gemini generation, yielding text chunks as they arrive.
+    Errors are yielded as a final 'Error: ...' chunk, mirroring the non-streaming invokers.
+    """
+    try:
+        response = generate_content(contents, "generation", stream=True)
+        yielded_any = False
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError as ve:
+                finish_reason = chunk.candidates[0].finish_reason if chunk.candidates else 'Unknown'
+                logger.warning(f"{log_prefix} Streamed chunk has no text (ValueError: {ve}). Finish Reason: {finish_reason}")
+                if getattr(finish_reason, "name", str(finish_reason)) == "SAFETY":
+                    metrics.SAFETY_BLOCKS.inc(where="response")
+                yield f"Error: Response generation stopped prematurely (Reason: {finish_reason})."
+                return
+            if text:
+                yielded_any = True
+                yield text
+
+        if not yielded_any:
+            block_reason = response.prompt_feedback.block_reason if response.prompt_feedback else 'Unknown'
+            logger.warning(f"{log_prefix} Streaming model call produced no text. Block Reason: {block_reason}")
+            if block_reason and block_reason != HarmBlockThreshold.BLOCK_REASON_UNSPECIFIED:
+                metrics.SAFETY_BLOCKS.inc(where="prompt")
+                yield f"Error: Response blocked due to safety settings (Reason: {block_reason})."
             else:
-                logger.info(f"[RAG] Vector store loaded successfully with ~{collection_count} items.")
-                retriever = vector_store.as_retriever(
-                    search_type="similarity",
-                    search_kwargs={"k": 5}
-                )
-                logger.info(f"[RAG] Retriever created (search_type=similarity, search_kwargs={{'k': 5}}).")
+                yield "Error: Model returned no response (Reason unknown)."
+    except (StopCandidateException, BlockedPromptException) as sce:
+        logger.warning(f"{log_prefix} Streaming response stopped by safety filter: {sce}")
+        metrics.SAFETY_BLOCKS.inc(where="response")
+        yield f"Error: Response generation stopped (Reason: {sce})"
+    except (TooManyRequests, DeadlineExceeded, CircuitOpenError):
+        raise
+    except (GeminiTimeout, TimeoutError) as e:
+        raise DeadlineExceeded("generation") from e
+    except Exception as e:
+        logger.error(f"{log_prefix} Unexpected error while streaming from model: {e}", exc_info=True)
+        yield f"Error during streaming generation: {e}"
 
-                # --- MODIFIED: Added language instruction to RAG Prompt ---
-                rag_template = """Answer the following question using the provided context. Try to base your answer directly on the information found.
-If the context clearly doesn't contain the information needed to answer, state that the provided documents do not seem to contain the answer.
-***Importantly, present the answer in the same language as the QUESTION is asked.***
 
-CONTEXT:
-{context}
+# --- General Chat & Router Helpers ---
 
-QUESTION:
-{question}
+def invoke_direct_model_general(prompt_value: ChatPromptValue):
+    """Invokes the direct Gemini model for General Chat/Router, handling history format."""
+    try:
+        history_for_api = prompt_value_to_genai_history(prompt_value)
 
-ANSWER:"""
-                # ----------------------------------------------------------
-                rag_prompt = PromptTemplate.from_template(rag_template)
-                logger.info("[RAG] Using RAG prompt with language instruction.") # Updated log message
-
-                # --- format_docs function (keep as before) ---
-                def format_docs(docs: list[Document]) -> str:
-                    if not docs:
-                        logger.warning("[RAG] Retriever returned NO documents for the query.")
-                        return "No relevant context found in documents."
-
-                    formatted = []
-                    sources = set()
-                    logger.debug(f"[RAG] Retriever returned {len(docs)} document chunks:")
-                    for i, doc in enumerate(docs):
-                        source_name = Path(doc.metadata.get('source', 'Unknown Source')).name
-                        sources.add(source_name)
-                        prefix = f"--- Context from: {source_name} (Chunk {i+1}) ---\n"
-                        chunk_content = doc.page_content
-                        logger.debug(f"[RAG] Chunk {i+1} (Source: {source_name}) Content Start:\n{chunk_content[:300]}...\n")
-                        formatted.append(f"{prefix}{chunk_content}")
-
-                    log_sources = ', '.join(sorted(list(sources))) if sources else "None"
-                    logger.debug(f"[RAG] Formatted context from sources: [{log_sources}] for prompt.")
-                    return "\n\n".join(formatted)
-
-                # --- invoke_direct_model_rag function (keep as before) ---
-                def invoke_direct_model_rag(prompt_value: str):
-                    try:
-                        response = direct_genai_model.generate_content(prompt_value)
-
-                        if not response.candidates:
-                            block_reason = response.prompt_feedback.block_reason if response.prompt_feedback else 'Unknown'
-                            safety_ratings = response.prompt_feedback.safety_ratings if response.prompt_feedback else 'None'
-                            logger.warning(f"[RAG] Model call returned no candidates. Block Reason: {block_reason}. Ratings: {safety_ratings}")
-                            if block_reason != HarmBlockThreshold.BLOCK_REASON_UNSPECIFIED:
-                                 return f"Error: Response blocked due to safety settings (Reason: {block_reason})."
-                            return "Error: Model returned no response (Reason unknown)."
-                        try:
-                            return response.text
-                        except ValueError as ve:
-                             finish_reason = 'Unknown'
-                             safety_ratings = 'Unknown'
-                             if response.candidates:
-                                finish_reason = response.candidates[0].finish_reason
-                                safety_ratings = response.candidates[0].safety_ratings
-                             logger.warning(f"[RAG] Model call failed accessing .text (ValueError: {ve}). Finish Reason: {finish_reason}. Safety: {safety_ratings}")
-                             return f"Error: Response generation stopped prematurely (Reason: {finish_reason})."
-                        except StopCandidateException as sce:
-                             logger.warning(f"[RAG] Response generation stopped by StopCandidateException: {sce}")
-                             return f"Error: Response generation stopped (Reason: {sce})"
-
-                    except Exception as e:
-                        logger.error(f"[RAG] Unexpected error invoking model during RAG: {e}", exc_info=True)
-                        return f"Error during RAG generation process: {e}"
-
-                # --- log_final_rag_prompt function (keep as before) ---
-                def log_final_rag_prompt(prompt_str: str) -> str:
-                    logger.debug(f"[RAG] Final combined prompt string being sent to LLM:\n--- START RAG PROMPT ---\n{prompt_str}\n--- END RAG PROMPT ---")
-                    return prompt_str
-
-                # --- RAG Chain Definition (keep as before) ---
-                rag_chain = (
-                    {"context": retriever | format_docs, "question": RunnablePassthrough()}
-                    | rag_prompt
-                    | RunnableLambda(lambda prompt_value: prompt_value.to_string())
-                    | RunnableLambda(log_final_rag_prompt)
-                    | RunnableLambda(invoke_direct_model_rag)
-                )
-                rag_available = True
-                logger.info("[RAG] RAG chain created with language instruction, similarity retriever, and enhanced logging. RAG IS ENABLED.") # Updated log message
+        if not history_for_api:
+             logger.error("Cannot generate response: No valid user/model messages found after processing prompt.")
+             return "Error: Cannot generate response without valid input message(s)."
 
-        except Exception as e:
-            rag_init_error = f"[RAG] RAG component initialization failed: {e}"
-            logger.error(rag_init_error, exc_info=True)
-            vector_store = retriever = embeddings = rag_chain = None
-            rag_available = False
-            if not initialization_error: initialization_error = rag_init_error
+        logger.debug(f"Invoking direct model (General/Router) with {len(history_for_api)} history entries.")
 
-elif not initialization_error and direct_genai_model:
-     logger.warning(f"Vector store path '{VECTORSTORE_PATH}' does not exist. RAG IS DISABLED.")
-     rag_available = False
+        response = generate_content(
+            history_for_api,
+            "model_call",
+            # system_instruction=... # Typically not used directly here with Gemini history format
+        )
+        return extract_response_text(response, "General/Router direct model call")
+
+    except (TooManyRequests, DeadlineExceeded, CircuitOpenError):
+        raise
+    except Exception as e:
+        logger.error(f"Error invoking direct model (General/Router): {e}", exc_info=True)
+        return f"Error during generation: {e}"
 
 
-# --- General Chat & Router Setup ---
-if direct_genai_model:
+async def ainvoke_direct_model_general(prompt_value: ChatPromptValue):
+    """Async counterpart of invoke_direct_model_general, used by chain.ainvoke on the ASGI path."""
     try:
-        def invoke_direct_model_general(prompt_value: ChatPromptValue):
-            """Invokes the direct Gemini model for General Chat/Router, handling history format."""
-            try:
-                langchain_messages = prompt_value.to_messages()
-                history_for_api = []
-                system_instruction = None
-
-                for msg in langchain_messages:
-                    role = "user" if isinstance(msg, HumanMessage) else "model"
-                    if isinstance(msg, SystemMessage):
-                         system_instruction = msg.content
-                         logger.debug(f"General/Router extracted system instruction (first 100 chars): {system_instruction[:100]}...")
-                         # Check if GENERAL_SYSTEM_MESSAGE already contains language instruction
-                         if "respond in the same language" not in system_instruction.lower():
-                             logger.warning("GENERAL_SYSTEM_MESSAGE in settings.py might be missing language instruction!")
-                         continue
-                    if msg.content:
-                        history_for_api.append({'role': role, 'parts': [msg.content]})
-
-                if not history_for_api:
-                     logger.error("Cannot generate response: No valid user/model messages found after processing prompt.")
-                     return "Error: Cannot generate response without valid input message(s)."
-
-                if system_instruction:
-                    # System instruction handled via settings.py and potentially model tuning
-                    logger.debug("System instruction provided via settings.py/prompt template.")
-
-                logger.debug(f"Invoking direct model (General/Router) with {len(history_for_api)} history entries.")
-
-                response = direct_genai_model.generate_content(
-                    history_for_api,
-                    # system_instruction=... # Typically not used directly here with Gemini history format
-                )
+        history_for_api = prompt_value_to_genai_history(prompt_value)
 
-                if not response.candidates:
-                    block_reason = response.prompt_feedback.block_reason if response.prompt_feedback else 'Unknown'
-                    safety_ratings = response.prompt_feedback.safety_ratings if response.prompt_feedback else 'None'
-                    logger.warning(f"General/Router direct model call returned no candidates. Block Reason: {block_reason}. Ratings: {safety_ratings}")
-                    if block_reason != HarmBlockThreshold.BLOCK_REASON_UNSPECIFIED:
-                         return f"Error: Response blocked due to safety settings (Reason: {block_reason})."
-                    return "Error: Model returned no response (Reason unknown)."
-                try:
-                     return response.text
-                except ValueError as ve:
-                     finish_reason = 'Unknown'
-                     safety_ratings = 'Unknown'
-                     if response.candidates:
-                        finish_reason = response.candidates[0].finish_reason
-                        safety_ratings = response.candidates[0].safety_ratings
-                     logger.warning(f"General/Router direct model call failed accessing .text (ValueError: {ve}). Finish Reason: {finish_reason}. Safety: {safety_ratings}")
-                     return f"Error: Response generation stopped prematurely (Reason: {finish_reason})."
-                except StopCandidateException as sce:
-                     logger.warning(f"General/Router response generation stopped by StopCandidateException: {sce}")
-                     return f"Error: Response generation stopped (Reason: {sce})"
-
-            except Exception as e:
-                logger.error(f"Error invoking direct model (General/Router): {e}", exc_info=True)
-                return f"Error during generation: {e}"
-
-        # --- Router Chain (keep as before) ---
-        router_template = """Classify the user's query. Your goal is to decide if the query requires searching specific documents for a factual answer.
+        if not history_for_api:
+             logger.error("Cannot generate response: No valid user/model messages found after processing prompt.")
+             return "Error: Cannot generate response without valid input message(s)."
+
+        logger.debug(f"Invoking direct model asynchronously (General/Router) with {len(history_for_api)} history entries.")
+        response = await agenerate_content(history_for_api, "model_call")
+        return extract_response_text(response, "General/Router async direct model call")
+
+    except (TooManyRequests, DeadlineExceeded, CircuitOpenError):
+        raise
+    except Exception as e:
+        logger.error(f"Error invoking direct model asynchronously (General/Router): {e}", exc_info=True)
+        return f"Error during generation: {e}"
+
+
+router_template = """Classify the user's query. Your goal is to decide if the query requires searching specific documents for a factual answer.
 
 Output only 'SEARCH_DOCS' if the query asks for specific factual details, definitions, steps, criteria, data, or information likely found within uploaded documents (such as educational standards, curriculum details, project specifications, user guides, procedures, reports). Examples of queries needing SEARCH_DOCS: "What are the criteria for X?", "List the steps for Y.", "Define Z according to the standard document.", "What does document A say about topic B?".
 
@@ -306,51 +520,460 @@ Chat History:
 
 User Query: {query}
 Classification:"""
-        router_prompt = ChatPromptTemplate.from_template(router_template)
-
-        class DecisionParser(StrOutputParser):
-             def parse(self, text: str) -> str:
-                cleaned = super().parse(text).strip().upper()
-                logger.debug(f"Router raw output: '{text}', Cleaned Classification: '{cleaned}'")
-                if "SEARCH_DOCS" in cleaned:
-                    return "SEARCH_DOCS"
-                elif "GENERAL_CHAT" in cleaned:
-                    return "GENERAL_CHAT"
-                else:
-                    logger.warning(f"Router classification uncertain ('{cleaned}'). Defaulting to GENERAL_CHAT.")
-                    return "GENERAL_CHAT"
 
-        router_chain = (
-             router_prompt
-             | RunnableLambda(invoke_direct_model_general)
-             | DecisionParser()
+
+class DecisionParser(StrOutputParser):
+     def parse(self, text: str) -> str:
+        cleaned = super().parse(text).strip().upper()
+        logger.debug(f"Router raw output: '{text}', Cleaned Classification: '{cleaned}'")
+        if "SEARCH_DOCS" in cleaned:
+            return "SEARCH_DOCS"
+        elif "GENERAL_CHAT" in cleaned:
+            return "GENERAL_CHAT"
+        else:
+            logger.warning(f"Router classification uncertain ('{cleaned}'). Defaulting to GENERAL_CHAT.")
+            return "GENERAL_CHAT"
+
+
+# --- Component Initialization ---
+
+def _set_component_status(name: str, status: str, error: str = None, seconds: float = None) -> None:
+    component_status[name] = {"status": status, "error": error, "seconds": seconds}
+
+
+def _init_mongo() -> None:
+    """Connects MongoDB, ensures indexes and sets up the history cache."""
+    global mongo_client, chat_collection, sessions_collection, async_mongo_client, async_chat_collection
+    global async_sessions_collection, history_cache, write_behind
+    if not MONGO_URI or not MONGO_DB_NAME or not MONGO_COLLECTION_NAME:
+        raise ValueError("MongoDB configuration missing in settings.")
+    use_mongomock = MONGO_URI.startswith("mongomock://")
+    try:
+        if use_mongomock:
+            import mongomock
+            mongo_client = mongomock.MongoClient()
+            logger.warning("Using the in-process mongomock stand-in for MongoDB; data is not persisted.")
+        else:
+            mongo_client = pymongo.MongoClient(
+                            MONGO_URI,
+                            serverSelectionTimeoutMS=5000,
+                            tls=settings.MONGO_TLS)
+        mongo_client.server_info()
+        mongo_db = mongo_client[MONGO_DB_NAME]
+        collection = mongo_db[MONGO_COLLECTION_NAME]
+        collection.create_index([("chat_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)], background=True)
+        collection.create_index([("timestamp", pymongo.DESCENDING)], background=True)
+        sessions = mongo_db[MONGO_SESSIONS_COLLECTION_NAME]
+        ensure_session_indexes(sessions)
+        sessions_collection = sessions
+        chat_collection = collection
+        logger.info("MongoDB connected and indexes ensured.")
+    except (ConnectionFailure, OperationFailure) as e:
+        raise ConnectionError(f"MongoDB connection/configuration/index failed: {e}") from e
+
+    if AsyncIOMotorClient is not None and not use_mongomock:
+        # Motor connects lazily on first use, so this does no network I/O.
+        async_mongo_client = AsyncIOMotorClient(
+                    MONGO_URI,
+                    serverSelectionTimeoutMS=5000,
+                    tls=settings.MONGO_TLS)
+        async_chat_collection = async_mongo_client[MONGO_DB_NAME][MONGO_COLLECTION_NAME]
+        async_sessions_collection = async_mongo_client[MONGO_DB_NAME][MONGO_SESSIONS_COLLECTION_NAME]
+        logger.info("Async MongoDB (motor) client created.")
+
+    if settings.CHAT_HISTORY_CACHE_ENABLED:
+        # Must hold at least the chat history limit plus the router's 4 messages to serve a turn.
+        history_cache = ChatHistoryCache(
+            "chat_history",
+            capacity=max(settings.CHAT_HISTORY_CACHE_MESSAGES, HISTORY_LIMIT, 4),
+            ttl_seconds=settings.CHAT_HISTORY_CACHE_TTL_SECONDS,
+        )
+        logger.info(f"Chat history cache enabled (capacity={history_cache.capacity} messages/chat).")
+
+    if settings.CHAT_WRITE_BEHIND_ENABLED and write_behind is None:
+        write_behind = WriteBehindQueue(
+            _flush_turns,
+            max_size=settings.CHAT_WRITE_BEHIND_QUEUE_SIZE,
+            batch_size=settings.CHAT_WRITE_BEHIND_BATCH_SIZE,
+            flush_interval=settings.CHAT_WRITE_BEHIND_FLUSH_INTERVAL,
+            max_retries=settings.CHAT_WRITE_BEHIND_MAX_RETRIES,
+            dead_letter_path=settings.CHAT_WRITE_BEHIND_DEAD_LETTER_PATH,
+            on_discard=_discard_turns,
+            # While MongoDB is open-circuited the queue holds its batches instead of burning retries.
+            gate=lambda: not _circuit_open("mongo"),
+            name="chat-write-behind",
+        )
+        atexit.register(write_behind.close)
+        logger.info(f"Write-behind persistence enabled (batch={settings.CHAT_WRITE_BEHIND_BATCH_SIZE}, "
+                    f"interval={settings.CHAT_WRITE_BEHIND_FLUSH_INTERVAL}s).")
+
+
+def _init_model() -> None:
+    global direct_genai_model
+    if settings.LLM_BACKEND == "fake":
+        direct_genai_model = FakeGenerativeModel(
+            first_token_latency=settings.FAKE_LLM_FIRST_TOKEN_LATENCY,
+            output_tokens=settings.FAKE_LLM_OUTPUT_TOKENS,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            rag_fraction=settings.FAKE_ROUTER_RAG_FRACTION,
+            seed=settings.FAKE_SEED,
+        )
+        logger.warning("LLM_BACKEND=fake: using the deterministic fake Gemini model. Responses are synthetic.")
+        return
+    if not GEMINI_API_KEY: raise ValueError("GEMINI_API_KEY missing.")
+    if not TUNED_MODEL_NAME: raise ValueError("TUNED_MODEL_NAME missing.")
+    if not GEMINI_EMBEDDING_MODEL: raise ValueError("GEMINI_EMBEDDING_MODEL missing.")
+
+    genai.configure(api_key=GEMINI_API_KEY)
+
+    model = genai.GenerativeModel(
+        model_name=TUNED_MODEL_NAME,
+        generation_config=GENERATION_CONFIG,
+        safety_settings=CUSTOM_SAFETY_SETTINGS
+        )
+
+    if settings.SERVICE_STARTUP_SELF_TEST:
+        logger.info("Testing direct genai model generate_content...")
+        response = model.generate_content("Test: Generate a short confirmation.")
+        _ = response.text
+    direct_genai_model = model
+    logger.info(f"Successfully initialized direct genai model '{TUNED_MODEL_NAME}' (self-test={'on' if settings.SERVICE_STARTUP_SELF_TEST else 'off'}).")
+
+
+def _rag_disabled_reason():
+    """Why RAG cannot be set up from the vector store on disk, or None if it can."""
+    if not os.path.exists(VECTORSTORE_PATH):
+        return f"Vector store path '{VECTORSTORE_PATH}' does not exist. RAG IS DISABLED."
+    if not os.listdir(VECTORSTORE_PATH):
+        return f"Vector store path '{VECTORSTORE_PATH}' exists but is empty. RAG IS DISABLED."
+    return None
+
+
+def _init_embeddings() -> None:
+    global embeddings
+    logger.debug(f"[RAG] Loading embeddings model: {GEMINI_EMBEDDING_MODEL}")
+    if settings.LLM_BACKEND == "fake":
+        embeddings_model = FakeEmbeddings(
+            dimension=settings.FAKE_EMBEDDING_DIMENSION,
+            latency=settings.FAKE_EMBEDDING_LATENCY,
+            seed=settings.FAKE_SEED,
+        )
+        # Fake vectors must never be served as real ones from the shared embedding cache.
+        cache_model_name = f"fake-{settings.FAKE_EMBEDDING_DIMENSION}-{settings.FAKE_SEED}"
+    else:
+        embeddings_model = GoogleGenerativeAIEmbeddings(
+            model=GEMINI_EMBEDDING_MODEL,
+            google_api_key=GEMINI_API_KEY
+        )
+        cache_model_name = GEMINI_EMBEDDING_MODEL
+    if settings.EMBEDDING_CACHE_ENABLED:
+        embeddings_model = CachedEmbeddings(
+            embeddings_model,
+            cache_model_name,
+            db_path=settings.EMBEDDING_CACHE_PATH,
+            memory_size=settings.EMBEDDING_CACHE_MEMORY_SIZE,
+        )
+        logger.debug(f"[RAG] Embedding cache enabled at '{settings.EMBEDDING_CACHE_PATH}'.")
+    if settings.SERVICE_STARTUP_SELF_TEST:
+        _ = embeddings_model.embed_query("test embedding")
+    embeddings = embeddings_model
+    logger.info("[RAG] Embeddings model loaded.")
+
+
+def _init_mmap_vector_index() -> bool:
+    """Opens the memory-mapped vector index instead of Chroma. Returns False if it is missing or empty."""
+    global vector_index, retriever
+    handle = MmapVectorIndexHandle(VECTORSTORE_PATH)
+    index = handle.get()
+    if index is None:
+        logger.warning(f"[RAG] No exported vector matrix in '{VECTORSTORE_PATH}'; falling back to Chroma. Re-run build_rag_index to export it.")
+        return False
+    if len(index) == 0:
+        logger.warning(f"[RAG] Memory-mapped vector index in '{VECTORSTORE_PATH}' is empty.")
+        return False
+    vector_index = handle
+    retriever = RunnableLambda(lambda query: retrieve_documents(query)[1])
+    logger.info(f"[RAG] Memory-mapped vector index ready with {len(index)} items (exact search, k={RAG_RETRIEVAL_K}).")
+    return True
+
+
+def _init_vector_store() -> bool:
+    """Opens the vector index (Chroma or mmap), the retriever and the answer cache. Returns False if it is empty."""
+    global vector_store, retriever, answer_cache, lexical_index
+    if not (RAG_RETRIEVER_BACKEND == "mmap" and _init_mmap_vector_index()):
+        logger.debug(f"[RAG] Loading vector store from: {VECTORSTORE_PATH}")
+        store = Chroma(
+            persist_directory=VECTORSTORE_PATH,
+            embedding_function=embeddings
         )
-        logger.info("Router chain created.")
-
-        # --- General Chat Chain (keep as before) ---
-        # Ensure GENERAL_SYSTEM_MESSAGE in settings.py includes language instructions
-        general_prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content=GENERAL_SYSTEM_MESSAGE),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{query}")
-        ])
-
-        general_chat_chain = (
-             general_prompt
-             | RunnableLambda(invoke_direct_model_general)
+        collection_count = store._collection.count()
+        logger.info(f"[RAG] Chroma collection count: {collection_count}")
+        if collection_count == 0:
+            logger.warning(f"[RAG] Vector store at '{VECTORSTORE_PATH}' loaded but returned 0 documents via count. RAG disabled.")
+            return False
+
+        logger.info(f"[RAG] Vector store loaded successfully with ~{collection_count} items.")
+        vector_store = store
+        retriever = vector_store.as_retriever(
+            search_type="similarity",
+            search_kwargs={"k": RAG_RETRIEVAL_K}
         )
-        logger.info("General chat chain created.")
+        logger.info(f"[RAG] Retriever created (search_type=similarity, search_kwargs={{'k': {RAG_RETRIEVAL_K}}}).")
 
+    if settings.RAG_HYBRID_SEARCH_ENABLED:
+        lexical_index = LexicalIndexHandle(
+            os.path.join(VECTORSTORE_PATH, LEXICAL_INDEX_FILENAME),
+            max_postings_per_term=settings.RAG_LEXICAL_MAX_POSTINGS,
+        )
+        if lexical_index.get() is None:
+            logger.warning("[RAG] Lexical index not found; retrieval is vector-only until build_rag_index writes it.")
+
+    if settings.ANSWER_CACHE_ENABLED and settings.LLM_BACKEND == "fake":
+        logger.warning("[RAG] LLM_BACKEND=fake: semantic answer cache disabled so synthetic answers are never stored.")
+    elif settings.ANSWER_CACHE_ENABLED:
+        try:
+            answer_cache = SemanticAnswerCache(
+                settings.ANSWER_CACHE_PATH,
+                VECTORSTORE_PATH,
+                similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+                max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            )
+        except Exception as e:
+            logger.error(f"[RAG] Failed to open semantic answer cache, continuing without it: {e}", exc_info=True)
+            answer_cache = None
+    return True
+
+
+def _init_chains() -> None:
+    """Builds the RAG chains (when the vector store is up), the router and the general chat chain."""
+    global rag_prompt_from_context, rag_prompt_chain, rag_chain, rag_answer_chain, rag_available
+    global router_chain, local_router, general_prompt, general_chat_chain
+
+    if retriever is not None:
+        rag_prompt = PromptTemplate.from_template(rag_template)
+        # The prompt part is kept separately so stream_response can build the
+        # prompt and then stream the generation itself.
+        # rag_answer_chain takes already-retrieved context, so get_response can run
+        # retrieval separately (and speculatively) from generation.
+        rag_prompt_from_context = (
+            rag_prompt
+            | RunnableLambda(lambda prompt_value: prompt_value.to_string())
+            | RunnableLambda(log_final_rag_prompt)
+        )
+        rag_prompt_chain = (
+            {"context": retriever | format_docs, "question": RunnablePassthrough()}
+            | rag_prompt_from_context
+        )
+        rag_model_step = RunnableLambda(invoke_direct_model_rag, afunc=ainvoke_direct_model_rag)
+        rag_chain = rag_prompt_chain | rag_model_step
+        rag_answer_chain = rag_prompt_from_context | rag_model_step
+        rag_available = True
+        logger.info("[RAG] RAG chain created with language instruction, similarity retriever, and enhanced logging. RAG IS ENABLED.")
+
+    router_prompt = ChatPromptTemplate.from_template(router_template)
+    router_chain = (
+         router_prompt
+         | RunnableLambda(invoke_direct_model_general, afunc=ainvoke_direct_model_general)
+         | DecisionParser()
+    )
+    logger.info("Router chain created.")
+
+    # --- Local Router (optional) ---
+    if ROUTER_MODE == "local":
+        try:
+            router_model = None
+            if os.path.exists(LOCAL_ROUTER_MODEL_PATH):
+                router_model = NaiveBayesRouterModel.load(LOCAL_ROUTER_MODEL_PATH)
+                logger.info(f"Local router model loaded from '{LOCAL_ROUTER_MODEL_PATH}' ({router_model.sample_count} training samples).")
+            else:
+                logger.warning(f"Local router model '{LOCAL_ROUTER_MODEL_PATH}' not found. Run 'manage.py train_local_router' once routing decisions are logged.")
+
+            similarity_fn = None
+            if settings.LOCAL_ROUTER_USE_SIMILARITY and rag_available and vector_index is not None:
+                def similarity_fn(query: str):
+                    index = vector_index.get()
+                    hits = index.search(embeddings.embed_query(query), 1) if index is not None else []
+                    # Same relevance mapping LangChain applies to Chroma's L2 distances.
+                    return 1.0 - hits[0][1] / math.sqrt(2) if hits else None
+            elif settings.LOCAL_ROUTER_USE_SIMILARITY and rag_available and vector_store is not None:
+                def similarity_fn(query: str):
+                    hits = vector_store.similarity_search_with_relevance_scores(query, k=1)
+                    return hits[0][1] if hits else None
+
+            if router_model is not None or similarity_fn is not None:
+                local_router = LocalRouter(
+                    model=router_model,
+                    min_confidence=settings.LOCAL_ROUTER_MIN_CONFIDENCE,
+                    similarity_fn=similarity_fn,
+                )
+                logger.info(f"Local router enabled (min_confidence={settings.LOCAL_ROUTER_MIN_CONFIDENCE}, similarity={'on' if similarity_fn else 'off'}). LLM router is the fallback.")
+        except Exception as e:
+            logger.error(f"Failed to set up local router, using LLM router only: {e}", exc_info=True)
+            local_router = None
+
+    # Ensure GENERAL_SYSTEM_MESSAGE in settings.py includes language instructions
+    general_prompt = ChatPromptTemplate.from_messages([
+        SystemMessage(content=GENERAL_SYSTEM_MESSAGE),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("human", "{query}")
+    ])
+    general_chat_chain = (
+         general_prompt
+         | RunnableLambda(invoke_direct_model_general, afunc=ainvoke_direct_model_general)
+    )
+    logger.info("General chat chain created.")
+
+
+def _run_component(name: str, init_func) -> bool:
+    """Runs one component initializer unless it is already up, recording its status. Returns success."""
+    if component_status[name]["status"] in ("ready", "disabled"):
+        return True
+    _set_component_status(name, "initializing")
+    started_at = time.perf_counter()
+    try:
+        result = init_func()
     except Exception as e:
-         chain_init_error = f"Failed to create router/general chain: {e}"
-         logger.error(chain_init_error, exc_info=True)
-         router_chain = general_chat_chain = None
-         if not initialization_error: initialization_error = chain_init_error
+        error = f"{name} initialization failed: {e}"
+        logger.error(error, exc_info=True)
+        _set_component_status(name, "failed", error, time.perf_counter() - started_at)
+        _record_component_outcome(name, failed=True)
+        return False
+    _set_component_status(name, "disabled" if result is False else "ready", None, time.perf_counter() - started_at)
+    _record_component_outcome(name, failed=False)
+    return True
 
-elif not initialization_error:
-    initialization_error = initialization_error or "Core chat model (direct genai) failed initialization."
-    logger.error(f"Cannot create chains because core model initialization failed: {initialization_error}")
-    router_chain = general_chat_chain = None
+
+def _record_component_outcome(name: str, failed: bool) -> None:
+    breaker = breakers.get(_COMPONENT_BREAKERS.get(name))
+    if breaker is None:
+        return
+    if failed:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _reset_rag_components() -> None:
+    global vector_store, retriever, embeddings, rag_chain, rag_prompt_chain, rag_answer_chain
+    global rag_prompt_from_context, answer_cache, rag_available
+    global lexical_index, vector_index
+    vector_store = retriever = embeddings = rag_chain = rag_prompt_chain = rag_answer_chain = rag_prompt_from_context = answer_cache = None
+    lexical_index = vector_index = None
+    rag_available = False
+
+
+def initialize_services() -> None:
+    """
+    Brings up every component in dependency order (mongo, model, embeddings, vector store, chains),
+    skipping those already up, and sets initialization_error from the first failure.
+    """
+    global initialization_error, _init_attempted_at, _init_completed
+    with _init_lock:
+        _init_attempted_at = time.monotonic()
+        started_at = time.perf_counter()
+        errors = []
+        if not _run_component("mongo", _init_mongo):
+            errors.append(component_status["mongo"]["error"])
+        if not errors and _run_component("model", _init_model):
+            disabled_reason = _rag_disabled_reason()
+            if disabled_reason:
+                logger.warning(disabled_reason)
+                _set_component_status("embeddings", "disabled", disabled_reason)
+                _set_component_status("vector_store", "disabled", disabled_reason)
+            elif not (_run_component("embeddings", _init_embeddings) and _run_component("vector_store", _init_vector_store)):
+                failed = "embeddings" if component_status["embeddings"]["status"] == "failed" else "vector_store"
+                errors.append(f"[RAG] RAG component initialization failed: {component_status[failed]['error']}")
+                _reset_rag_components()
+                _set_component_status("embeddings", "pending")
+            # Chains are cheap to build and depend on whether RAG came up, so they are rebuilt every attempt.
+            _set_component_status("chains", "pending")
+            if not _run_component("chains", _init_chains):
+                errors.append(f"Failed to create router/general chain: {component_status['chains']['error']}")
+        elif not errors:
+            errors.append(f"Failed to initialize direct genai.GenerativeModel('{TUNED_MODEL_NAME}'): {component_status['model']['error']}")
+            logger.error(f"Cannot create chains because core model initialization failed: {errors[-1]}")
+
+        initialization_error = errors[0] if errors else None
+        _init_completed = True
+        summary = ", ".join(f"{name}={info['status']}" for name, info in component_status.items())
+        logger.info(f"Service initialization finished in {time.perf_counter() - started_at:.2f}s: {summary}")
+
+
+def is_ready() -> bool:
+    return initialization_error is None and all(
+        component_status[name]["status"] in ("ready", "disabled") for name in SERVICE_COMPONENTS
+    )
+
+
+def ensure_initialized() -> None:
+    """
+    Makes sure initialization has run: returns at once when ready, waits for a warm-up already
+    in progress, and otherwise initializes inline. After a failure, the failed components are
+    retried in a background thread at most every SERVICE_INIT_RETRY_SECONDS, so a dependency
+    that comes back is picked up without any request waiting on its connection timeouts.
+    """
+    if is_ready():
+        return
+    if _init_completed:
+        if time.monotonic() - _init_attempted_at >= settings.SERVICE_INIT_RETRY_SECONDS:
+            _start_reinitialization()
+        return
+    with _init_lock:
+        if is_ready() or _init_completed:
+            return
+        initialize_services()
+
+
+def _start_reinitialization() -> None:
+    global _reinit_thread
+    with _reinit_lock:
+        if _reinit_thread is not None and _reinit_thread.is_alive():
+            return
+        _reinit_thread = threading.Thread(target=initialize_services, name="services-reinit", daemon=True)
+        _reinit_thread.start()
+    logger.info("Retrying failed service components in the background.")
+
+
+def start_background_warmup():
+    """Starts initialization in a daemon thread so the worker can accept /healthz while it warms up."""
+    global _warmup_thread
+    if _warmup_thread is not None:
+        return _warmup_thread
+    _warmup_thread = threading.Thread(target=ensure_initialized, name="services-warmup", daemon=True)
+    _warmup_thread.start()
+    logger.info("Background service warm-up started.")
+    return _warmup_thread
+
+
+def service_status() -> dict:
+    return {
+        "ready": is_ready(),
+        "rag_available": rag_available,
+        "initialization_error": initialization_error,
+        "components": {name: dict(info) for name, info in component_status.items()},
+        "write_behind": write_behind.stats() if write_behind is not None else None,
+        "admission": admission.state() if admission is not None else None,
+        "circuits": {name: breaker.snapshot() for name, breaker in breakers.items()},
+        "embedding_cache": _embedding_cache_stats(),
+    }
+
+
+def _embedding_cache_stats():
+    return embeddings.stats() if isinstance(embeddings, CachedEmbeddings) else None
+
+
+def _collect_embedding_cache_metrics() -> None:
+    stats = _embedding_cache_stats()
+    if stats is None:
+        return
+    metrics.EMBEDDING_CACHE_LOOKUPS.set_total(stats["memory_hits"], result="memory_hit")
+    metrics.EMBEDDING_CACHE_LOOKUPS.set_total(stats["disk_hits"], result="disk_hit")
+    metrics.EMBEDDING_CACHE_LOOKUPS.set_total(stats["misses"], result="miss")
+    metrics.EMBEDDING_CACHE_MEMORY_ENTRIES.set(stats["memory_entries"])
+
+
+metrics.add_collector(_collect_embedding_cache_metrics)
 
 
 # --- Helper Functions (keep as before) ---
@@ -368,48 +991,499 @@ def format_history_for_langchain(db_history: list) -> list:
 
 # --- Core API Functions (keep as before) ---
 
-def get_response(user_query: str, chat_id: str) -> str:
+def _ensure_chat_ready(chat_id: str) -> None:
+    ensure_initialized()
     if not router_chain or not general_chat_chain or not direct_genai_model:
         core_error = initialization_error or "Chatbot core components not initialized."
         logger.error(f"[{chat_id}] Cannot get response: {core_error}")
         raise ConnectionError(f"Chatbot is not ready due to initialization issues. Please check logs. Error: {core_error}")
 
+
+@contextmanager
+def _timed_stage(timings: dict, stage: str):
+    stage_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - stage_start
+
+
+def _timed_call(timings: dict, stage: str, func, *args, **kwargs):
+    with _timed_stage(timings, stage):
+        return func(*args, **kwargs)
+
+
+def _log_stage_timings(chat_id: str, timings: dict, route: str = None, mode: str = "sync") -> None:
+    execution = "concurrent" if CONCURRENT_STAGES else "sequential"
+    breakdown = ", ".join(f"{stage}={seconds:.3f}s" for stage, seconds in timings.items())
+    logger.info(f"[{chat_id}] Stage timings ({execution}, {mode}, route={route}): {breakdown}")
+    metrics.observe_turn(timings, route, mode)
+
+
+def _split_turn_history(raw_history: list, session_summary: dict = None) -> tuple[str, list]:
+    """
+    Router history string (last 4 messages) and LangChain chat history from one load. The chat
+    history is the last HISTORY_LIMIT messages, or with compaction on, the rolling summary plus
+    every unsummarized message that fits under CHAT_HISTORY_TOKEN_CEILING.
+    """
+    raw_history_for_router_db = raw_history[-4:]
+    if HISTORY_COMPACTION:
+        raw_history_for_chat_db = compact_history(raw_history, session_summary, settings.CHAT_HISTORY_TOKEN_CEILING)
+    else:
+        raw_history_for_chat_db = raw_history[-HISTORY_LIMIT:] if HISTORY_LIMIT > 0 else []
+    router_history_str = "\n".join([f"{msg.get('role','unknown')}: {msg.get('content','')}" for msg in raw_history_for_router_db])
+    formatted_history_for_chat = format_history_for_langchain(raw_history_for_chat_db)
+    return router_history_str, formatted_history_for_chat
+
+
+def _load_turn_history(chat_id: str, timings: dict = None) -> tuple[str, list]:
+    """Loads the router history string and the LangChain-formatted chat history for one turn."""
+    timings = timings if timings is not None else {}
+    raw_history = _timed_call(timings, "history", load_chat_history, chat_id, TURN_HISTORY_LOAD_LIMIT)
+    session_summary = _timed_call(timings, "summary", load_session_summary, chat_id) if HISTORY_COMPACTION else None
+    return _split_turn_history(raw_history, session_summary)
+
+
+def _chunk_document(chunk_id: str, text, metadata) -> Document:
+    return Document(page_content=text or "", metadata={**(metadata or {}), "chunk_id": chunk_id})
+
+
+def _vector_candidates(query_embedding, k: int) -> list:
+    """Nearest neighbours as Documents whose metadata carries the Chroma ID as chunk_id."""
+    index = vector_index.get() if vector_index is not None else None
+    if index is not None:
+        return [_chunk_document(*index.row(row)) for row, _ in index.search(query_embedding, k)]
+    result = _guarded("chroma", vector_store._collection.query,
+                      query_embeddings=[query_embedding], n_results=k, include=["documents", "metadatas"])
+    return [
+        _chunk_document(chunk_id, text, metadata)
+        for chunk_id, text, metadata in zip(result["ids"][0], result["documents"][0], result["metadatas"][0])
+    ]
+
+
+def _fetch_chunks(chunk_ids: list) -> list:
+    """Documents for the given chunk IDs (those that exist), from whichever vector backend is active."""
+    index = vector_index.get() if vector_index is not None else None
+    if index is not None:
+        return [_chunk_document(*index.row(index.positions[chunk_id])) for chunk_id in chunk_ids if chunk_id in index.positions]
+    fetched = _guarded("chroma", vector_store._collection.get, ids=chunk_ids, include=["documents", "metadatas"])
+    return [
+        _chunk_document(chunk_id, text, metadata)
+        for chunk_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"])
+    ]
+
+
+def _hybrid_search(user_query: str, query_embedding, index, timings: dict) -> list:
+    """Fuses vector and BM25 candidates with reciprocal rank fusion and returns the top RAG_RETRIEVAL_K."""
+    vector_docs = _timed_call(timings, "vector_search", _vector_candidates, query_embedding, RAG_HYBRID_CANDIDATES)
+    lexical_hits = _timed_call(timings, "lexical_search", index.search, user_query, RAG_HYBRID_CANDIDATES)
+    docs_by_id = {doc.metadata["chunk_id"]: doc for doc in vector_docs}
+    fused_ids = reciprocal_rank_fusion(
+        [list(docs_by_id), [chunk_id for chunk_id, _ in lexical_hits]], k=settings.RAG_RRF_K
+    )[:RAG_RETRIEVAL_K]
+
+    missing_ids = [chunk_id for chunk_id in fused_ids if chunk_id not in docs_by_id]
+    if missing_ids:
+        for doc in _timed_call(timings, "lexical_fetch", _fetch_chunks, missing_ids):
+            docs_by_id[doc.metadata["chunk_id"]] = doc
+    return [docs_by_id[chunk_id] for chunk_id in fused_ids if chunk_id in docs_by_id]
+
+
+def retrieve_documents(user_query: str, timings: dict = None) -> tuple[list, list]:
+    """
+    Embeds the query and runs the vector search (Chroma or the mmap index), fused with BM25
+    hits when the lexical index is available. Returns (query_embedding, docs).
+    """
+    timings = timings if timings is not None else {}
+    deadlines.check("embedding")
+    query_embedding = _timed_call(timings, "embedding", _guarded, "embeddings", embeddings.embed_query, user_query)
+    deadlines.check("vector_search")
+    index = lexical_index.get() if lexical_index is not None else None
+    if index is not None:
+        return query_embedding, _hybrid_search(user_query, query_embedding, index, timings)
+    if vector_index is not None:
+        return query_embedding, _timed_call(timings, "vector_search", _vector_candidates, query_embedding, RAG_RETRIEVAL_K)
+    docs = _timed_call(timings, "vector_search", _guarded, "chroma", vector_store.similarity_search_by_vector,
+                       query_embedding, k=RAG_RETRIEVAL_K)
+    return query_embedding, docs
+
+
+def _chunk_ids(docs: list) -> list:
+    ids = []
+    for doc in docs:
+        chunk_id = doc.metadata.get("chunk_id") or getattr(doc, "id", None)
+        if not chunk_id:
+            chunk_id = hashlib.sha1(f"{doc.metadata.get('source', '')}\n{doc.page_content}".encode("utf-8")).hexdigest()
+        ids.append(chunk_id)
+    return ids
+
+
+def _lookup_cached_answer(chat_id: str, query_embedding, docs: list, timings: dict):
+    if answer_cache is None:
+        return None
+    with _timed_stage(timings, "answer_cache"):
+        cached_answer = answer_cache.lookup(query_embedding, _chunk_ids(docs))
+    metrics.ANSWER_CACHE_LOOKUPS.inc(result="hit" if cached_answer is not None else "miss")
+    if cached_answer is not None:
+        logger.info(f"[{chat_id}][RAG] Semantic answer cache hit.")
+    return cached_answer
+
+
+def _store_cached_answer(user_query: str, query_embedding, docs: list, answer: str) -> None:
+    if answer_cache is None or not answer or answer.startswith("Error:"):
+        return
+    try:
+        answer_cache.store(user_query, query_embedding, _chunk_ids(docs), answer)
+    except Exception as e:
+        logger.warning(f"[RAG] Failed to store answer in semantic cache: {e}")
+
+
+def _record_routing_decision(chat_id: str, user_query: str, decision: str, source: str, confidence: float = None) -> None:
+    logger.info(f"[{chat_id}] Router decision: {decision} (source={source})")
+    metrics.ROUTING_DECISIONS.inc(decision=decision, source=source)
+    # Synthetic queries answered by the fake model would pollute the local router's training data.
+    if ROUTER_DECISION_LOG_ENABLED and _decision_log_executor is not None and settings.LLM_BACKEND != "fake":
+        _decision_log_executor.submit(
+            log_routing_decision, ROUTER_DECISION_LOG_PATH, user_query, decision, source, confidence,
+            max_bytes=settings.ROUTER_DECISION_LOG_MAX_BYTES, backups=settings.ROUTER_DECISION_LOG_BACKUPS,
+        )
+
+
+def _coalesced(chat_id: str, timings: dict, kind: str, user_query: str, func, *args):
+    """
+    Runs func(*args), or when an identical history-independent call (same kind and normalized
+    query) is already in flight, waits for and returns a copy of its result instead.
+    """
+    if _single_flight is None:
+        return func(*args)
+    wait_start = time.perf_counter()
+    result, is_leader = _single_flight.do((kind, normalize_query(user_query)), lambda: func(*args), stage=kind)
+    _record_coalescing(chat_id, timings, kind, is_leader, wait_start)
+    return result
+
+
+async def _acoalesced(chat_id: str, timings: dict, kind: str, user_query: str, coroutine_func, *args):
+    if _single_flight is None:
+        return await coroutine_func(*args)
+    wait_start = time.perf_counter()
+    result, is_leader = await _single_flight.ado((kind, normalize_query(user_query)), lambda: coroutine_func(*args), stage=kind)
+    _record_coalescing(chat_id, timings, kind, is_leader, wait_start)
+    return result
+
+
+def _record_coalescing(chat_id: str, timings: dict, kind: str, is_leader: bool, wait_start: float) -> None:
+    metrics.COALESCED_CALLS.inc(kind=kind, role="leader" if is_leader else "follower")
+    if not is_leader:
+        waited = time.perf_counter() - wait_start
+        if timings is not None:
+            timings[f"coalesced_{kind}"] = waited
+        logger.info(f"[{chat_id}] Joined an identical in-flight {kind} call ({waited:.3f}s wait).")
+
+
+def _answer_with_rag(chat_id: str, user_query: str, prefetched_docs, timings: dict):
+    """Retrieval, semantic cache lookup and RAG generation for one query. Returns the answer (may be an 'Error:' string)."""
+    query_embedding, docs = _get_rag_documents(user_query, prefetched_docs, timings)
+    response_text = _lookup_cached_answer(chat_id, query_embedding, docs, timings)
+    if response_text is None:
+        with _timed_stage(timings, "generation"):
+            response_text = rag_answer_chain.invoke({"context": format_docs(docs), "question": user_query})
+        if response_text is not None and not response_text.startswith("Error:"):
+            logger.debug(f"[{chat_id}][RAG] RAG chain successful.")
+            _store_cached_answer(user_query, query_embedding, docs, response_text)
+    return response_text
+
+
+async def _aanswer_with_rag(chat_id: str, user_query: str, timings: dict):
+    # Embedding + Chroma search are blocking; keep them off the event loop (to_thread carries the deadline along).
+    with _timed_stage(timings, "retrieval"):
+        try:
+            query_embedding, docs = await asyncio.wait_for(
+                asyncio.to_thread(retrieve_documents, user_query, timings), deadlines.call_timeout("retrieval")
+            )
+        except asyncio.TimeoutError as e:
+            raise DeadlineExceeded("retrieval") from e
+    response_text = _lookup_cached_answer(chat_id, query_embedding, docs, timings)
+    if response_text is None:
+        with _timed_stage(timings, "generation"):
+            response_text = await rag_answer_chain.ainvoke({"context": format_docs(docs), "question": user_query})
+        if response_text is not None and not response_text.startswith("Error:"):
+            _store_cached_answer(user_query, query_embedding, docs, response_text)
+    return response_text
+
+
+def _router_hedge_delay():
+    """Seconds after which a router call is hedged, or None (hedging off or too few samples yet)."""
+    return _router_latency.percentile(settings.ROUTER_HEDGE_PERCENTILE) if _router_latency is not None else None
+
+
+def _record_hedge(hedge_after: float, outcome: str) -> None:
+    metrics.HEDGED_CALLS.inc(kind="router", outcome=outcome)
+    if outcome == "hedged":
+        logger.info(f"[ROUTER] Router call slower than p{settings.ROUTER_HEDGE_PERCENTILE * 100:g} "
+                    f"({hedge_after:.3f}s); sent a hedged second call.")
+    elif outcome == "skipped":
+        logger.info(f"[ROUTER] Router call slower than p{settings.ROUTER_HEDGE_PERCENTILE * 100:g} "
+                    f"({hedge_after:.3f}s), but no idle hedge worker; not hedging.")
+
+
+def _invoke_router(router_input: dict) -> str:
+    """router_chain.invoke, hedged with a second call when the first outlasts the observed percentile."""
+    if _router_latency is None:
+        return router_chain.invoke(router_input)
+
+    def attempt():
+        started_at = time.perf_counter()
+        decision = router_chain.invoke(router_input)
+        _router_latency.record(time.perf_counter() - started_at)
+        return decision
+
+    hedge_after = _router_hedge_delay()
+    if hedge_after is None:
+        return attempt()
+    decision, outcome = hedged_call(attempt, hedge_after, _hedge_pool)
+    _record_hedge(hedge_after, outcome)
+    return decision
+
+
+async def _ainvoke_router(router_input: dict) -> str:
+    if _router_latency is None:
+        return await router_chain.ainvoke(router_input)
+
+    async def attempt():
+        started_at = time.perf_counter()
+        decision = await router_chain.ainvoke(router_input)
+        _router_latency.record(time.perf_counter() - started_at)
+        return decision
+
+    hedge_after = _router_hedge_delay()
+    if hedge_after is None:
+        return await attempt()
+    decision, outcome = await ahedged_call(attempt, hedge_after)
+    _record_hedge(hedge_after, outcome)
+    return decision
+
+
+def _route_query(chat_id: str, user_query: str, router_history_str: str) -> str:
+    """Routes with the local classifier when it is confident, otherwise with router_chain."""
+    logger.debug(f"[{chat_id}] Routing query (first 60 chars): '{user_query[:60]}...'")
+    if local_router is not None:
+        decision, confidence = local_router.classify(user_query)
+        if decision:
+            _record_routing_decision(chat_id, user_query, decision, "local", confidence)
+            return decision
+        logger.debug(f"[{chat_id}] Local router not confident ({confidence:.2f}). Falling back to LLM router.")
+
+    router_input = {"chat_history": router_history_str, "query": user_query}
+    if router_history_str:
+        decision = _invoke_router(router_input)
+    else:
+        decision = _coalesced(chat_id, None, "router", user_query, _invoke_router, router_input)
+    _record_routing_decision(chat_id, user_query, decision, "llm")
+    return decision
+
+
+async def _aroute_query(chat_id: str, user_query: str, router_history_str: str) -> str:
+    logger.debug(f"[{chat_id}] Routing query asynchronously (first 60 chars): '{user_query[:60]}...'")
+    if local_router is not None:
+        if local_router.similarity_fn is not None:
+            decision, confidence = await asyncio.to_thread(local_router.classify, user_query)
+        else:
+            decision, confidence = local_router.classify(user_query)
+        if decision:
+            _record_routing_decision(chat_id, user_query, decision, "local", confidence)
+            return decision
+        logger.debug(f"[{chat_id}] Local router not confident ({confidence:.2f}). Falling back to LLM router.")
+
+    router_input = {"chat_history": router_history_str, "query": user_query}
+    if router_history_str:
+        decision = await _ainvoke_router(router_input)
+    else:
+        decision = await _acoalesced(chat_id, None, "router", user_query, _ainvoke_router, router_input)
+    _record_routing_decision(chat_id, user_query, decision, "llm")
+    return decision
+
+
+def _start_turn(user_query: str, chat_id: str, timings: dict):
+    """
+    Loads history and routes the query. In concurrent mode, retrieval for the RAG path is
+    started speculatively before the history loads and the router call; its result is
+    discarded if the router picks GENERAL_CHAT.
+    Returns (routing_decision, formatted_history_for_chat, prefetched_docs), where
+    prefetched_docs is None or a (future, stage timings of the speculative task) pair.
+    """
+    prefetched_docs = None
+    if _stage_executor is not None and rag_available and retriever is not None and not _rag_circuit_open():
+        # The task gets its own timings dict: a discarded prefetch may still be running (cancel()
+        # cannot stop it) while this turn's timings are iterated for logging and metrics.
+        prefetch_timings = {}
+        prefetch_future = _stage_executor.submit(contextvars.copy_context().run, _timed_call, prefetch_timings,
+                                                 "retrieval", retrieve_documents, user_query, prefetch_timings)
+        prefetched_docs = (prefetch_future, prefetch_timings)
+
+    router_history_str, formatted_history_for_chat = _load_turn_history(chat_id, timings)
+    deadlines.check("router")
+    with _timed_stage(timings, "router"):
+        routing_decision = _route_query(chat_id, user_query, router_history_str)
+
+    if prefetched_docs is not None and routing_decision != "SEARCH_DOCS":
+        logger.debug(f"[{chat_id}] Discarding speculative retrieval (router chose {routing_decision}).")
+        prefetched_docs[0].cancel()
+        prefetched_docs = None
+    return routing_decision, formatted_history_for_chat, prefetched_docs
+
+
+def _rag_circuit_error(error: CircuitOpenError) -> str:
+    """
+    Retrieval hit an open circuit (e.g. a half-open probe was already out): an "Error:" answer
+    so the turn falls back to general chat. The model's own circuit still fails the turn.
+    """
+    if error.dependency == "gemini":
+        raise error
+    metrics.DEGRADED_RESPONSES.inc(mode="no_rag")
+    return f"Error: {error}"
+
+
+def _record_rag_unavailable() -> None:
+    if rag_available and _rag_circuit_open():
+        metrics.RAG_FALLBACKS.inc(reason="circuit_open")
+        metrics.DEGRADED_RESPONSES.inc(mode="no_rag")
+    else:
+        metrics.RAG_FALLBACKS.inc(reason="rag_unavailable")
+
+
+def _get_rag_documents(user_query: str, prefetched_docs, timings: dict) -> tuple[list, list]:
+    if prefetched_docs is not None:
+        prefetch_future, prefetch_timings = prefetched_docs
+        with _timed_stage(timings, "retrieval_wait"):
+            try:
+                return prefetch_future.result(timeout=deadlines.call_timeout("retrieval_wait"))
+            except FutureTimeoutError as e:
+                raise DeadlineExceeded("retrieval_wait") from e
+            finally:
+                # Only a finished task has stopped writing its stage timings.
+                if prefetch_future.done():
+                    timings.update(prefetch_timings)
+    return _timed_call(timings, "retrieval", retrieve_documents, user_query, timings)
+
+
+# --- Admission Control ---
+
+def _admission_priority(is_new_chat: bool) -> int:
+    # Follow-ups of conversations already under way go first; a user mid-conversation
+    # notices a stall more than one who has not started yet.
+    return PRIORITY_NEW_CHAT if is_new_chat else PRIORITY_CONVERSATION
+
+
+def _record_admission(chat_id: str, priority: int, ticket=None, rejection: AdmissionRejected = None) -> None:
+    priority_label = "new_chat" if priority == PRIORITY_NEW_CHAT else "conversation"
+    if rejection is not None:
+        metrics.ADMISSION_DECISIONS.inc(result=rejection.reason, priority=priority_label)
+        logger.warning(f"[ADMISSION|{chat_id}] Rejected ({rejection.reason}); Retry-After {rejection.retry_after}s. "
+                       f"State: {admission.state()}")
+        return
+    metrics.ADMISSION_DECISIONS.inc(result="admitted", priority=priority_label)
+    metrics.ADMISSION_WAIT_SECONDS.observe(ticket.waited)
+    if ticket.waited:
+        logger.info(f"[ADMISSION|{chat_id}] Admitted after {ticket.waited:.3f}s in queue.")
+
+
+def admit_turn(chat_id: str, is_new_chat: bool):
+    """
+    Waits for a model slot for one chat turn. Returns a ticket to release once the response
+    is generated, or None when admission control is off. Raises AdmissionRejected, at once
+    while the Gemini circuit is open.
+    """
+    _reject_if_model_unavailable(chat_id)
+    if admission is None:
+        return None
+    priority = _admission_priority(is_new_chat)
+    try:
+        ticket = admission.acquire(priority, timeout=deadlines.call_timeout("admission", admission.max_wait))
+    except AdmissionRejected as rejection:
+        _record_admission(chat_id, priority, rejection=rejection)
+        raise
+    _record_admission(chat_id, priority, ticket)
+    return ticket
+
+
+async def aadmit_turn(chat_id: str, is_new_chat: bool):
+    _reject_if_model_unavailable(chat_id)
+    if admission is None:
+        return None
+    priority = _admission_priority(is_new_chat)
+    try:
+        ticket = await admission.aacquire(priority, timeout=deadlines.call_timeout("admission", admission.max_wait))
+    except AdmissionRejected as rejection:
+        _record_admission(chat_id, priority, rejection=rejection)
+        raise
+    _record_admission(chat_id, priority, ticket)
+    return ticket
+
+
+def _reject_if_model_unavailable(chat_id: str) -> None:
+    if _circuit_open("gemini"):
+        error = CircuitOpenError("gemini", breakers["gemini"].retry_after())
+        raise _circuit_rejection(chat_id, error) from error
+
+
+def _record_deadline_exceeded(chat_id: str, error: DeadlineExceeded) -> None:
+    metrics.DEADLINE_EXCEEDED.inc(stage=error.stage)
+    logger.warning(f"[{chat_id}] {error} Abandoning the turn.")
+
+
+def _quota_rejection(chat_id: str, error: Exception) -> AdmissionRejected:
+    """Turns a Gemini quota error into a fast 503 with Retry-After, instead of a fallback call."""
+    retry_after = admission.retry_after() if admission is not None else 1
+    metrics.ADMISSION_DECISIONS.inc(result="upstream_quota", priority="any")
+    logger.warning(f"[ADMISSION|{chat_id}] Gemini quota exhausted ({error}); answering 503, Retry-After {retry_after}s.")
+    return AdmissionRejected("upstream_quota", retry_after, status=503)
+
+
+def _circuit_rejection(chat_id: str, error: CircuitOpenError) -> AdmissionRejected:
+    """Fails a turn whose dependency is open-circuited with a 503 and Retry-After of the next probe."""
+    reason = f"{error.dependency}_unavailable"
+    metrics.DEGRADED_RESPONSES.inc(mode=reason)
+    logger.warning(f"[CIRCUIT|{chat_id}] {error} Answering 503.")
+    return AdmissionRejected(reason, max(1, math.ceil(error.retry_after)), status=503)
+
+
+def get_response(user_query: str, chat_id: str) -> str:
+    _ensure_chat_ready(chat_id)
+
     user_query = str(user_query or "").strip()
     if not user_query:
         logger.warning(f"[{chat_id}] Received empty user query.")
         return "Please enter a query."
 
-    raw_history_for_router_db = load_chat_history(chat_id, limit=4)
-    router_history_str = "\n".join([f"{msg.get('role','unknown')}: {msg.get('content','')}" for msg in raw_history_for_router_db])
-
-    raw_history_for_chat_db = load_chat_history(chat_id, limit=HISTORY_LIMIT)
-    formatted_history_for_chat = format_history_for_langchain(raw_history_for_chat_db)
-
+    timings = {}
+    turn_start = time.perf_counter()
+    routing_decision = None
     try:
-        logger.debug(f"[{chat_id}] Routing query (first 60 chars): '{user_query[:60]}...'")
-        routing_decision = router_chain.invoke({
-            "chat_history": router_history_str,
-            "query": user_query
-        })
-        logger.info(f"[{chat_id}] Router decision: {routing_decision}")
+        routing_decision, formatted_history_for_chat, prefetched_docs = _start_turn(user_query, chat_id, timings)
 
         response_text = None
 
         if routing_decision == "SEARCH_DOCS":
-            if rag_available and rag_chain:
+            if rag_available and rag_answer_chain and not _rag_circuit_open():
                 logger.info(f"[{chat_id}][RAG] Executing RAG chain.")
-                response_text = rag_chain.invoke(user_query)
+                # RAG answers do not depend on chat history, so identical in-flight queries share one.
+                try:
+                    response_text = _coalesced(chat_id, timings, "rag", user_query,
+                                               _answer_with_rag, chat_id, user_query, prefetched_docs, timings)
+                except CircuitOpenError as e:
+                    response_text = _rag_circuit_error(e)
                 if response_text is None or response_text.startswith("Error:"):
                     logger.warning(f"[{chat_id}][RAG] RAG chain produced an error or no response: '{response_text}'. Falling back to General Chat.")
-                else:
-                     logger.debug(f"[{chat_id}][RAG] RAG chain successful.")
+                    metrics.RAG_FALLBACKS.inc(reason="rag_error")
 
             else:
                 logger.warning(f"[{chat_id}] Router chose SEARCH_DOCS, but RAG is unavailable/disabled. Falling back to General Chat.")
-                general_response = general_chat_chain.invoke({
-                    "chat_history": formatted_history_for_chat,
-                    "query": user_query
-                })
+                _record_rag_unavailable()
+                with _timed_stage(timings, "generation"):
+                    general_response = general_chat_chain.invoke({
+                        "chat_history": formatted_history_for_chat,
+                        "query": user_query
+                    })
                 response_text = f"(Note: I tried to search documents for this, but couldn't access them.)\n\n{general_response}"
 
         if response_text is None or response_text.startswith("Error:"):
@@ -418,10 +1492,12 @@ def get_response(user_query: str, chat_id: str) -> str:
             else:
                  logger.info(f"[{chat_id}] Executing General Chat chain.")
 
-            response_text = general_chat_chain.invoke({
-                "chat_history": formatted_history_for_chat,
-                "query": user_query
-            })
+            general_input = {"chat_history": formatted_history_for_chat, "query": user_query}
+            with _timed_stage(timings, "generation"):
+                if formatted_history_for_chat:
+                    response_text = general_chat_chain.invoke(general_input)
+                else:
+                    response_text = _coalesced(chat_id, timings, "general", user_query, general_chat_chain.invoke, general_input)
 
         final_response = str(response_text) if response_text is not None else "Sorry, I encountered an issue generating a response."
         logger.debug(f"[{chat_id}] Final response generated (first 100 chars): {final_response[:100]}...")
@@ -429,10 +1505,191 @@ def get_response(user_query: str, chat_id: str) -> str:
 
     except StopCandidateException as safety_exception:
          logger.warning(f"[{chat_id}] Response generation blocked by safety filter at outer level: {safety_exception}")
+         metrics.SAFETY_BLOCKS.inc(where="turn")
          return "I cannot provide a response to this query due to safety guidelines."
+    except TooManyRequests as e:
+        raise _quota_rejection(chat_id, e) from e
+    except CircuitOpenError as e:
+        raise _circuit_rejection(chat_id, e) from e
+    except DeadlineExceeded as e:
+        _record_deadline_exceeded(chat_id, e)
+        raise
     except Exception as e:
         logger.error(f"[{chat_id}] Critical error during get_response execution: {e}", exc_info=True)
         return f"Sorry, a processing error occurred while handling your request."
+    finally:
+        timings["total"] = time.perf_counter() - turn_start
+        _log_stage_timings(chat_id, timings, routing_decision, "sync")
+
+
+def stream_response(user_query: str, chat_id: str):
+    """
+    Streaming variant of get_response. Routing happens up front, then the chosen
+    chain's generation is streamed from Gemini and yielded chunk by chunk. Raises
+    StreamFailed if the answer cannot be completed, so callers never persist a partial one.
+    """
+    _ensure_chat_ready(chat_id)
+
+    user_query = str(user_query or "").strip()
+    if not user_query:
+        logger.warning(f"[{chat_id}] Received empty user query.")
+        yield "Please enter a query."
+        return
+
+    timings = {}
+    turn_start = time.perf_counter()
+    routing_decision = None
+    try:
+        routing_decision, formatted_history_for_chat, prefetched_docs = _start_turn(user_query, chat_id, timings)
+
+        if routing_decision == "SEARCH_DOCS":
+            if rag_available and rag_prompt_from_context and not _rag_circuit_open():
+                logger.info(f"[{chat_id}][RAG] Streaming RAG generation.")
+                try:
+                    query_embedding, docs = _get_rag_documents(user_query, prefetched_docs, timings)
+                except CircuitOpenError as e:
+                    query_embedding, docs = None, None
+                    first_chunk = _rag_circuit_error(e)
+                if docs is not None:
+                    cached_answer = _lookup_cached_answer(chat_id, query_embedding, docs, timings)
+                    if cached_answer is not None:
+                        yield cached_answer
+                        return
+                    rag_prompt_str = rag_prompt_from_context.invoke({"context": format_docs(docs), "question": user_query})
+                    rag_stream = stream_direct_model(rag_prompt_str, f"[{chat_id}][RAG]")
+                    with _timed_stage(timings, "first_token"):
+                        first_chunk = next(rag_stream, None)
+                if first_chunk is not None and not first_chunk.startswith("Error"):
+                    streamed_parts = [first_chunk]
+                    yield first_chunk
+                    for chunk in _checked_stream(rag_stream):
+                        streamed_parts.append(chunk)
+                        yield chunk
+                    _store_cached_answer(user_query, query_embedding, docs, "".join(streamed_parts))
+                    return
+                logger.warning(f"[{chat_id}][RAG] RAG stream produced an error or no response: '{first_chunk}'. Falling back to General Chat.")
+                metrics.RAG_FALLBACKS.inc(reason="rag_error")
+            else:
+                logger.warning(f"[{chat_id}] Router chose SEARCH_DOCS, but RAG is unavailable/disabled. Falling back to General Chat.")
+                _record_rag_unavailable()
+                yield "(Note: I tried to search documents for this, but couldn't access them.)\n\n"
+
+        logger.info(f"[{chat_id}] Streaming General Chat generation.")
+        general_prompt_value = general_prompt.invoke({
+            "chat_history": formatted_history_for_chat,
+            "query": user_query
+        })
+        yield from _checked_stream(stream_direct_model(prompt_value_to_genai_history(general_prompt_value), f"[{chat_id}][GENERAL]"))
+
+    except StreamFailed as e:
+        logger.warning(f"[{chat_id}] Streamed response failed: {e}")
+        raise
+    except StopCandidateException as safety_exception:
+         logger.warning(f"[{chat_id}] Streaming response blocked by safety filter at outer level: {safety_exception}")
+         metrics.SAFETY_BLOCKS.inc(where="turn")
+         raise StreamFailed("I cannot provide a response to this query due to safety guidelines.") from safety_exception
+    except TooManyRequests as e:
+        raise _quota_rejection(chat_id, e) from e
+    except CircuitOpenError as e:
+        raise _circuit_rejection(chat_id, e) from e
+    except DeadlineExceeded as e:
+        _record_deadline_exceeded(chat_id, e)
+        raise
+    except Exception as e:
+        logger.error(f"[{chat_id}] Critical error during stream_response execution: {e}", exc_info=True)
+        raise StreamFailed("Sorry, a processing error occurred while handling your request.") from e
+    finally:
+        # For streams, total includes the time the client took to consume the response.
+        timings["total"] = time.perf_counter() - turn_start
+        _log_stage_timings(chat_id, timings, routing_decision, "stream")
+
+
+async def _aload_turn_history(chat_id: str) -> tuple[str, list]:
+    raw_history = await aload_chat_history(chat_id, limit=TURN_HISTORY_LOAD_LIMIT)
+    session_summary = await aload_session_summary(chat_id) if HISTORY_COMPACTION else None
+    return _split_turn_history(raw_history, session_summary)
+
+
+async def aget_response(user_query: str, chat_id: str) -> str:
+    """
+    Async counterpart of get_response for the ASGI path. Gemini calls go through
+    chain.ainvoke (generate_content_async), history uses motor, and the blocking
+    embedding + Chroma search is run in the default executor.
+    """
+    _ensure_chat_ready(chat_id)
+
+    user_query = str(user_query or "").strip()
+    if not user_query:
+        logger.warning(f"[{chat_id}] Received empty user query.")
+        return "Please enter a query."
+
+    timings = {}
+    turn_start = time.perf_counter()
+    routing_decision = None
+    with _timed_stage(timings, "history"):
+        router_history_str, formatted_history_for_chat = await _aload_turn_history(chat_id)
+
+    try:
+        deadlines.check("router")
+        with _timed_stage(timings, "router"):
+            routing_decision = await _aroute_query(chat_id, user_query, router_history_str)
+
+        response_text = None
+
+        if routing_decision == "SEARCH_DOCS":
+            if rag_available and rag_answer_chain and not _rag_circuit_open():
+                logger.info(f"[{chat_id}][RAG] Executing RAG chain (async).")
+                try:
+                    response_text = await _acoalesced(chat_id, timings, "rag", user_query,
+                                                      _aanswer_with_rag, chat_id, user_query, timings)
+                except CircuitOpenError as e:
+                    response_text = _rag_circuit_error(e)
+                if response_text is None or response_text.startswith("Error:"):
+                    logger.warning(f"[{chat_id}][RAG] RAG chain produced an error or no response: '{response_text}'. Falling back to General Chat.")
+                    metrics.RAG_FALLBACKS.inc(reason="rag_error")
+            else:
+                logger.warning(f"[{chat_id}] Router chose SEARCH_DOCS, but RAG is unavailable/disabled. Falling back to General Chat.")
+                _record_rag_unavailable()
+                with _timed_stage(timings, "generation"):
+                    general_response = await general_chat_chain.ainvoke({
+                        "chat_history": formatted_history_for_chat,
+                        "query": user_query
+                    })
+                response_text = f"(Note: I tried to search documents for this, but couldn't access them.)\n\n{general_response}"
+
+        if response_text is None or response_text.startswith("Error:"):
+            logger.info(f"[{chat_id}] Executing General Chat chain (async).")
+            general_input = {"chat_history": formatted_history_for_chat, "query": user_query}
+            with _timed_stage(timings, "generation"):
+                if formatted_history_for_chat:
+                    response_text = await general_chat_chain.ainvoke(general_input)
+                else:
+                    response_text = await _acoalesced(chat_id, timings, "general", user_query, general_chat_chain.ainvoke, general_input)
+
+        return str(response_text) if response_text is not None else "Sorry, I encountered an issue generating a response."
+
+    except StopCandidateException as safety_exception:
+         logger.warning(f"[{chat_id}] Response generation blocked by safety filter at outer level: {safety_exception}")
+         metrics.SAFETY_BLOCKS.inc(where="turn")
+         return "I cannot provide a response to this query due to safety guidelines."
+    except TooManyRequests as e:
+        raise _quota_rejection(chat_id, e) from e
+    except CircuitOpenError as e:
+        raise _circuit_rejection(chat_id, e) from e
+    except DeadlineExceeded as e:
+        _record_deadline_exceeded(chat_id, e)
+        raise
+    except Exception as e:
+        logger.error(f"[{chat_id}] Critical error during aget_response execution: {e}", exc_info=True)
+        return f"Sorry, a processing error occurred while handling your request."
+    finally:
+        timings["total"] = time.perf_counter() - turn_start
+        _log_stage_timings(chat_id, timings, routing_decision, "async")
+
+
+def _history_fetch_limit(limit: int) -> int:
+    """Reads fill the whole cache entry, so one query serves every smaller limit afterwards."""
+    return max(limit, history_cache.capacity) if history_cache is not None else limit
 
 
 def load_chat_history(chat_id: str, limit: int = HISTORY_LIMIT) -> list:
@@ -440,53 +1697,250 @@ def load_chat_history(chat_id: str, limit: int = HISTORY_LIMIT) -> list:
     if chat_collection is None:
         logger.warning(f"[{chat_id}] Cannot load history: MongoDB collection not available.")
         return history
+    if history_cache is not None:
+        cached_history = history_cache.get(chat_id, limit)
+        if cached_history is not None:
+            logger.debug(f"[{chat_id}] Served {len(cached_history)} messages from history cache (limit={limit}).")
+            return cached_history
     try:
+        fetch_limit = _history_fetch_limit(limit)
         history_cursor = chat_collection.find(
             {"chat_id": chat_id},
-            projection={"role": 1, "content": 1, "timestamp": 1, "_id": 0}
-        ).sort("timestamp", pymongo.DESCENDING).limit(limit)
-        db_history = list(history_cursor)
+            projection={"role": 1, "content": 1, "timestamp": 1}
+        ).sort("timestamp", pymongo.DESCENDING).limit(fetch_limit)
+        db_history = _guarded("mongo", list, history_cursor)
         db_history.reverse()
-        history = db_history
+        db_history = _merge_pending_writes(chat_id, db_history)
+        if history_cache is not None and fetch_limit <= history_cache.capacity:
+            history_cache.fill(chat_id, db_history)
+        history = db_history[-limit:] if limit > 0 else []
         logger.debug(f"[{chat_id}] Loaded {len(history)} messages from DB history (limit={limit}).")
+    except CircuitOpenError as e:
+        history = _history_without_db(chat_id, limit, e)
     except Exception as e:
         logger.error(f"[{chat_id}] Error loading history from DB: {e}", exc_info=True)
     return history
 
-def save_chat_messages(chat_id: str, user_message: str, model_response: str):
+def _history_without_db(chat_id: str, limit: int, error: CircuitOpenError) -> list:
+    """While MongoDB is open-circuited the turn is answered from queued (unwritten) messages only."""
+    metrics.DEGRADED_RESPONSES.inc(mode="no_history")
+    logger.warning(f"[{chat_id}] {error} Answering without stored history.")
+    history = _merge_pending_writes(chat_id, [])
+    return history[-limit:] if limit > 0 else []
+
+
+def history_cursor_for(messages: list):
+    """Cursor pointing before the oldest of the given messages (oldest first), or None if there is none."""
+    if not messages or messages[0].get("_id") is None:
+        return None
+    return encode_keyset_cursor(messages[0].get("timestamp"), messages[0]["_id"])
+
+
+def load_chat_history_page(chat_id: str, before: str = None, limit: int = HISTORY_PAGE_SIZE) -> tuple[list, str]:
+    """
+    Messages older than the `before` cursor (or the newest ones without it), oldest first,
+    paging backwards on the (chat_id, timestamp) index. Returns (messages, cursor for the
+    next older page or None). Raises ValueError for a malformed cursor.
+    """
     if chat_collection is None:
-        logger.warning(f"[{chat_id}] Cannot save messages: MongoDB collection not available.")
-        return
+        logger.warning(f"[{chat_id}] Cannot load history page: MongoDB collection not available.")
+        return [], None
+    query = {"chat_id": chat_id}
+    if before:
+        before_timestamp, before_id = decode_keyset_cursor(before)
+        # Both messages of a turn share a timestamp, so _id breaks the tie.
+        query["$or"] = [
+            {"timestamp": {"$lt": before_timestamp}},
+            {"timestamp": before_timestamp, "_id": {"$lt": before_id}},
+        ]
     try:
-        user_message_str = str(user_message or "").strip()
-        model_response_str = str(model_response or "").strip()
+        history_cursor = chat_collection.find(
+            query,
+            projection={"role": 1, "content": 1, "timestamp": 1}
+        ).sort([("timestamp", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]).limit(limit + 1)
+        page = _guarded("mongo", list, history_cursor)
+    except Exception as e:
+        logger.error(f"[{chat_id}] Error loading history page from DB: {e}", exc_info=True)
+        return [], None
+    if not before:
+        page = list(reversed(_merge_pending_writes(chat_id, list(reversed(page)))))[:limit + 1]
+    has_more = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+    logger.debug(f"[{chat_id}] Loaded history page of {len(page)} messages (more={has_more}).")
+    return page, history_cursor_for(page) if has_more else None
+
+
+def _build_message_docs(chat_id: str, user_message: str, model_response: str) -> list:
+    user_message_str = str(user_message or "").strip()
+    model_response_str = str(model_response or "").strip()
+
+    # Cached copies and cursors carry this value; it must equal what MongoDB stores.
+    timestamp = mongo_timestamp(datetime.utcnow())
+    docs_to_insert = []
+    if user_message_str:
+         docs_to_insert.append({
+             "_id": ObjectId(),
+             "chat_id": chat_id,
+             "role": "user",
+             "content": user_message_str,
+             "timestamp": timestamp
+         })
+    if model_response_str:
+         docs_to_insert.append({
+             "_id": ObjectId(),
+             "chat_id": chat_id,
+             "role": "model",
+             "content": model_response_str,
+             "timestamp": timestamp
+         })
+    return docs_to_insert
+
+
+def _history_entry(doc: dict) -> dict:
+    return {"_id": doc.get("_id"), "role": doc["role"], "content": doc["content"], "timestamp": doc["timestamp"]}
+
+
+# --- Write-Behind Persistence ---
+
+def _enqueue_turn(chat_id: str, docs: list) -> bool:
+    """Hands a turn's messages to the write-behind queue. False if it is off or full (write synchronously)."""
+    if write_behind is None:
+        return False
+    with _pending_lock:
+        _pending_writes.setdefault(chat_id, []).extend(docs)
+    if not write_behind.submit({"chat_id": chat_id, "docs": docs}):
+        _forget_pending(chat_id, docs)
+        metrics.WRITE_BEHIND_MESSAGES.inc(len(docs), result="sync_fallback")
+        logger.warning(f"[{chat_id}] Write-behind queue full; saving synchronously.")
+        return False
+    metrics.WRITE_BEHIND_MESSAGES.inc(len(docs), result="queued")
+    metrics.WRITE_BEHIND_QUEUE_DEPTH.set(write_behind.depth())
+    return True
 
-        if not user_message_str and not model_response_str:
-            logger.warning(f"[{chat_id}] Attempted to save empty user and model messages. Skipping.")
-            return
 
-        timestamp = datetime.utcnow()
-        docs_to_insert = []
-        if user_message_str:
-             docs_to_insert.append({
-                 "chat_id": chat_id,
-                 "role": "user",
-                 "content": user_message_str,
-                 "timestamp": timestamp
-             })
-        if model_response_str:
-             docs_to_insert.append({
-                 "chat_id": chat_id,
-                 "role": "model",
-                 "content": model_response_str,
-                 "timestamp": timestamp
-             })
+def _forget_pending(chat_id: str, docs: list) -> None:
+    written_ids = {doc["_id"] for doc in docs}
+    with _pending_lock:
+        remaining = [doc for doc in _pending_writes.get(chat_id, []) if doc["_id"] not in written_ids]
+        if remaining:
+            _pending_writes[chat_id] = remaining
+        else:
+            _pending_writes.pop(chat_id, None)
+
+
+def _flush_turns(turns: list) -> None:
+    """
+    Write-behind batch: one insert_many for every queued message, then one sessions bulk_write.
+    Messages carry their _id, so a retried batch skips the ones already inserted (duplicate
+    key errors) and does not re-run the insert once it succeeded.
+    """
+    write_start = time.perf_counter()
+    docs = [doc for turn in turns if not turn.get("messages_saved") for doc in turn["docs"]]
+    if docs:
+        try:
+            _guarded("mongo", chat_collection.insert_many, docs, ordered=False)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            if e.details.get("writeConcernErrors") or any(error.get("code") != 11000 for error in write_errors):
+                raise
+        for turn in turns:
+            turn["messages_saved"] = True
+
+    docs_by_chat = {}
+    retried_chats = set()
+    for turn in turns:
+        docs_by_chat.setdefault(turn["chat_id"], []).extend(turn["docs"])
+        if turn.get("sessions_attempted"):
+            retried_chats.add(turn["chat_id"])
+        turn["sessions_attempted"] = True
+    # The previous attempt's bulk_write may have applied in part, so a retry recounts these
+    # chats' messages instead of incrementing message_count a second time.
+    recounts = {chat_id: _guarded("mongo", chat_collection.count_documents, {"chat_id": chat_id}) for chat_id in retried_chats}
+    _guarded("mongo", sessions_collection.bulk_write, [
+        UpdateOne({"chat_id": chat_id},
+                  session_update_for_messages(chat_id, chat_docs, CHAT_TITLE_MAX_LENGTH, recounts.get(chat_id)),
+                  upsert=True)
+        for chat_id, chat_docs in docs_by_chat.items()
+    ], ordered=False)
+    metrics.MONGO_WRITE_SECONDS.observe(time.perf_counter() - write_start, mode="write_behind")
+    metrics.WRITE_BEHIND_MESSAGES.inc(sum(len(turn["docs"]) for turn in turns), result="written")
+    metrics.WRITE_BEHIND_QUEUE_DEPTH.set(write_behind.depth() if write_behind is not None else 0)
+
+    for chat_id, chat_docs in docs_by_chat.items():
+        _forget_pending(chat_id, chat_docs)
+        _schedule_summary_update(chat_id)
+    logger.debug(f"[WRITE_BEHIND] Wrote {len(docs)} messages for {len(docs_by_chat)} chats "
+                 f"in {time.perf_counter() - write_start:.3f}s.")
+
+
+def _discard_turns(turns: list) -> None:
+    """Undoes the optimistic state of turns that could not be written (they are in the dead-letter file)."""
+    for turn in turns:
+        _forget_pending(turn["chat_id"], turn["docs"])
+        if history_cache is not None:
+            history_cache.invalidate(turn["chat_id"])
+    metrics.WRITE_BEHIND_MESSAGES.inc(sum(len(turn["docs"]) for turn in turns), result="dead_lettered")
+
+
+def _merge_pending_writes(chat_id: str, messages: list) -> list:
+    """Adds this chat's queued (not yet written) messages to a DB read, oldest first."""
+    with _pending_lock:
+        pending = list(_pending_writes.get(chat_id, ()))
+    if not pending:
+        return messages
+    seen_ids = {message.get("_id") for message in messages}
+    merged = messages + [_history_entry(doc) for doc in pending if doc["_id"] not in seen_ids]
+    merged.sort(key=lambda message: (message.get("timestamp") or datetime.min, message.get("_id") or ObjectId("0" * 24)))
+    return merged
+
+
+class PendingWritesError(RuntimeError):
+    """Queued messages could not be written in time (e.g. MongoDB is open-circuited)."""
+
+
+def flush_pending_writes(timeout: float = 5.0) -> bool:
+    """Waits for queued messages to reach MongoDB (before deletes/renames that must see them)."""
+    return write_behind.flush(timeout) if write_behind is not None else True
+
+
+def _purge_pending_writes(chat_id: str) -> int:
+    """Drops the chat's queued and pending (unwritten) messages; returns how many turns were purged."""
+    purged = write_behind.purge(lambda turn: turn["chat_id"] == chat_id) if write_behind is not None else []
+    with _pending_lock:
+        _pending_writes.pop(chat_id, None)
+    if purged:
+        metrics.WRITE_BEHIND_QUEUE_DEPTH.set(write_behind.depth())
+    return len(purged)
+
 
+def save_chat_messages(chat_id: str, user_message: str, model_response: str):
+    if chat_collection is None:
+        logger.warning(f"[{chat_id}] Cannot save messages: MongoDB collection not available.")
+        return
+    try:
+        docs_to_insert = _build_message_docs(chat_id, user_message, model_response)
         if docs_to_insert:
-            chat_collection.insert_many(docs_to_insert)
-            logger.debug(f"[{chat_id}] Saved {len(docs_to_insert)} message(s) to DB.")
+            queued = _enqueue_turn(chat_id, docs_to_insert)
+            if not queued:
+                write_start = time.perf_counter()
+                _guarded("mongo", chat_collection.insert_many, docs_to_insert)
+                _guarded("mongo", sessions_collection.update_one,
+                    {"chat_id": chat_id},
+                    session_update_for_messages(chat_id, docs_to_insert, CHAT_TITLE_MAX_LENGTH),
+                    upsert=True
+                )
+                metrics.MONGO_WRITE_SECONDS.observe(time.perf_counter() - write_start, mode="sync")
+            if history_cache is not None:
+                # Each doc carries its _id already, so cached entries match what a DB read returns.
+                history_cache.append(chat_id, [_history_entry(doc) for doc in docs_to_insert])
+            if queued:
+                logger.debug(f"[{chat_id}] Queued {len(docs_to_insert)} message(s) for write-behind.")
+            else:
+                logger.debug(f"[{chat_id}] Saved {len(docs_to_insert)} message(s) to DB.")
+                _schedule_summary_update(chat_id)
         else:
-             logger.debug(f"[{chat_id}] No valid messages provided to save.")
+             logger.warning(f"[{chat_id}] Attempted to save empty user and model messages. Skipping.")
 
     except OperationFailure as ofe:
          logger.error(f"[{chat_id}] MongoDB operation failed during message save: {ofe}", exc_info=True)
@@ -494,76 +1948,237 @@ def save_chat_messages(chat_id: str, user_message: str, model_response: str):
         logger.error(f"[{chat_id}] Error saving messages: {e}", exc_info=True)
 
 
+async def aload_chat_history(chat_id: str, limit: int = HISTORY_LIMIT) -> list:
+    if async_chat_collection is None:
+        return await asyncio.to_thread(load_chat_history, chat_id, limit)
+    if history_cache is not None:
+        cached_history = await history_cache.aget(chat_id, limit)
+        if cached_history is not None:
+            logger.debug(f"[{chat_id}] Served {len(cached_history)} messages from history cache (limit={limit}).")
+            return cached_history
+    history = []
+    try:
+        fetch_limit = _history_fetch_limit(limit)
+        history_cursor = async_chat_collection.find(
+            {"chat_id": chat_id},
+            projection={"role": 1, "content": 1, "timestamp": 1}
+        ).sort("timestamp", pymongo.DESCENDING).limit(fetch_limit)
+        db_history = await _aguarded("mongo", history_cursor.to_list, length=fetch_limit)
+        db_history.reverse()
+        db_history = _merge_pending_writes(chat_id, db_history)
+        if history_cache is not None and fetch_limit <= history_cache.capacity:
+            await history_cache.afill(chat_id, db_history)
+        history = db_history[-limit:] if limit > 0 else []
+        logger.debug(f"[{chat_id}] Loaded {len(history)} messages from DB history asynchronously (limit={limit}).")
+    except CircuitOpenError as e:
+        history = _history_without_db(chat_id, limit, e)
+    except Exception as e:
+        logger.error(f"[{chat_id}] Error loading history from DB asynchronously: {e}", exc_info=True)
+    return history
+
+
+async def asave_chat_messages(chat_id: str, user_message: str, model_response: str):
+    if async_chat_collection is None:
+        return await asyncio.to_thread(save_chat_messages, chat_id, user_message, model_response)
+    try:
+        docs_to_insert = _build_message_docs(chat_id, user_message, model_response)
+        if docs_to_insert:
+            queued = _enqueue_turn(chat_id, docs_to_insert)
+            if not queued:
+                write_start = time.perf_counter()
+                await _aguarded("mongo", async_chat_collection.insert_many, docs_to_insert)
+                await _aguarded("mongo", async_sessions_collection.update_one,
+                    {"chat_id": chat_id},
+                    session_update_for_messages(chat_id, docs_to_insert, CHAT_TITLE_MAX_LENGTH),
+                    upsert=True
+                )
+                metrics.MONGO_WRITE_SECONDS.observe(time.perf_counter() - write_start, mode="async")
+            if history_cache is not None:
+                await history_cache.aappend(chat_id, [_history_entry(doc) for doc in docs_to_insert])
+            if queued:
+                logger.debug(f"[{chat_id}] Queued {len(docs_to_insert)} message(s) for write-behind.")
+            else:
+                logger.debug(f"[{chat_id}] Saved {len(docs_to_insert)} message(s) to DB asynchronously.")
+                _schedule_summary_update(chat_id)
+        else:
+             logger.warning(f"[{chat_id}] Attempted to save empty user and model messages. Skipping.")
+    except OperationFailure as ofe:
+         logger.error(f"[{chat_id}] MongoDB operation failed during async message save: {ofe}", exc_info=True)
+    except Exception as e:
+        logger.error(f"[{chat_id}] Error saving messages asynchronously: {e}", exc_info=True)
+
+
+# --- Rolling Conversation Summary ---
+
+def load_session_summary(chat_id: str):
+    """The chat's summary fields from its session document (cached with its history), or None."""
+    if sessions_collection is None:
+        return None
+    if history_cache is not None:
+        cached, summary = history_cache.get_summary(chat_id)
+        if cached:
+            return summary
+    try:
+        summary = _guarded("mongo", sessions_collection.find_one, {"chat_id": chat_id}, projection=SUMMARY_FIELDS)
+        if history_cache is not None:
+            history_cache.set_summary(chat_id, summary)
+        return summary
+    except CircuitOpenError:
+        metrics.DEGRADED_RESPONSES.inc(mode="no_summary")
+        return None
+    except Exception as e:
+        logger.error(f"[{chat_id}] Error loading conversation summary: {e}", exc_info=True)
+        return None
+
+
+async def aload_session_summary(chat_id: str):
+    if async_sessions_collection is None:
+        return await asyncio.to_thread(load_session_summary, chat_id)
+    if history_cache is not None:
+        cached, summary = await history_cache.aget_summary(chat_id)
+        if cached:
+            return summary
+    try:
+        summary = await _aguarded("mongo", async_sessions_collection.find_one, {"chat_id": chat_id}, projection=SUMMARY_FIELDS)
+        if history_cache is not None:
+            await history_cache.aset_summary(chat_id, summary)
+        return summary
+    except CircuitOpenError:
+        metrics.DEGRADED_RESPONSES.inc(mode="no_summary")
+        return None
+    except Exception as e:
+        logger.error(f"[{chat_id}] Error loading conversation summary asynchronously: {e}", exc_info=True)
+        return None
+
+
+def _schedule_summary_update(chat_id: str) -> None:
+    """Queues a background summary update for the chat; a no-op if one is already queued."""
+    if _summary_executor is None:
+        return
+    with _summary_lock:
+        if chat_id in _summary_pending:
+            return
+        _summary_pending.add(chat_id)
+    _summary_executor.submit(_run_summary_update, chat_id)
+
+
+def _run_summary_update(chat_id: str) -> None:
+    with _summary_lock:
+        _summary_pending.discard(chat_id)
+    try:
+        update_conversation_summary(chat_id)
+    except CircuitOpenError as e:
+        logger.debug(f"[{chat_id}][SUMMARY] {e} Deferring the summary update.")
+    except Exception as e:
+        logger.error(f"[{chat_id}][SUMMARY] Conversation summary update failed: {e}", exc_info=True)
+
+
+def update_conversation_summary(chat_id: str) -> bool:
+    """
+    Folds the chat's unsummarized messages, except the newest CHAT_SUMMARY_KEEP_RECENT_MESSAGES,
+    into its rolling summary. The write is conditional on the summary position it started
+    from, so concurrent updaters (other workers) cannot move the summary backwards.
+    Returns True if the summary changed.
+    """
+    if chat_collection is None or sessions_collection is None or direct_genai_model is None:
+        return False
+    keep_recent = settings.CHAT_SUMMARY_KEEP_RECENT_MESSAGES
+    session = _guarded("mongo", sessions_collection.find_one, {"chat_id": chat_id}, projection=SUMMARY_FIELDS) or {}
+    position = summary_position(session)
+    pending = _guarded("mongo", list,
+        chat_collection.find(
+            {"chat_id": chat_id, **messages_after_filter(position)},
+            projection={"role": 1, "content": 1, "timestamp": 1}
+        ).sort([("timestamp", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]).limit(MAX_MESSAGES_PER_UPDATE + keep_recent)
+    )
+    if len(pending) == MAX_MESSAGES_PER_UPDATE + keep_recent:
+        # More messages follow, so none of these are the newest ones to keep verbatim.
+        pending = pending[:MAX_MESSAGES_PER_UPDATE]
+        keep_recent = 0
+    to_fold = messages_to_fold(pending, keep_recent, settings.CHAT_SUMMARY_MIN_BATCH_MESSAGES)
+    if not to_fold:
+        return False
+
+    # Housekeeping never competes with chat turns for model slots; it catches up on a later turn.
+    ticket = admission.try_acquire() if admission is not None else None
+    if admission is not None and ticket is None:
+        logger.debug(f"[{chat_id}][SUMMARY] No idle model slot; deferring the summary update.")
+        return False
+    started_at = time.perf_counter()
+    prompt = build_summary_prompt(session.get("summary"), to_fold, settings.CHAT_SUMMARY_MAX_WORDS)
+    try:
+        summary = extract_response_text(generate_content(prompt, "summary"), f"[{chat_id}][SUMMARY] Model call").strip()
+    finally:
+        if ticket is not None:
+            ticket.release()
+    if not summary or summary.startswith("Error"):
+        logger.warning(f"[{chat_id}][SUMMARY] Summary not updated: {summary[:200]}")
+        return False
+
+    last_folded = to_fold[-1]
+    result = _guarded("mongo", sessions_collection.update_one,
+        {"chat_id": chat_id, "summary_message_id": session.get("summary_message_id")},
+        {"$set": {
+            "summary": summary,
+            "summary_until": last_folded["timestamp"],
+            "summary_message_id": last_folded["_id"],
+            "summary_updated_at": datetime.utcnow(),
+        }},
+    )
+    if history_cache is not None:
+        # Also after a lost race: the winner may have been another worker with its own cache.
+        history_cache.invalidate_summary(chat_id)
+    if not result.modified_count:
+        logger.info(f"[{chat_id}][SUMMARY] Summary was updated concurrently; discarding this update.")
+        return False
+    logger.info(f"[{chat_id}][SUMMARY] Folded {len(to_fold)} messages into the conversation summary "
+                f"({len(summary)} chars) in {time.perf_counter() - started_at:.2f}s.")
+    return True
+
+
 # --- Chat List & Management (keep as before) ---
 
-def get_chat_list() -> list:
+def get_chat_list_page(limit: int = CHAT_LIST_PAGE_SIZE, cursor: str = None) -> tuple[list, str]:
+    """
+    One page of the chat list, newest activity first, using a keyset cursor on
+    (last_activity, _id). Returns (chats, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for a malformed cursor.
+    """
     chat_list_result = []
-    if chat_collection is None:
-        logger.warning("Cannot get chat list: MongoDB collection not available.")
-        return chat_list_result
+    if sessions_collection is None:
+        logger.warning("Cannot get chat list page: MongoDB collection not available.")
+        return chat_list_result, None
+    query = session_page_filter(decode_keyset_cursor(cursor)) if cursor else {}
     try:
-        pipeline = [
-            {"$sort": {"timestamp": pymongo.ASCENDING}},
-            {"$group": {
-                "_id": "$chat_id",
-                "first_doc": {"$first": "$$ROOT"},
-                "latest_ts": {"$last": "$timestamp"}
-            }},
-            {"$sort": {"latest_ts": pymongo.DESCENDING}},
-            {"$project": {
-                "chat_id": "$_id",
-                "first_message_content": "$first_doc.content",
-                "first_message_role": "$first_doc.role",
-                "custom_title": "$first_doc.custom_title",
-                "first_message_timestamp": "$first_doc.timestamp",
-                "_id": 0
-            }}
-        ]
-        unique_chats_cursor = chat_collection.aggregate(pipeline)
-
-        for chat_data in unique_chats_cursor:
-            chat_id = chat_data.get('chat_id')
-            if not chat_id: continue
-
-            title = chat_data.get('custom_title')
-            if not title:
-                first_content = str(chat_data.get('first_message_content', '') or "").strip()
-                first_role = chat_data.get('first_message_role')
-                max_len = CHAT_TITLE_MAX_LENGTH
-
-                if first_role == 'user' and first_content:
-                    title = first_content[:max_len] + ('...' if len(first_content) > max_len else '')
-                elif first_role == 'model' and first_content:
-                     prefix = "Bot: "
-                     available_len = max_len - len(prefix)
-                     if available_len > 0:
-                         title = prefix + first_content[:available_len] + ('...' if len(first_content) > available_len else '')
-                     else:
-                          title = first_content[:max_len] + ('...' if len(first_content) > max_len else '')
-
-                if not title:
-                    timestamp = chat_data.get('first_message_timestamp')
-                    default_title = f"Chat {chat_id[:6]}..."
-                    if timestamp and isinstance(timestamp, datetime):
-                        try:
-                            default_title = timestamp.strftime("Chat %b %d, %H:%M")
-                        except ValueError: pass
-                    title = default_title
-
-            chat_list_result.append({"chat_id": chat_id, "title": title or f"Chat {chat_id[:6]}..."})
-
-        logger.info(f"Retrieved {len(chat_list_result)} unique chats.")
+        sessions_cursor = sessions_collection.find(
+            query,
+            projection={"chat_id": 1, "title": 1, "custom_title": 1, "last_activity": 1}
+        ).sort([("last_activity", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]).limit(limit + 1)
+        sessions = _guarded("mongo", list, sessions_cursor)
     except OperationFailure as ofe:
-         logger.error(f"MongoDB operation failed during get_chat_list: {ofe}", exc_info=True)
+        logger.error(f"MongoDB operation failed during get_chat_list_page: {ofe}", exc_info=True)
+        return chat_list_result, None
     except Exception as e:
-        logger.error(f"Error getting chat list: {e}", exc_info=True)
-    return chat_list_result
+        logger.error(f"Error getting chat list page: {e}", exc_info=True)
+        return chat_list_result, None
+
+    has_more = len(sessions) > limit
+    sessions = sessions[:limit]
+    for session in sessions:
+        chat_id = session.get('chat_id')
+        if not chat_id: continue
+        chat_list_result.append({"chat_id": chat_id, "title": session_display_title(session)})
+    next_cursor = encode_session_cursor(sessions[-1]) if has_more and sessions else None
+    logger.debug(f"Retrieved chat list page of {len(chat_list_result)} chats (more={has_more}).")
+    return chat_list_result, next_cursor
 
 
 def update_session_title(chat_id: str, new_title: str) -> bool:
     if chat_collection is None:
         logger.warning(f"[{chat_id}] Cannot update title: MongoDB collection not available.")
         return False
+    if not flush_pending_writes():
+        raise PendingWritesError(f"[{chat_id}] Queued messages are not saved yet; cannot update the title.")
     try:
         first_message = chat_collection.find_one(
             {"chat_id": chat_id},
@@ -574,12 +2189,18 @@ def update_session_title(chat_id: str, new_title: str) -> bool:
              logger.warning(f"[{chat_id}] Cannot update title: Chat session not found or has no messages.")
              return False
 
+        custom_title = str(new_title or "").strip()
         result = chat_collection.update_one(
             {"_id": first_message['_id']},
-            {"$set": {"custom_title": str(new_title or "").strip()}}
+            {"$set": {"custom_title": custom_title}}
+        )
+        # The first message keeps the title too, so backfill_chat_sessions can rebuild it.
+        session_result = sessions_collection.update_one(
+            {"chat_id": chat_id},
+            {"$set": {"custom_title": custom_title}}
         )
-        success = result.modified_count > 0
-        logger.info(f"[{chat_id}] Update title result: Matched={result.matched_count}, Modified={result.modified_count}. Success: {success}")
+        success = result.modified_count > 0 or session_result.modified_count > 0
+        logger.info(f"[{chat_id}] Update title result: Matched={result.matched_count}, Modified={result.modified_count}, Session modified={session_result.modified_count}. Success: {success}")
         return success
     except OperationFailure as ofe:
         logger.error(f"[{chat_id}] MongoDB operation failed during title update: {ofe}", exc_info=True)
@@ -593,9 +2214,19 @@ def delete_session_history(chat_id: str) -> int:
     if chat_collection is None:
         logger.warning(f"[{chat_id}] Cannot delete history: MongoDB collection not available.")
         return deleted_count
+    # Queued writes would otherwise re-create the chat right after it is deleted. A batch
+    # already being written cannot be purged, so the delete waits for it.
+    purged_turns = _purge_pending_writes(chat_id)
+    if purged_turns:
+        logger.info(f"[{chat_id}] Dropped {purged_turns} queued turn(s) before deleting the chat.")
+    if not flush_pending_writes():
+        raise PendingWritesError(f"[{chat_id}] A write for this chat is still in progress; cannot delete it yet.")
     try:
         result = chat_collection.delete_many({"chat_id": chat_id})
         deleted_count = result.deleted_count
+        sessions_collection.delete_one({"chat_id": chat_id})
+        if history_cache is not None:
+            history_cache.invalidate(chat_id)
         logger.info(f"[{chat_id}] Deleted {deleted_count} history documents.")
     except OperationFailure as ofe:
          logger.error(f"[{chat_id}] MongoDB operation failed during history deletion: {ofe}", exc_info=True)
@@ -0,0 +1,81 @@
+import asyncio
+import copy
+import threading
+import unicodedata
+from concurrent.futures import Future, wait
+
+from .deadlines import DeadlineExceeded, call_timeout
+
+
+def normalize_query(query: str) -> str:
+    """Coalescing key for a query: NFC, case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFC", str(query or "")).casefold().split())
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the leader) runs the
+    function, callers arriving while it is in flight wait for its result instead of running
+    their own, and each receives its own copy. Nothing is cached once the call finishes.
+    A call made through `do` (threads) and one made through `ado` (event loops) share the
+    same in-flight entry, since both wait on a concurrent.futures.Future. Followers wait
+    at most until the request deadline and then raise DeadlineExceeded for `stage`.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key) -> tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key, future: Future, result=None, error: BaseException = None) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key, func, stage: str = "coalesced") -> tuple:
+        """Runs func() or joins the identical call in flight. Returns (result, is_leader)."""
+        future, is_leader = self._join(key)
+        if not is_leader:
+            # wait() rather than result(timeout): the leader's own DeadlineExceeded is a TimeoutError too.
+            if not wait([future], timeout=call_timeout(stage)).done:
+                raise DeadlineExceeded(stage)
+            return copy.copy(future.result()), False
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result, True
+
+    async def ado(self, key, coroutine_func, stage: str = "coalesced") -> tuple:
+        """Async counterpart of do: awaits coroutine_func() or the identical call in flight."""
+        future, is_leader = self._join(key)
+        if not is_leader:
+            # asyncio.wait never cancels, so a timed-out follower leaves the shared future alone.
+            waiter = asyncio.wrap_future(future)
+            done, _ = await asyncio.wait({waiter}, timeout=call_timeout(stage))
+            if not done:
+                raise DeadlineExceeded(stage)
+            return copy.copy(waiter.result()), False
+        try:
+            result = await coroutine_func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result, True
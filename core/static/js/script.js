@@ -111,6 +111,60 @@ function appendMessage(text, sender, isLoading = false) {
     return messageDiv;
 }
 
+function buildHistoryMessage(message) {
+    if (!(message?.role && message.parts?.[0])) return null;
+    const sender = message.role === "user" ? "user" : "bot";
+    const msgDiv = document.createElement("div");
+    msgDiv.classList.add(
+        "message",
+        sender === "user" ? "user-message" : "bot-message"
+    );
+    msgDiv.innerHTML = message.parts[0].replace(/\n/g, "<br>");
+    return msgDiv;
+}
+
+let isLoadingOlderMessages = false;
+
+async function loadOlderMessages() {
+    if (!chatbox || !currentChatId || isLoadingOlderMessages) return;
+    const cursor = chatbox.dataset.historyCursor;
+    if (!cursor) return;
+
+    isLoadingOlderMessages = true;
+    const requestedChatId = currentChatId;
+    try {
+        const response = await fetch(
+            `/api/chat/history/?chat_id=${encodeURIComponent(
+                requestedChatId
+            )}&before=${encodeURIComponent(cursor)}`
+        );
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
+        if (requestedChatId !== currentChatId) return;
+
+        const fragment = document.createDocumentFragment();
+        (data.messages || []).forEach((message) => {
+            const msgDiv = buildHistoryMessage(message);
+            if (msgDiv) fragment.appendChild(msgDiv);
+        });
+        // Keep the messages the user is looking at in place while older ones are prepended.
+        const previousHeight = chatbox.scrollHeight;
+        chatbox.insertBefore(fragment, chatbox.firstChild);
+        chatbox.scrollTop += chatbox.scrollHeight - previousHeight;
+        chatbox.dataset.historyCursor = data.next_cursor || "";
+        console.log(
+            `[script] Loaded ${(data.messages || []).length} older messages. More: ${Boolean(data.next_cursor)}`
+        );
+    } catch (error) {
+        console.error("[script] Error loading older messages:", error);
+        showNotification("Lỗi: Không thể tải tin nhắn cũ hơn.", "error");
+    } finally {
+        isLoadingOlderMessages = false;
+    }
+}
+
 function loadInitialHistory() {
     const historyDataElement = document.getElementById("chat-history-data");
     if (!chatbox) {
@@ -128,19 +182,8 @@ function loadInitialHistory() {
                 );
                 const fragment = document.createDocumentFragment();
                 chatHistory.forEach((message) => {
-                    if (message?.role && message.parts?.[0]) {
-                        const sender = message.role === "user" ? "user" : "bot";
-                        const msgDiv = document.createElement("div");
-                        msgDiv.classList.add(
-                            "message",
-                            sender === "user" ? "user-message" : "bot-message"
-                        );
-                        msgDiv.innerHTML = message.parts[0].replace(
-                            /\n/g,
-                            "<br>"
-                        );
-                        fragment.appendChild(msgDiv);
-                    }
+                    const msgDiv = buildHistoryMessage(message);
+                    if (msgDiv) fragment.appendChild(msgDiv);
                 });
                 chatbox.appendChild(fragment);
                 setTimeout(scrollToBottom, 50);
@@ -175,6 +218,81 @@ function toggleInput(enabled) {
     }
 }
 
+function parseSseFrame(frame) {
+    let eventName = "message";
+    const dataLines = [];
+    frame.split("\n").forEach((line) => {
+        if (line.startsWith("event:")) {
+            eventName = line.slice(6).trim();
+        } else if (line.startsWith("data:")) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    if (dataLines.length === 0) return null;
+    try {
+        return { event: eventName, data: JSON.parse(dataLines.join("\n")) };
+    } catch (e) {
+        console.error("[script] Error parsing SSE frame:", e, frame);
+        return null;
+    }
+}
+
+async function readChatStream(response, sentMessageText, loadingIndicator) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let botMessageDiv = null;
+    let botText = "";
+
+    const handleEvent = (evt) => {
+        if (evt.event === "meta") {
+            if (evt.data.new_chat && !currentChatId) {
+                console.log("[script] Received new chat ID:", evt.data.chat_id);
+                currentChatId = evt.data.chat_id;
+                const newUrl = `/chat/?chat_id=${currentChatId}`;
+                history.pushState({ chatId: currentChatId }, "", newUrl);
+                console.log("[script] Updated browser URL to:", newUrl);
+                addChatToSidebar(currentChatId, sentMessageText);
+                updateMainTitle();
+            }
+        } else if (evt.event === "chunk") {
+            if (!botMessageDiv) {
+                if (loadingIndicator && chatbox.contains(loadingIndicator)) {
+                    chatbox.removeChild(loadingIndicator);
+                }
+                botMessageDiv = appendMessage("", "bot");
+            }
+            botText += evt.data.text || "";
+            botMessageDiv.innerHTML = botText.replace(/\n/g, "<br>");
+            scrollToBottom();
+        } else if (evt.event === "error") {
+            throw new Error(evt.data.error || "Lỗi từ Bot.");
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let separatorIndex;
+        while ((separatorIndex = buffer.indexOf("\n\n")) !== -1) {
+            const frame = buffer.slice(0, separatorIndex);
+            buffer = buffer.slice(separatorIndex + 2);
+            const evt = parseSseFrame(frame);
+            if (evt) handleEvent(evt);
+        }
+    }
+
+    if (loadingIndicator && chatbox.contains(loadingIndicator)) {
+        chatbox.removeChild(loadingIndicator);
+    }
+    if (!botMessageDiv) {
+        const errorMsg = "Phản hồi không hợp lệ từ bot.";
+        appendMessage(errorMsg, "bot");
+        showNotification(errorMsg, "error");
+    }
+}
+
 async function sendMessage() {
     if (isWaitingForResponse || !inputField || !submitButton) return;
     const userInput = inputField.value.trim();
@@ -207,7 +325,7 @@ async function sendMessage() {
             requestBody.chat_id = currentChatId;
         }
 
-        const response = await fetch("/api/chat/", {
+        const response = await fetch("/api/chat/stream/", {
             method: "POST",
             headers: {
                 "Content-Type": "application/json",
@@ -215,50 +333,28 @@ async function sendMessage() {
             },
             body: JSON.stringify(requestBody),
         });
-        if (loadingIndicator && chatbox.contains(loadingIndicator)) {
-            chatbox.removeChild(loadingIndicator);
-        }
 
         const contentType = response.headers.get("content-type");
-        if (!contentType || !contentType.includes("application/json")) {
+        if (!contentType || !contentType.includes("text/event-stream")) {
+            if (loadingIndicator && chatbox.contains(loadingIndicator)) {
+                chatbox.removeChild(loadingIndicator);
+            }
+            if (contentType && contentType.includes("application/json")) {
+                const data = await response.json();
+                throw new Error(data.error || `Server error: ${response.status}`);
+            }
             const responseText = await response.text();
             if (responseText.trim().startsWith("<!DOCTYPE html>")) {
                 throw new Error(`Lỗi máy chủ (${response.status}).`);
-            } else {
-                throw new Error(
-                    `Server returned non-JSON response (${
-                        response.status
-                    }): ${responseText.substring(0, 200)}`
-                );
             }
-        }
-        const data = await response.json();
-        if (!response.ok) {
-            throw new Error(data.error || `Server error: ${response.status}`);
+            throw new Error(
+                `Server returned unexpected response (${
+                    response.status
+                }): ${responseText.substring(0, 200)}`
+            );
         }
 
-        if (data.response) {
-            if (data.new_chat_id && !currentChatId) {
-                console.log("[script] Received new chat ID:", data.new_chat_id);
-                currentChatId = data.new_chat_id;
-                const newUrl = `/chat/?chat_id=${currentChatId}`;
-                history.pushState({ chatId: currentChatId }, "", newUrl);
-                console.log("[script] Updated browser URL to:", newUrl);
-                addChatToSidebar(currentChatId, sentMessageText);
-                updateMainTitle();
-                appendMessage(data.response, "bot");
-            } else {
-                appendMessage(data.response, "bot");
-            }
-        } else if (data.error) {
-            const errorMsg = `Lỗi từ Bot: ${data.error}`;
-            appendMessage(errorMsg, "bot");
-            showNotification(errorMsg, "error");
-        } else {
-            const errorMsg = "Phản hồi không hợp lệ từ bot.";
-            appendMessage(errorMsg, "bot");
-            showNotification(errorMsg, "error");
-        }
+        await readChatStream(response, sentMessageText, loadingIndicator);
     } catch (error) {
         console.error("[script] Error sending message:", error);
         const loadingElem = document.getElementById("loading-indicator");
@@ -277,6 +373,45 @@ async function sendMessage() {
     }
 }
 
+function escapeHtml(text) {
+    return String(text)
+        .replace(/&/g, "&amp;")
+        .replace(/</g, "&lt;")
+        .replace(/>/g, "&gt;")
+        .replace(/"/g, "&quot;")
+        .replace(/'/g, "&#39;");
+}
+
+function buildChatListItem(chatId, title) {
+    const safeId = encodeURIComponent(chatId);
+    const safeTitle = escapeHtml(title);
+    const li = document.createElement("li");
+    li.classList.add("submenu-content");
+    li.dataset.chatId = chatId;
+    if (chatId === currentChatId) li.classList.add("active");
+
+    li.innerHTML = `
+        <div class="chat-list-item">
+            <a href="/chat/?chat_id=${safeId}" class="chat-link" title="${safeTitle}">
+                <span class="chat-title-text">${safeTitle}</span>
+            </a>
+            <button class="chat-settings-btn" title="Tùy chọn"><i class="bx bx-dots-horizontal-rounded"></i></button>
+            <div class="edit-title-container" style="display: none;">
+                <input type="text" class="edit-title-input" value="${safeTitle}">
+                <div class="edit-title-actions">
+                    <button class="save-title-btn" title="Lưu"><i class="bx bx-check"></i></button>
+                    <button class="cancel-title-btn" title="Hủy"><i class="bx bx-x"></i></button>
+                </div>
+            </div>
+        </div>
+        <div class="chat-options-menu" style="display: none;">
+            <button class="rename-chat-btn"><i class="bx bx-pencil"></i> Đổi tên</button>
+            <button class="delete-chat-btn"><i class="bx bx-trash"></i> Xóa</button>
+        </div>
+    `;
+    return li;
+}
+
 function addChatToSidebar(chatId, firstUserMessage) {
     if (!chatListSubmenu) {
         console.warn("[script] Cannot add chat: chatListSubmenu missing.");
@@ -304,29 +439,7 @@ function addChatToSidebar(chatId, firstUserMessage) {
         titleSource = "User Message";
     }
 
-    const newLi = document.createElement("li");
-    newLi.classList.add("submenu-content");
-    newLi.dataset.chatId = chatId;
-
-    newLi.innerHTML = `
-        <div class="chat-list-item">
-            <a href="/chat/?chat_id=${chatId}" class="chat-link" title="${title}">
-                <span class="chat-title-text">${title}</span>
-            </a>
-            <button class="chat-settings-btn" title="Tùy chọn"><i class="bx bx-dots-horizontal-rounded"></i></button>
-            <div class="edit-title-container" style="display: none;">
-                <input type="text" class="edit-title-input" value="${title}">
-                <div class="edit-title-actions">
-                    <button class="save-title-btn" title="Lưu"><i class="bx bx-check"></i></button>
-                    <button class="cancel-title-btn" title="Hủy"><i class="bx bx-x"></i></button>
-                </div>
-            </div>
-        </div>
-        <div class="chat-options-menu" style="display: none;">
-            <button class="rename-chat-btn"><i class="bx bx-pencil"></i> Đổi tên</button>
-            <button class="delete-chat-btn"><i class="bx bx-trash"></i> Xóa</button>
-        </div>
-    `;
+    const newLi = buildChatListItem(chatId, title);
     chatListSubmenu.insertBefore(newLi, chatListSubmenu.firstChild);
     document
         .querySelectorAll(".submenu-content.active")
@@ -337,6 +450,49 @@ function addChatToSidebar(chatId, firstUserMessage) {
     );
 }
 
+let isLoadingChatList = false;
+
+async function loadMoreChats() {
+    if (!chatListSubmenu || isLoadingChatList) return;
+    const cursor = chatListSubmenu.dataset.nextCursor;
+    if (!cursor) return;
+
+    isLoadingChatList = true;
+    try {
+        const response = await fetch(
+            `/api/chats/?cursor=${encodeURIComponent(cursor)}`
+        );
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
+        if ((data.chats || []).length) {
+            chatListSubmenu.querySelector(".no-chats-placeholder")?.remove();
+        }
+        for (const chat of data.chats || []) {
+            // A chat that moved to the top since the page rendered can show up again in a later page.
+            if (chatListSubmenu.querySelector(`[data-chat-id="${CSS.escape(chat.chat_id)}"]`)) continue;
+            chatListSubmenu.appendChild(buildChatListItem(chat.chat_id, chat.title));
+        }
+        chatListSubmenu.dataset.nextCursor = data.next_cursor || "";
+        console.log(
+            `[script] Loaded ${(data.chats || []).length} more chats. More: ${Boolean(data.next_cursor)}`
+        );
+    } catch (error) {
+        console.error("[script] Error loading more chats:", error);
+        chatListSubmenu.dataset.nextCursor = "";
+    } finally {
+        isLoadingChatList = false;
+    }
+    // Keep loading until the list overflows, so the scroll listener has something to react to.
+    if (
+        chatListSubmenu.dataset.nextCursor &&
+        chatListSubmenu.scrollHeight <= chatListSubmenu.clientHeight
+    ) {
+        loadMoreChats();
+    }
+}
+
 async function saveChatTitle(
     chatId,
     inputElement,
@@ -504,7 +660,10 @@ document.addEventListener("DOMContentLoaded", function () {
                 e.preventDefault();
                 console.log("[script] New Chat clicked. Clearing state.");
                 currentChatId = null;
-                if (chatbox) chatbox.innerHTML = "";
+                if (chatbox) {
+                    chatbox.innerHTML = "";
+                    chatbox.dataset.historyCursor = "";
+                }
                 updateMainTitle();
                 if (inputField) inputField.focus();
                 history.pushState({ chatId: null }, "", "/chat/");
@@ -516,7 +675,23 @@ document.addEventListener("DOMContentLoaded", function () {
         });
     }
 
+    if (chatbox) {
+        chatbox.addEventListener("scroll", function () {
+            if (chatbox.scrollTop < 60) loadOlderMessages();
+        });
+    }
+
     if (chatListSubmenu) {
+        chatListSubmenu.addEventListener("scroll", function () {
+            const nearBottom =
+                chatListSubmenu.scrollTop + chatListSubmenu.clientHeight >=
+                chatListSubmenu.scrollHeight - 60;
+            if (nearBottom) loadMoreChats();
+        });
+        if (chatListSubmenu.scrollHeight <= chatListSubmenu.clientHeight) {
+            loadMoreChats();
+        }
+
         chatListSubmenu.addEventListener("click", function (event) {
             const target = event.target;
             const listItem = target.closest(".submenu-content");
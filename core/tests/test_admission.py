@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from core.admission import (
+    PRIORITY_CONVERSATION,
+    PRIORITY_NEW_CHAT,
+    AdmissionController,
+    AdmissionRejected,
+)
+
+
+def _wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+class _Waiter(threading.Thread):
+    """Calls acquire() on its own thread and records the ticket or the rejection."""
+
+    def __init__(self, controller, priority, timeout=None):
+        super().__init__(daemon=True)
+        self.controller, self.priority, self.timeout = controller, priority, timeout
+        self.ticket = self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.ticket = self.controller.acquire(self.priority, timeout=self.timeout)
+        except AdmissionRejected as e:
+            self.error = e
+
+
+class AdmissionControllerTests(unittest.TestCase):
+    def test_admits_up_to_the_limit_then_queues(self):
+        controller = AdmissionController(max_concurrent=1, queue_size=2, max_wait=5)
+        ticket = controller.acquire()
+        waiter = _Waiter(controller, PRIORITY_NEW_CHAT)
+        _wait_until(lambda: controller.state()["queued"] == 1)
+        self.assertIsNone(controller.try_acquire())
+        ticket.release()
+        waiter.join(5)
+        self.assertIsNotNone(waiter.ticket)
+        self.assertEqual(controller.state()["active"], 1)
+        waiter.ticket.release()
+        waiter.ticket.release()  # idempotent
+        self.assertEqual((controller.state()["active"], controller.state()["admitted"]), (0, 2))
+
+    def test_higher_priority_waiter_is_served_first(self):
+        controller = AdmissionController(max_concurrent=1, queue_size=2, max_wait=5)
+        ticket = controller.acquire()
+        new_chat = _Waiter(controller, PRIORITY_NEW_CHAT)
+        _wait_until(lambda: controller.state()["queued"] == 1)
+        follow_up = _Waiter(controller, PRIORITY_CONVERSATION)
+        _wait_until(lambda: controller.state()["queued"] == 2)
+        ticket.release()
+        follow_up.join(5)
+        self.assertIsNotNone(follow_up.ticket)
+        self.assertTrue(new_chat.is_alive())
+        follow_up.ticket.release()
+        new_chat.join(5)
+        new_chat.ticket.release()
+
+    def test_full_queue_evicts_a_lower_priority_waiter_or_rejects(self):
+        controller = AdmissionController(max_concurrent=1, queue_size=1, max_wait=5)
+        ticket = controller.acquire()
+        new_chat = _Waiter(controller, PRIORITY_NEW_CHAT)
+        _wait_until(lambda: controller.state()["queued"] == 1)
+        follow_up = _Waiter(controller, PRIORITY_CONVERSATION)
+        new_chat.join(5)
+        self.assertEqual((new_chat.error.reason, new_chat.error.status), ("evicted", 429))
+
+        with self.assertRaises(AdmissionRejected) as raised:
+            controller.acquire(PRIORITY_CONVERSATION)
+        self.assertEqual((raised.exception.reason, raised.exception.status), ("queue_full", 429))
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+
+        ticket.release()
+        follow_up.join(5)
+        follow_up.ticket.release()
+
+    def test_wait_times_out_with_503(self):
+        controller = AdmissionController(max_concurrent=1, queue_size=1, max_wait=5)
+        ticket = controller.acquire()
+        with self.assertRaises(AdmissionRejected) as raised:
+            controller.acquire(timeout=0.05)
+        self.assertEqual((raised.exception.reason, raised.exception.status), ("timeout", 503))
+        self.assertEqual(controller.state()["queued"], 0)
+        ticket.release()
+        self.assertEqual(controller.state()["active"], 0)
+
+    def test_async_acquire_waits_without_blocking_the_loop(self):
+        controller = AdmissionController(max_concurrent=1, queue_size=1, max_wait=5)
+
+        async def main():
+            ticket = await controller.aacquire()
+            waiting = asyncio.create_task(controller.aacquire())
+            await asyncio.sleep(0.01)
+            self.assertEqual(controller.state()["queued"], 1)
+            ticket.release()
+            second = await waiting
+            second.release()
+            with self.assertRaises(AdmissionRejected):
+                held = await controller.aacquire()
+                try:
+                    await controller.aacquire(timeout=0.01)
+                finally:
+                    held.release()
+
+        asyncio.run(main())
+        self.assertEqual(controller.state()["active"], 0)
+
+    def test_on_change_reports_active_and_queued(self):
+        changes = []
+        controller = AdmissionController(max_concurrent=2, queue_size=0, max_wait=1, on_change=lambda *state: changes.append(state))
+        controller.acquire().release()
+        self.assertEqual(changes, [(1, 0), (0, 0)])
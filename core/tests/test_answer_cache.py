@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from core.answer_cache import SemanticAnswerCache, read_index_version, write_index_version
+
+
+class SemanticAnswerCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.vectorstore_path = self.root / "vectorstore"
+        write_index_version(self.vectorstore_path)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _cache(self, **kwargs):
+        cache = SemanticAnswerCache(self.root / "answers.sqlite3", self.vectorstore_path, **kwargs)
+        self.addCleanup(cache._conn.close)
+        return cache
+
+    def test_hit_needs_similar_query_and_same_chunks(self):
+        cache = self._cache(similarity_threshold=0.95)
+        cache.store("học phí", [1.0, 0.0], ["c2", "c1"], "answer")
+        self.assertEqual(cache.lookup([0.99, 0.05], ["c1", "c2"]), "answer")
+        self.assertIsNone(cache.lookup([0.0, 1.0], ["c1", "c2"]))
+        self.assertIsNone(cache.lookup([1.0, 0.0], ["c1"]))
+        self.assertEqual(cache.stats(), {"entries": 1, "hits": 1, "misses": 2})
+
+    def test_entries_survive_a_restart(self):
+        self._cache().store("q", [1.0, 0.0], ["c1"], "answer")
+        self.assertEqual(self._cache().lookup([1.0, 0.0], ["c1"]), "answer")
+
+    def test_expired_entries_miss(self):
+        cache = self._cache(ttl_seconds=0)
+        cache.store("q", [1.0, 0.0], ["c1"], "answer")
+        cache._entries[next(iter(cache._entries))]["created_at"] -= 1
+        self.assertIsNone(cache.lookup([1.0, 0.0], ["c1"]))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_lru_bound(self):
+        cache = self._cache(max_entries=2)
+        for number in range(3):
+            cache.store(f"q{number}", [1.0, float(number)], [f"c{number}"], f"a{number}")
+        self.assertIsNone(cache.lookup([1.0, 0.0], ["c0"]))
+        self.assertEqual(cache.lookup([1.0, 2.0], ["c2"]), "a2")
+
+    def test_new_index_version_drops_answers(self):
+        cache = self._cache()
+        cache.store("q", [1.0, 0.0], ["c1"], "answer")
+        new_version = write_index_version(self.vectorstore_path)
+        self.assertEqual(read_index_version(self.vectorstore_path), new_version)
+        cache._last_version_check -= SemanticAnswerCache.VERSION_CHECK_INTERVAL
+        self.assertIsNone(cache.lookup([1.0, 0.0], ["c1"]))
+        self.assertIsNone(self._cache().lookup([1.0, 0.0], ["c1"]))
+
+    def test_clear_store(self):
+        self._cache().store("q", [1.0, 0.0], ["c1"], "answer")
+        SemanticAnswerCache.clear_store(self.root / "answers.sqlite3")
+        self.assertIsNone(self._cache().lookup([1.0, 0.0], ["c1"]))
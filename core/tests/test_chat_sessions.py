@@ -0,0 +1,164 @@
+import unittest
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from core.chat_sessions import (
+    backfill_session_operations,
+    decode_keyset_cursor,
+    derive_session_title,
+    encode_keyset_cursor,
+    encode_session_cursor,
+    mongo_timestamp,
+    session_display_title,
+    session_page_filter,
+    session_update_for_messages,
+)
+
+
+class MongoTimestampTests(unittest.TestCase):
+    def test_truncates_to_milliseconds(self):
+        value = datetime(2024, 5, 1, 12, 30, 15, 123456)
+        self.assertEqual(mongo_timestamp(value), datetime(2024, 5, 1, 12, 30, 15, 123000))
+
+    def test_is_idempotent(self):
+        value = mongo_timestamp(datetime(2024, 5, 1, 12, 30, 15, 999999))
+        self.assertEqual(mongo_timestamp(value), value)
+
+
+class KeysetCursorTests(unittest.TestCase):
+    def test_round_trip_preserves_position(self):
+        timestamp = mongo_timestamp(datetime(2024, 5, 1, 12, 30, 15, 123456))
+        object_id = ObjectId()
+        self.assertEqual(decode_keyset_cursor(encode_keyset_cursor(timestamp, object_id)), (timestamp, object_id))
+
+    def test_round_trip_matches_stored_message(self):
+        # A message doc's timestamp as built in memory must equal the one read back from MongoDB,
+        # otherwise the next history page repeats or skips the boundary message.
+        built = mongo_timestamp(datetime(2024, 5, 1, 12, 30, 15, 654321))
+        stored = built.replace(microsecond=built.microsecond // 1000 * 1000)
+        object_id = ObjectId()
+        sort_value, decoded_id = decode_keyset_cursor(encode_keyset_cursor(built, object_id))
+        self.assertEqual(sort_value, stored)
+        self.assertEqual(decoded_id, object_id)
+
+    def test_round_trip_without_timestamp(self):
+        object_id = ObjectId()
+        self.assertEqual(decode_keyset_cursor(encode_keyset_cursor(None, object_id)), (None, object_id))
+
+    def test_session_cursor_feeds_page_filter(self):
+        session = {"_id": ObjectId(), "last_activity": datetime(2024, 5, 1, 9, 0, 0, 250000)}
+        page_filter = session_page_filter(decode_keyset_cursor(encode_session_cursor(session)))
+        self.assertIn({"last_activity": session["last_activity"], "_id": {"$lt": session["_id"]}}, page_filter["$or"])
+
+    def test_malformed_cursor_raises_value_error(self):
+        for cursor in ("not-base64!", "e30=", encode_keyset_cursor(None, "not-an-object-id")):
+            with self.assertRaises(ValueError):
+                decode_keyset_cursor(cursor)
+
+
+class SessionUpdateTests(unittest.TestCase):
+    def _docs(self):
+        return [
+            {"role": "user", "content": "Hello there", "timestamp": datetime(2024, 5, 1, 9, 0)},
+            {"role": "model", "content": "Hi", "timestamp": datetime(2024, 5, 1, 9, 1)},
+        ]
+
+    def test_increments_count_by_default(self):
+        update = session_update_for_messages("chat1", self._docs(), 50)
+        self.assertEqual(update["$inc"], {"message_count": 2})
+        self.assertEqual(update["$max"], {"last_activity": datetime(2024, 5, 1, 9, 1)})
+        self.assertEqual(update["$setOnInsert"]["title"], "Hello there")
+
+    def test_recount_uses_max_so_retries_are_harmless(self):
+        update = session_update_for_messages("chat1", self._docs(), 50, message_count=7)
+        self.assertNotIn("$inc", update)
+        self.assertEqual(update["$max"]["message_count"], 7)
+
+
+class SessionTitleTests(unittest.TestCase):
+    def test_title_from_first_user_message(self):
+        self.assertEqual(derive_session_title("abcdef123", "user", "  Học phí năm nay  ", None, 50), "Học phí năm nay")
+        self.assertEqual(derive_session_title("abcdef123", "user", "x" * 12, None, 10), "x" * 10 + "...")
+
+    def test_title_from_first_model_message(self):
+        self.assertEqual(derive_session_title("abcdef123", "model", "Xin chào", None, 50), "Bot: Xin chào")
+
+    def test_fallback_titles(self):
+        self.assertEqual(derive_session_title("abcdef123", "user", "", datetime(2024, 5, 1, 9, 5), 50), "Chat May 01, 09:05")
+        self.assertEqual(derive_session_title("abcdef123", None, None, None, 50), "Chat abcdef...")
+
+    def test_custom_title_wins(self):
+        self.assertEqual(session_display_title({"chat_id": "abcdef123", "title": "Derived", "custom_title": "Mine"}), "Mine")
+        self.assertEqual(session_display_title({"chat_id": "abcdef123", "title": "Derived"}), "Derived")
+        self.assertEqual(session_display_title({"chat_id": "abcdef123"}), "Chat abcdef...")
+
+
+class _AggregatingCollection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        return iter(self.rows)
+
+
+class BackfillTests(unittest.TestCase):
+    def test_rebuilds_one_session_per_chat(self):
+        first = {"role": "user", "content": "Hello", "timestamp": datetime(2024, 5, 1, 9, 0)}
+        rows = [
+            {"_id": "chat1", "first_doc": first, "latest_ts": datetime(2024, 5, 2), "message_count": 4, "custom_title": "Renamed"},
+            {"_id": None, "first_doc": first},
+        ]
+        operations = list(backfill_session_operations(_AggregatingCollection(rows), 50))
+        self.assertEqual(operations, [UpdateOne({"chat_id": "chat1"}, {"$set": {
+            "chat_id": "chat1",
+            "title": "Hello",
+            "created_at": datetime(2024, 5, 1, 9, 0),
+            "last_activity": datetime(2024, 5, 2),
+            "message_count": 4,
+            "custom_title": "Renamed",
+        }}, upsert=True)])
+
+
+def _matches(document: dict, query: dict) -> bool:
+    """Just enough of MongoDB's query language ($or, $lt, equality) for session_page_filter."""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(_matches(document, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = document.get(field)
+            if value is None or not value < condition["$lt"]:
+                return False
+        elif document.get(field) != condition:
+            return False
+    return True
+
+
+class ChatListPagingTests(unittest.TestCase):
+    def _sessions(self):
+        sessions = [{"_id": ObjectId(), "last_activity": datetime(2024, 5, 1, 9, minute)} for minute in (0, 5, 5, 7)]
+        sessions += [{"_id": ObjectId(), "last_activity": None} for _ in range(2)]
+        # (last_activity desc, _id desc), sessions without activity last: the chat list's sort.
+        dated = sorted((s for s in sessions if s["last_activity"]), key=lambda s: (s["last_activity"], s["_id"]), reverse=True)
+        undated = sorted((s for s in sessions if not s["last_activity"]), key=lambda s: s["_id"], reverse=True)
+        return dated + undated
+
+    def test_pages_visit_every_session_once(self):
+        ordered = self._sessions()
+        seen, cursor = [], None
+        while True:
+            remaining = ordered if cursor is None else [
+                s for s in ordered if _matches(s, session_page_filter(decode_keyset_cursor(cursor)))
+            ]
+            page = remaining[:2]
+            if not page:
+                break
+            seen.extend(page)
+            cursor = encode_session_cursor(page[-1])
+        self.assertEqual([s["_id"] for s in seen], [s["_id"] for s in ordered])
+
+    def test_filter_after_a_session_without_activity(self):
+        object_id = ObjectId()
+        self.assertEqual(session_page_filter((None, object_id)), {"last_activity": None, "_id": {"$lt": object_id}})
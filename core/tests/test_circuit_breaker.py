@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+
+from core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+def _fail():
+    raise ConnectionError("down")
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def _breaker(self, **kwargs):
+        self.transitions = []
+        kwargs.setdefault("failure_threshold", 2)
+        kwargs.setdefault("reset_timeout", 60)
+        kwargs.setdefault("failure_exceptions", (ConnectionError, TimeoutError))
+        return CircuitBreaker("mongo", on_state_change=lambda *change: self.transitions.append(change), **kwargs)
+
+    def _expire(self, breaker):
+        breaker._opened_at -= breaker.reset_timeout
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = self._breaker()
+        with self.assertRaises(ConnectionError):
+            breaker.call(_fail)
+        self.assertEqual(breaker.call(lambda: "ok"), "ok")  # a success resets the count
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                breaker.call(_fail)
+        self.assertTrue(breaker.is_open())
+        with self.assertRaises(CircuitOpenError) as raised:
+            breaker.call(lambda: "never called")
+        self.assertEqual(raised.exception.dependency, "mongo")
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(self.transitions, [("mongo", CLOSED, OPEN)])
+        self.assertEqual(breaker.snapshot()["rejected"], 1)
+
+    def test_half_open_probe_success_closes(self):
+        breaker = self._breaker(failure_threshold=1)
+        with self.assertRaises(ConnectionError):
+            breaker.call(_fail)
+        self._expire(breaker)
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # one probe at a time
+        breaker.record_success()
+        self.assertEqual(breaker.snapshot()["state"], CLOSED)
+        self.assertEqual(self.transitions, [("mongo", CLOSED, OPEN), ("mongo", OPEN, HALF_OPEN), ("mongo", HALF_OPEN, CLOSED)])
+
+    def test_half_open_probe_failure_reopens(self):
+        breaker = self._breaker(failure_threshold=3)
+        for _ in range(3):
+            breaker.record_failure()
+        self._expire(breaker)
+        with self.assertRaises(ConnectionError):
+            breaker.call(_fail)
+        self.assertTrue(breaker.is_open())
+        self.assertEqual(self.transitions[-1], ("mongo", HALF_OPEN, OPEN))
+
+    def test_stale_probe_does_not_wedge_the_circuit(self):
+        breaker = self._breaker(failure_threshold=1)
+        breaker.record_failure()
+        self._expire(breaker)
+        self.assertTrue(breaker.allow())
+        breaker._probe_started_at -= breaker.reset_timeout
+        self.assertTrue(breaker.allow())
+
+    def test_only_failure_exceptions_count(self):
+        breaker = self._breaker(failure_threshold=1, ignored_exceptions=(TimeoutError,))
+        for error in (ValueError("bad input"), TimeoutError("safety")):
+            with self.assertRaises(type(error)):
+                breaker.call(lambda: (_ for _ in ()).throw(error))
+        self.assertEqual(breaker.snapshot()["state"], CLOSED)
+
+    def test_cancellation_releases_the_probe(self):
+        breaker = self._breaker(failure_threshold=1)
+        breaker.record_failure()
+        self._expire(breaker)
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(breaker.acall(cancelled))
+        self.assertEqual(breaker.snapshot()["state"], HALF_OPEN)
+        self.assertTrue(breaker.allow())
+
+    def test_async_call(self):
+        breaker = self._breaker()
+
+        async def ok():
+            return "ok"
+
+        self.assertEqual(asyncio.run(breaker.acall(ok)), "ok")
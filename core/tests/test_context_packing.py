@@ -0,0 +1,52 @@
+import unittest
+from types import SimpleNamespace
+
+from core.context_packing import estimate_tokens, format_excerpt_header, pack_context
+
+
+def _doc(text, source="docs/quy_che.pdf", page=0, start=None):
+    metadata = {"source": source, "page": page}
+    if start is not None:
+        metadata["start_index"] = start
+    return SimpleNamespace(page_content=text, metadata=metadata)
+
+
+PAGE = ("Sinh viên phải hoàn thành tối thiểu 120 tín chỉ để được xét tốt nghiệp. "
+        "Điểm trung bình tích lũy phải đạt từ 2.0 trở lên. Học phí được đóng theo từng học kỳ.")
+
+
+class PackContextTests(unittest.TestCase):
+    def test_merges_overlapping_chunks_by_offset(self):
+        first, second = PAGE[:80], PAGE[50:]
+        excerpts, stats = pack_context([_doc(second, start=50), _doc(first, start=0)])
+        self.assertEqual(len(excerpts), 1)
+        self.assertEqual(excerpts[0].text, PAGE)
+        self.assertEqual((excerpts[0].start, excerpts[0].end, excerpts[0].chunk_count), (0, len(PAGE), 2))
+        self.assertEqual(stats["merged"], 1)
+
+    def test_merges_on_literal_overlap_without_offsets(self):
+        excerpts, _ = pack_context([_doc(PAGE[:100]), _doc(PAGE[60:])])
+        self.assertEqual([excerpt.text for excerpt in excerpts], [PAGE])
+
+    def test_keeps_chunks_from_other_pages_apart(self):
+        excerpts, _ = pack_context([_doc(PAGE[:80], start=0), _doc(PAGE[50:], page=1, start=50)])
+        self.assertEqual(len(excerpts), 2)
+
+    def test_drops_near_duplicates_from_other_sources(self):
+        excerpts, stats = pack_context([_doc(PAGE), _doc(PAGE.replace("2.0", "2,0"), source="docs/copy.pdf")])
+        self.assertEqual(len(excerpts), 1)
+        self.assertEqual(stats["duplicates"], 1)
+
+    def test_token_budget_skips_later_chunks_and_truncates_the_first(self):
+        other = "Thời khóa biểu được công bố trước mỗi học kỳ trên cổng thông tin đào tạo của trường."
+        excerpts, stats = pack_context([_doc(PAGE), _doc(other, source="docs/lich.pdf")], token_budget=estimate_tokens(PAGE))
+        self.assertEqual([excerpt.text for excerpt in excerpts], [PAGE])
+        self.assertEqual(stats["over_budget"], 1)
+
+        excerpts, stats = pack_context([_doc(PAGE)], token_budget=10)
+        self.assertEqual(excerpts[0].text, PAGE[:30])
+        self.assertEqual(stats["tokens"], 10)
+
+    def test_header_uses_file_name_and_one_based_page(self):
+        excerpts, _ = pack_context([_doc(PAGE, page=2)])
+        self.assertEqual(format_excerpt_header(excerpts[0], 1), "--- Context from: quy_che.pdf, page 3 (Chunk 1) ---\n")
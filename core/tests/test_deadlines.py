@@ -0,0 +1,50 @@
+import asyncio
+import contextvars
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from core import deadlines
+
+
+class DeadlineTests(unittest.TestCase):
+    def test_no_deadline_by_default(self):
+        self.assertIsNone(deadlines.remaining())
+        self.assertIsNone(deadlines.call_timeout("router"))
+        self.assertEqual(deadlines.call_timeout("router", cap=5), 5)
+        deadlines.check("router")
+
+    def test_scope_sets_and_restores(self):
+        with deadlines.deadline_scope(10):
+            self.assertAlmostEqual(deadlines.remaining(), 10, delta=0.5)
+            self.assertEqual(deadlines.call_timeout("router", cap=2), 2)
+        self.assertIsNone(deadlines.current_deadline())
+
+    def test_nested_scope_only_tightens(self):
+        with deadlines.deadline_scope(1):
+            outer = deadlines.current_deadline()
+            with deadlines.deadline_scope(60):
+                self.assertEqual(deadlines.current_deadline(), outer)
+            with deadlines.deadline_scope(deadline=outer - 0.5):
+                self.assertEqual(deadlines.current_deadline(), outer - 0.5)
+            self.assertEqual(deadlines.current_deadline(), outer)
+
+    def test_expired_deadline_raises_with_stage(self):
+        with deadlines.deadline_scope(deadline=time.monotonic() - 1):
+            with self.assertRaises(deadlines.DeadlineExceeded) as raised:
+                deadlines.check("retrieval")
+            self.assertEqual(raised.exception.stage, "retrieval")
+            self.assertIsInstance(raised.exception, TimeoutError)
+            with self.assertRaises(deadlines.DeadlineExceeded):
+                deadlines.call_timeout("generation")
+
+    def test_follows_tasks_and_copied_contexts(self):
+        async def in_task():
+            return deadlines.current_deadline()
+
+        with deadlines.deadline_scope(5):
+            expected = deadlines.current_deadline()
+            self.assertEqual(asyncio.run(in_task()), expected)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                seen = executor.submit(contextvars.copy_context().run, deadlines.current_deadline).result()
+            self.assertEqual(seen, expected)
@@ -0,0 +1,63 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from core.embedding_cache import CachedEmbeddings
+
+
+class _CountingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(("document", list(texts)))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append(("query", [text]))
+        return [float(len(text)), 2.0]
+
+
+class CachedEmbeddingsTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self._tmp.name) / "embeddings.sqlite3"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_memory_hits_and_batch_deduplication(self):
+        underlying = _CountingEmbeddings()
+        cache = CachedEmbeddings(underlying, "model-a")
+        self.assertEqual(cache.embed_documents(["ab", "ab", "cde"]), [[2.0, 1.0], [2.0, 1.0], [3.0, 1.0]])
+        self.assertEqual(cache.embed_documents(["cde"]), [[3.0, 1.0]])
+        self.assertEqual(underlying.calls, [("document", ["ab", "cde"])])
+        stats = cache.stats()
+        self.assertEqual((stats["memory_hits"], stats["misses"], stats["memory_entries"]), (1, 2, 2))
+
+    def test_query_and_document_kinds_are_cached_separately(self):
+        underlying = _CountingEmbeddings()
+        cache = CachedEmbeddings(underlying, "model-a")
+        cache.embed_documents(["ab"])
+        self.assertEqual(cache.embed_query("ab"), [2.0, 2.0])
+        self.assertEqual(len(underlying.calls), 2)
+
+    def test_disk_layer_survives_a_restart_but_not_a_model_change(self):
+        CachedEmbeddings(_CountingEmbeddings(), "model-a", db_path=self.db_path).embed_query("hello")
+        underlying = _CountingEmbeddings()
+        restarted = CachedEmbeddings(underlying, "model-a", db_path=self.db_path)
+        self.assertEqual(restarted.embed_query("hello"), [5.0, 2.0])
+        self.assertEqual(underlying.calls, [])
+        self.assertEqual(restarted.stats()["disk_hits"], 1)
+
+        other_model = _CountingEmbeddings()
+        CachedEmbeddings(other_model, "fake-768-0", db_path=self.db_path).embed_query("hello")
+        self.assertEqual(other_model.calls, [("query", ["hello"])])
+
+    def test_lru_evicts_oldest_entries(self):
+        cache = CachedEmbeddings(_CountingEmbeddings(), "model-a", memory_size=2)
+        for text in ("a", "b", "c"):
+            cache.embed_query(text)
+        self.assertEqual(cache.stats()["memory_entries"], 2)
+        cache.embed_query("a")
+        self.assertEqual(cache.stats()["misses"], 4)
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from core.hedging import HedgePool, LatencyTracker, ahedged_call, hedged_call
+
+
+class LatencyTrackerTests(unittest.TestCase):
+    def test_percentile_needs_min_samples(self):
+        tracker = LatencyTracker(window=10, min_samples=3)
+        tracker.record(0.1)
+        self.assertIsNone(tracker.percentile(0.95))
+        for seconds in (0.2, 0.3, 0.4):
+            tracker.record(seconds)
+        self.assertEqual(tracker.percentile(0.5), 0.3)
+        self.assertEqual(tracker.percentile(1.0), 0.4)
+
+    def test_window_keeps_recent_samples(self):
+        tracker = LatencyTracker(window=2, min_samples=1)
+        for seconds in (5.0, 0.1, 0.2):
+            tracker.record(seconds)
+        self.assertEqual(tracker.percentile(1.0), 0.2)
+
+
+class HedgedCallTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = HedgePool(2)
+
+    def test_fast_call_is_not_hedged(self):
+        self.assertEqual(hedged_call(lambda: "ok", hedge_after=1.0, pool=self.pool), ("ok", "single"))
+
+    def test_slow_primary_loses_to_the_hedge(self):
+        calls = []
+        lock = threading.Lock()
+
+        def func():
+            with lock:
+                calls.append(None)
+                number = len(calls)
+            if number == 1:
+                time.sleep(0.5)
+                return "primary"
+            return "hedge"
+
+        self.assertEqual(hedged_call(func, hedge_after=0.02, pool=self.pool), ("hedge", "hedged"))
+
+    def test_hedge_skipped_when_the_pool_is_busy(self):
+        release = threading.Event()
+        busy = HedgePool(1)
+        self.assertIsNotNone(busy.try_submit(lambda: release.wait(5)))
+        try:
+            self.assertEqual(hedged_call(lambda: time.sleep(0.05) or "ok", hedge_after=0.01, pool=busy), ("ok", "skipped"))
+        finally:
+            release.set()
+
+    def test_error_raised_only_when_every_attempt_fails(self):
+        attempts = []
+
+        def failing_primary():
+            attempts.append(None)
+            if len(attempts) == 1:
+                time.sleep(0.05)
+                raise ConnectionError("primary failed")
+            time.sleep(0.1)
+            return "hedge"
+
+        self.assertEqual(hedged_call(failing_primary, hedge_after=0.01, pool=self.pool), ("hedge", "hedged"))
+
+        def always_failing():
+            raise ValueError("down")
+
+        with self.assertRaises(ValueError):
+            hedged_call(always_failing, hedge_after=1.0, pool=self.pool)
+
+
+class AsyncHedgedCallTests(unittest.TestCase):
+    def test_hedge_wins_and_the_loser_is_cancelled(self):
+        cancelled = []
+
+        async def main():
+            calls = []
+
+            async def attempt():
+                calls.append(None)
+                if len(calls) == 1:
+                    try:
+                        await asyncio.sleep(1)
+                    except asyncio.CancelledError:
+                        cancelled.append(True)
+                        raise
+                    return "primary"
+                return "hedge"
+
+            result = await ahedged_call(attempt, hedge_after=0.01)
+            await asyncio.sleep(0)
+            return result
+
+        self.assertEqual(asyncio.run(main()), ("hedge", "hedged"))
+        self.assertEqual(cancelled, [True])
+
+    def test_fast_call_is_single(self):
+        async def attempt():
+            return "ok"
+
+        self.assertEqual(asyncio.run(ahedged_call(attempt, hedge_after=1.0)), ("ok", "single"))
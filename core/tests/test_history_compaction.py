@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime
+
+from core.history_compaction import (
+    build_summary_prompt,
+    compact_history,
+    messages_after_filter,
+    messages_to_fold,
+    summary_position,
+)
+
+
+def _message(_id, content, second=0, microsecond=0, role="user"):
+    return {"_id": _id, "role": role, "content": content, "timestamp": datetime(2024, 5, 1, 9, 0, second, microsecond)}
+
+
+class SummaryPositionTests(unittest.TestCase):
+    def test_no_summary(self):
+        self.assertIsNone(summary_position(None))
+        self.assertIsNone(summary_position({"summary": "x"}))
+        self.assertEqual(messages_after_filter(None), {})
+
+    def test_position_and_filter(self):
+        session = {"summary": "x", "summary_until": datetime(2024, 5, 1), "summary_message_id": 7}
+        self.assertEqual(summary_position(session), (datetime(2024, 5, 1), 7))
+        self.assertEqual(messages_after_filter((datetime(2024, 5, 1), 7)), {"$or": [
+            {"timestamp": {"$gt": datetime(2024, 5, 1)}},
+            {"timestamp": datetime(2024, 5, 1), "_id": {"$gt": 7}},
+        ]})
+
+
+class MessagesToFoldTests(unittest.TestCase):
+    def test_keeps_recent_and_waits_for_batch(self):
+        pending = list(range(6))
+        self.assertEqual(messages_to_fold(pending, keep_recent=4, min_batch=2), [0, 1])
+        self.assertEqual(messages_to_fold(pending, keep_recent=4, min_batch=3), [])
+        self.assertEqual(messages_to_fold(pending, keep_recent=0, min_batch=0), pending)
+
+    def test_prompt_truncates_long_messages(self):
+        prompt = build_summary_prompt("", [{"role": "user", "content": "a" * 5000}], 100)
+        self.assertIn("(none yet)", prompt)
+        self.assertIn("user: " + "a" * 4000 + "...", prompt)
+
+
+class CompactHistoryTests(unittest.TestCase):
+    def test_without_summary_keeps_everything_under_ceiling(self):
+        messages = [_message(1, "hello"), _message(2, "world", second=1)]
+        self.assertEqual(compact_history(messages, None, 0), messages)
+
+    def test_drops_summarized_messages_and_prepends_summary(self):
+        messages = [_message(1, "old", second=0), _message(2, "new", second=1)]
+        session = {"summary": "Earlier talk", "summary_until": messages[0]["timestamp"], "summary_message_id": 1}
+        history = compact_history(messages, session, 0)
+        self.assertEqual(len(history), 3)
+        self.assertIn("Earlier talk", history[0]["content"])
+        self.assertEqual(history[-1]["_id"], 2)
+
+    def test_position_compared_at_millisecond_precision(self):
+        # The cached copy keeps microseconds while the stored summary_until was truncated to ms.
+        summarized = _message(1, "old", microsecond=123456)
+        newer = _message(2, "new", microsecond=123789)
+        session = {"summary": "s", "summary_until": datetime(2024, 5, 1, 9, 0, 0, 123000), "summary_message_id": 1}
+        history = compact_history([summarized, newer], session, 0)
+        self.assertEqual([message.get("_id") for message in history[2:]], [2])
+
+    def test_token_ceiling_drops_oldest_and_truncates_newest(self):
+        messages = [_message(1, "a" * 30), _message(2, "b" * 30, second=1)]
+        self.assertEqual([message["_id"] for message in compact_history(messages, None, 10)], [2])
+        truncated = compact_history([_message(3, "c" * 90)], None, 10)
+        self.assertEqual(truncated[0]["content"], "..." + "c" * 30)
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from core.lexical_index import LexicalIndex, LexicalIndexHandle, reciprocal_rank_fusion, tokenize_vi
+
+
+class TokenizeTests(unittest.TestCase):
+    def test_bigrams_folded_forms_and_code_parts(self):
+        terms = tokenize_vi("Học phần MAT101 theo 15/2023/TT-BGDĐT")
+        self.assertIn("học_phần", terms)
+        self.assertIn("hoc_phan", terms)
+        self.assertIn("15/2023/tt-bgdđt", terms)
+        self.assertIn("bgdđt", terms)
+        self.assertIn("mat101", terms)
+
+
+class LexicalIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = LexicalIndex.build(
+            ["c1", "c2", "c3"],
+            ["Quy chế đào tạo tín chỉ", "Học phí năm học 2024", "Điều kiện tốt nghiệp và học phí"],
+        )
+
+    def test_ranks_by_bm25(self):
+        hits = self.index.search("học phí", k=3)
+        self.assertEqual({chunk_id for chunk_id, _ in hits}, {"c2", "c3"})
+        self.assertEqual(hits[0][0], "c2")
+        self.assertGreater(hits[0][1], hits[1][1])
+
+    def test_matches_queries_typed_without_accents(self):
+        self.assertEqual(self.index.search("quy che dao tao", k=1)[0][0], "c1")
+
+    def test_save_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "lexical_index.json.gz"
+            self.index.save(path)
+            loaded = LexicalIndex.load(path)
+        self.assertEqual(loaded.search("học phí"), self.index.search("học phí"))
+
+    def test_posting_cut_off_bounds_terms_read(self):
+        self.index.max_postings_per_term = 1
+        self.assertEqual(len(self.index.search("học phí", k=3)), 1)
+
+
+class ReciprocalRankFusionTests(unittest.TestCase):
+    def test_items_in_both_rankings_win(self):
+        self.assertEqual(reciprocal_rank_fusion([["a", "b"], ["b", "c"]]), ["b", "a", "c"])
+
+    def test_single_ranking_is_preserved(self):
+        self.assertEqual(reciprocal_rank_fusion([["x", "y"]]), ["x", "y"])
+
+
+class LexicalIndexHandleTests(unittest.TestCase):
+    def test_reloads_after_the_file_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "lexical_index.json.gz"
+            self.assertIsNone(LexicalIndexHandle(path).get())
+
+            LexicalIndex.build(["c1"], ["học phí"]).save(path)
+            handle = LexicalIndexHandle(path)
+            first = handle.get()
+            self.assertEqual(first.chunk_ids, ["c1"])
+
+            LexicalIndex.build(["c1", "c2"], ["học phí", "tốt nghiệp"]).save(path)
+            os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+            self.assertIs(handle.get(), first)
+            handle._last_check -= LexicalIndexHandle.RELOAD_CHECK_INTERVAL
+            self.assertEqual(handle.get().chunk_ids, ["c1", "c2"])
+
+            path.unlink()
+            handle._last_check -= LexicalIndexHandle.RELOAD_CHECK_INTERVAL
+            self.assertIsNone(handle.get())
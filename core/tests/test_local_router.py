@@ -0,0 +1,72 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from core.local_router import (
+    GENERAL_CHAT,
+    SEARCH_DOCS,
+    LocalRouter,
+    NaiveBayesRouterModel,
+    log_routing_decision,
+    read_routing_log,
+    routing_log_files,
+)
+
+
+class RoutingLogTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / "routing_decisions.jsonl"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_appends_jsonl_records(self):
+        log_routing_decision(self.path, "học phí bao nhiêu", SEARCH_DOCS, "llm", 0.91234)
+        record = json.loads(self.path.read_text(encoding="utf-8"))
+        self.assertEqual((record["query"], record["decision"], record["source"]), ("học phí bao nhiêu", SEARCH_DOCS, "llm"))
+        self.assertEqual(record["confidence"], 0.9123)
+
+    def test_rotates_at_max_bytes_and_caps_backups(self):
+        for number in range(6):
+            log_routing_decision(self.path, f"query {number}", GENERAL_CHAT, "llm", max_bytes=1, backups=2)
+        self.assertEqual([path.name for path in routing_log_files(self.path)],
+                         ["routing_decisions.jsonl.2", "routing_decisions.jsonl.1", "routing_decisions.jsonl"])
+        # Oldest kept file first, so later labels win when train_local_router de-duplicates.
+        self.assertEqual([query for query, _ in read_routing_log(self.path)], ["query 3", "query 4", "query 5"])
+
+    def test_rotation_without_backups_drops_the_log(self):
+        for number in range(3):
+            log_routing_decision(self.path, f"query {number}", GENERAL_CHAT, "llm", max_bytes=1)
+        self.assertEqual(read_routing_log(self.path), [("query 2", GENERAL_CHAT)])
+
+    def test_read_filters_sources_and_bad_lines(self):
+        log_routing_decision(self.path, "hello", GENERAL_CHAT, "local")
+        log_routing_decision(self.path, "tuition fees", SEARCH_DOCS, "manual")
+        with self.path.open("a", encoding="utf-8") as log_file:
+            log_file.write("not json\n")
+        self.assertEqual(read_routing_log(self.path), [("tuition fees", SEARCH_DOCS)])
+        self.assertEqual(read_routing_log(Path(self._tmp.name) / "missing.jsonl"), [])
+
+
+class LocalRouterTests(unittest.TestCase):
+    def setUp(self):
+        samples = [("học phí ngành công nghệ thông tin", SEARCH_DOCS)] * 5 + [("xin chào bạn", GENERAL_CHAT)] * 5
+        self.model = NaiveBayesRouterModel.train(samples)
+
+    def test_confident_decision(self):
+        decision, confidence = LocalRouter(self.model, min_confidence=0.8).classify("học phí công nghệ thông tin")
+        self.assertEqual(decision, SEARCH_DOCS)
+        self.assertGreaterEqual(confidence, 0.8)
+
+    def test_abstains_below_min_confidence(self):
+        decision, _ = LocalRouter(self.model, min_confidence=0.999999).classify("something unrelated")
+        self.assertIsNone(decision)
+
+    def test_round_trips_through_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "model.json"
+            self.model.save(path)
+            loaded = NaiveBayesRouterModel.load(path)
+        self.assertEqual(loaded.predict_proba("xin chào"), self.model.predict_proba("xin chào"))
@@ -0,0 +1,36 @@
+import unittest
+
+from core import metrics
+
+
+class MetricsTests(unittest.TestCase):
+    def test_counter_renders_total_family(self):
+        counter = metrics.Counter("test_requests", "Requests.", ("result",))
+        counter.inc(result="ok")
+        counter.inc(2, result="ok")
+        self.assertEqual(counter.render(), [
+            "# HELP test_requests_total Requests.",
+            "# TYPE test_requests_total counter",
+            'test_requests_total{result="ok"} 3.0',
+        ])
+
+    def test_collectors_refresh_mirrored_totals_before_rendering(self):
+        counter = metrics.Counter("test_cache_lookups", "Lookups.", ("result",))
+        source = {"hits": 0}
+        metrics.add_collector(lambda: counter.set_total(source["hits"], result="hit"))
+        source["hits"] = 7
+        self.assertIn('test_cache_lookups_total{result="hit"} 7.0', metrics.render_metrics())
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("test_seconds", "Seconds.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value)
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("test_seconds_count 3", lines)
+
+    def test_rejects_wrong_labels(self):
+        with self.assertRaises(ValueError):
+            metrics.Counter("test_labelled", "Labelled.", ("a",)).inc(b="x")
@@ -0,0 +1,96 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from core.persistence import WriteBehindQueue
+
+
+class WriteBehindQueueTests(unittest.TestCase):
+    def _queue(self, flush_func, **kwargs):
+        kwargs.setdefault("flush_interval", 0.01)
+        kwargs.setdefault("retry_backoff", 0.001)
+        write_behind = WriteBehindQueue(flush_func, **kwargs)
+        self.addCleanup(write_behind.close)
+        return write_behind
+
+    def test_batches_items_and_flushes(self):
+        batches = []
+        write_behind = self._queue(batches.append, batch_size=3)
+        for item in range(5):
+            self.assertTrue(write_behind.submit(item))
+        self.assertTrue(write_behind.flush(timeout=5))
+        self.assertEqual([item for batch in batches for item in batch], [0, 1, 2, 3, 4])
+        self.assertTrue(all(len(batch) <= 3 for batch in batches))
+        self.assertEqual(write_behind.stats()["flushed"], 5)
+
+    def test_retries_then_succeeds(self):
+        attempts = []
+
+        def flaky(batch):
+            attempts.append(list(batch))
+            if len(attempts) < 3:
+                raise ConnectionError("mongo down")
+
+        write_behind = self._queue(flaky, max_retries=5)
+        write_behind.submit("a")
+        self.assertTrue(write_behind.flush(timeout=5))
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual((write_behind.stats()["retries"], write_behind.stats()["dead_lettered"]), (2, 0))
+
+    def test_dead_letters_after_max_retries(self):
+        discarded = []
+
+        def failing(batch):
+            raise ConnectionError("mongo down")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            dead_letter_path = Path(tmp) / "dead_letter.jsonl"
+            write_behind = self._queue(failing, max_retries=1, dead_letter_path=dead_letter_path, on_discard=discarded.extend)
+            write_behind.submit({"chat_id": "c1", "content": "xin chào"})
+            self.assertTrue(write_behind.flush(timeout=5))
+            lines = dead_letter_path.read_text(encoding="utf-8").splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{"chat_id": "c1", "content": "xin chào"}])
+        self.assertEqual(discarded, [{"chat_id": "c1", "content": "xin chào"}])
+        self.assertEqual(write_behind.stats()["dead_lettered"], 1)
+
+    def test_full_queue_rejects_instead_of_blocking(self):
+        release = threading.Event()
+        write_behind = self._queue(lambda batch: release.wait(5), max_size=1, batch_size=1)
+        self.addCleanup(release.set)
+        write_behind.submit("taken by the worker")
+        accepted = [write_behind.submit(item) for item in ("queued", "rejected", "rejected")]
+        self.assertIn(False, accepted)
+        self.assertGreaterEqual(write_behind.stats()["rejected"], 1)
+
+    def test_purge_removes_queued_items(self):
+        release = threading.Event()
+        written = []
+
+        def blocking(batch):
+            release.wait(5)
+            written.extend(batch)
+
+        write_behind = self._queue(blocking, batch_size=1)
+        write_behind.submit({"chat_id": "busy"})
+        for chat_id in ("c1", "c2", "c1"):
+            write_behind.submit({"chat_id": chat_id})
+        purged = write_behind.purge(lambda item: item["chat_id"] == "c1")
+        release.set()
+        self.assertTrue(write_behind.flush(timeout=5))
+        self.assertEqual(purged, [{"chat_id": "c1"}, {"chat_id": "c1"}])
+        self.assertNotIn({"chat_id": "c1"}, written)
+        self.assertIn({"chat_id": "c2"}, written)
+
+    def test_closed_gate_holds_writes_without_spending_retries(self):
+        gate_open = threading.Event()
+        batches = []
+        write_behind = self._queue(batches.append, gate=gate_open.is_set, max_retries=0)
+        write_behind.submit("held")
+        self.assertFalse(write_behind.flush(timeout=0.1))
+        self.assertEqual(batches, [])
+        gate_open.set()
+        self.assertTrue(write_behind.flush(timeout=5))
+        self.assertEqual(batches, [["held"]])
+        self.assertEqual(write_behind.stats()["dead_lettered"], 0)
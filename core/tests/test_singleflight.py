@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import unittest
+
+from core.deadlines import DeadlineExceeded, deadline_scope
+from core.singleflight import SingleFlight, normalize_query
+
+
+class _Leader:
+    """Runs a SingleFlight leader on a thread that blocks until released."""
+
+    def __init__(self, flight: SingleFlight, key, result=None, error: BaseException = None):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.result = result
+        self.error = error
+        self.thread = threading.Thread(target=self._run, args=(flight, key), daemon=True)
+        self.thread.start()
+        self.started.wait(1)
+
+    def _call(self):
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _run(self, flight, key):
+        try:
+            flight.do(key, self._call)
+        except BaseException:
+            pass
+
+    def finish(self):
+        self.release.set()
+        self.thread.join(5)
+
+
+class SingleFlightTests(unittest.TestCase):
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  Học   PHÍ "), "học phí")
+
+    def test_follower_receives_a_copy_of_the_leader_result(self):
+        flight = SingleFlight()
+        leader = _Leader(flight, "k", result=["doc"])
+        threading.Timer(0.05, leader.release.set).start()
+        result, is_leader = flight.do("k", lambda: ["own"])
+        leader.finish()
+        self.assertEqual((result, is_leader), (["doc"], False))
+        self.assertIsNot(result, leader.result)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_follower_sees_the_leader_error(self):
+        flight = SingleFlight()
+        leader = _Leader(flight, "k", error=ValueError("boom"))
+        threading.Timer(0.05, leader.release.set).start()
+        with self.assertRaisesRegex(ValueError, "boom"):
+            flight.do("k", lambda: None)
+        leader.finish()
+
+    def test_follower_gives_up_at_the_request_deadline(self):
+        flight = SingleFlight()
+        leader = _Leader(flight, "k", result="late")
+        try:
+            with deadline_scope(0.05):
+                with self.assertRaises(DeadlineExceeded) as raised:
+                    flight.do("k", lambda: "own", stage="router")
+            self.assertEqual(raised.exception.stage, "router")
+        finally:
+            leader.finish()
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_async_follower_gives_up_without_cancelling_the_leader(self):
+        flight = SingleFlight()
+        leader = _Leader(flight, "k", result="late")
+
+        async def follow():
+            with deadline_scope(0.05):
+                return await flight.ado("k", lambda: asyncio.sleep(0, "own"), stage="retrieval")
+
+        try:
+            with self.assertRaises(DeadlineExceeded):
+                asyncio.run(follow())
+        finally:
+            leader.finish()
+        self.assertEqual(flight.do("k", lambda: "fresh"), ("fresh", True))
+
+    def test_async_leader_and_follower(self):
+        flight = SingleFlight()
+
+        async def main():
+            release = asyncio.Event()
+
+            async def slow():
+                await release.wait()
+                return {"answer": 1}
+
+            leader = asyncio.create_task(flight.ado("k", slow))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(flight.ado("k", slow))
+            await asyncio.sleep(0)
+            release.set()
+            return await leader, await follower
+
+        (leader_result, leader_flag), (follower_result, follower_flag) = asyncio.run(main())
+        self.assertEqual((leader_flag, follower_flag), (True, False))
+        self.assertEqual(follower_result, leader_result)
+        self.assertIsNot(follower_result, leader_result)
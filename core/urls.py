@@ -6,8 +6,15 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('chat/', views.chat_index, name='chat_index'),
     path('logout/', views.logout_view, name='logout'),
+    path('healthz/', api.healthz, name='healthz'),
+    path('readyz/', api.readyz, name='readyz'),
+    path('metrics', api.metrics_view, name='metrics'),
 
     path('api/chat/', api.chat_api, name='chat_api'),
+    path('api/chat/stream/', api.chat_stream_api, name='chat_stream_api'),
+    path('api/chat/async/', api.chat_api_async, name='chat_api_async'),
+    path('api/chat/history/', api.chat_history_api, name='chat_history_api'),
+    path('api/chats/', api.chat_list_api, name='chat_list_api'),
     path('api/update-title/', api.update_chat_title_api, name='update_chat_title_api'),
     path('api/delete-chat/', api.delete_chat_api, name='delete_chat_api'),
 ]
\ No newline at end of file
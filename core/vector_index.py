@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_MATRIX_FILENAME = "vector_matrix.npy"
+VECTOR_METADATA_FILENAME = "vector_metadata.json"
+# Each export goes to its own vector_index/<version>/ directory; CURRENT names the published one,
+# so a reader always opens a matrix and metadata from the same build.
+VECTOR_INDEX_DIRNAME = "vector_index"
+CURRENT_POINTER_FILENAME = "CURRENT"
+KEEP_PREVIOUS_VERSIONS = 1
+
+
+def current_index_dir(vectorstore_path):
+    """Directory of the published matrix + metadata pair, or None if nothing was exported yet."""
+    vectorstore_path = Path(vectorstore_path)
+    try:
+        version = (vectorstore_path / VECTOR_INDEX_DIRNAME / CURRENT_POINTER_FILENAME).read_text(encoding="utf-8").strip()
+    except OSError:
+        # Indexes exported before versioning keep both files at the top level.
+        return vectorstore_path if (vectorstore_path / VECTOR_MATRIX_FILENAME).exists() else None
+    return vectorstore_path / VECTOR_INDEX_DIRNAME / version if version else None
+
+
+def export_vector_index(vectorstore_path, chunk_ids: list, vectors, documents: list, metadatas: list) -> int:
+    """
+    Writes the chunk embeddings as one contiguous float32 matrix (.npy, row i = chunk_ids[i])
+    plus a JSON sidecar with the IDs, texts and metadata, into a new version directory, then
+    publishes it by atomically replacing the CURRENT pointer. An empty collection exports an
+    empty matrix, so readers stop serving the previous one. Returns the number of rows written.
+    """
+    vectorstore_path = Path(vectorstore_path)
+    if len(chunk_ids):
+        matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] != len(chunk_ids):
+        raise ValueError(f"Expected one embedding row per chunk, got matrix shape {matrix.shape} for {len(chunk_ids)} chunks.")
+
+    index_root = vectorstore_path / VECTOR_INDEX_DIRNAME
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    version_dir = index_root / version
+    version_dir.mkdir(parents=True)
+    with open(version_dir / VECTOR_MATRIX_FILENAME, "wb") as matrix_file:
+        np.save(matrix_file, matrix)
+    payload = {
+        "version": 1,
+        "dimension": int(matrix.shape[1]),
+        "chunk_ids": list(chunk_ids),
+        "documents": [text or "" for text in documents],
+        "metadatas": [metadata or {} for metadata in metadatas],
+    }
+    with open(version_dir / VECTOR_METADATA_FILENAME, "w", encoding="utf-8") as metadata_file:
+        json.dump(payload, metadata_file, ensure_ascii=False, separators=(",", ":"))
+
+    pointer_path = index_root / CURRENT_POINTER_FILENAME
+    pointer_tmp = pointer_path.with_suffix(".tmp")
+    pointer_tmp.write_text(version, encoding="utf-8")
+    pointer_tmp.replace(pointer_path)
+    _remove_old_versions(vectorstore_path, version)
+    return matrix.shape[0]
+
+
+def _remove_old_versions(vectorstore_path: Path, current_version: str) -> None:
+    """Deletes superseded exports, keeping the newest KEEP_PREVIOUS_VERSIONS for readers still opening them."""
+    index_root = vectorstore_path / VECTOR_INDEX_DIRNAME
+    previous = sorted(path for path in index_root.iterdir() if path.is_dir() and path.name != current_version)
+    for path in previous[:max(0, len(previous) - KEEP_PREVIOUS_VERSIONS)]:
+        shutil.rmtree(path, ignore_errors=True)
+    # Unversioned files from older exports would otherwise be picked up if CURRENT were ever lost.
+    for filename in (VECTOR_MATRIX_FILENAME, VECTOR_METADATA_FILENAME):
+        legacy_path = vectorstore_path / filename
+        if legacy_path.exists():
+            legacy_path.unlink()
+
+
+class MmapVectorIndex:
+    """
+    Exact nearest-neighbour search over the exported embedding matrix.
+
+    The matrix is opened with mmap, so every worker process on the host shares the same
+    page-cache copy instead of loading its own. A query is one matrix-vector product plus
+    an argpartition; distances are squared L2, the same metric as the default Chroma collection.
+    """
+
+    def __init__(self, matrix, chunk_ids: list, documents: list, metadatas: list):
+        self.matrix = matrix
+        self.chunk_ids = chunk_ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.positions = {chunk_id: i for i, chunk_id in enumerate(chunk_ids)}
+        # ||x||^2 per row, so ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2 needs only the product per query.
+        self.squared_norms = np.einsum("ij,ij->i", matrix, matrix)
+
+    @classmethod
+    def load(cls, vectorstore_path, index_dir=None) -> "MmapVectorIndex":
+        """Opens the published export (or the one in `index_dir`)."""
+        index_dir = Path(index_dir) if index_dir is not None else current_index_dir(vectorstore_path)
+        if index_dir is None:
+            raise FileNotFoundError(f"No exported vector index in '{vectorstore_path}'; run build_rag_index.")
+        with open(index_dir / VECTOR_METADATA_FILENAME, encoding="utf-8") as metadata_file:
+            payload = json.load(metadata_file)
+        if payload.get("version") != 1:
+            raise ValueError(f"Unsupported vector index version {payload.get('version')}; rebuild the index.")
+        if payload["chunk_ids"]:
+            matrix = np.load(index_dir / VECTOR_MATRIX_FILENAME, mmap_mode="r")
+        else:
+            matrix = np.zeros((0, payload["dimension"]), dtype=np.float32)
+        if matrix.shape != (len(payload["chunk_ids"]), payload["dimension"]):
+            raise ValueError(f"Vector matrix shape {matrix.shape} does not match its metadata; rebuild the index.")
+        return cls(matrix, payload["chunk_ids"], payload["documents"], payload["metadatas"])
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def search(self, query_embedding, k: int) -> list[tuple[int, float]]:
+        """Top-k (row, squared L2 distance) pairs, nearest first."""
+        if not len(self.chunk_ids) or k <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        distances = self.squared_norms - 2.0 * (self.matrix @ query) + float(query @ query)
+        k = min(k, distances.shape[0])
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(int(row), float(distances[row])) for row in top]
+
+    def row(self, row: int) -> tuple[str, str, dict]:
+        """(chunk_id, text, metadata) for a matrix row."""
+        return self.chunk_ids[row], self.documents[row], self.metadatas[row]
+
+
+class MmapVectorIndexHandle:
+    """Opens the published export and transparently reopens it after build_rag_index publishes a new one."""
+
+    RELOAD_CHECK_INTERVAL = 30.0
+
+    def __init__(self, vectorstore_path):
+        self.vectorstore_path = Path(vectorstore_path)
+        self._index = None
+        self._version = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._reload_if_changed(force=True)
+
+    def _reload_if_changed(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_check < self.RELOAD_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        index_dir = current_index_dir(self.vectorstore_path)
+        try:
+            # The directory identifies a versioned export; the mtime covers the legacy top-level files.
+            version = (index_dir, os.path.getmtime(index_dir / VECTOR_MATRIX_FILENAME)) if index_dir is not None else None
+        except OSError:
+            version = None
+        if version is None:
+            self._index, self._version = None, None
+            return
+        if version == self._version:
+            return
+        try:
+            started_at = time.perf_counter()
+            self._index = MmapVectorIndex.load(self.vectorstore_path, index_dir)
+            self._version = version
+            logger.info(f"[RAG] Memory-mapped vector index opened from '{self.vectorstore_path}' "
+                        f"({len(self._index)} chunks) in {time.perf_counter() - started_at:.2f}s.")
+        except Exception as e:
+            logger.error(f"[RAG] Failed to open memory-mapped vector index in '{self.vectorstore_path}': {e}", exc_info=True)
+
+    def get(self):
+        with self._lock:
+            self._reload_if_changed()
+            return self._index
@@ -9,6 +9,7 @@ def home(request):
     return redirect('chat_index')
 
 def chat_index(request):
+    services.ensure_initialized()
     if services.initialization_error:
         logger.error(f"Rendering error page due to: {services.initialization_error}")
         return render(request, "error_page.html", {"error_message": f"Cannot initialize chat service: {services.initialization_error}"})
@@ -16,8 +17,10 @@ def chat_index(request):
     viewed_chat_id = request.GET.get('chat_id')
     logger.info(f"Accessing chat_index. Viewed Chat ID from URL: {viewed_chat_id}")
 
-    chat_list = services.get_chat_list()
+    # Only the first page is rendered; the sidebar fetches the rest from /api/chats/ on scroll.
+    chat_list, chat_list_next_cursor = services.get_chat_list_page()
     initial_history = []
+    history_cursor = None
     if viewed_chat_id:
         logger.info(f"Loading history for viewed chat ID: {viewed_chat_id}")
         raw_db_history = services.load_chat_history(viewed_chat_id)
@@ -28,6 +31,9 @@ def chat_index(request):
             if role and content is not None:
                  template_history.append({"role": role, "parts": [str(content)]})
         initial_history = template_history
+        if len(raw_db_history) >= services.HISTORY_LIMIT:
+            # Older messages are fetched from /api/chat/history/ when the user scrolls up.
+            history_cursor = services.history_cursor_for(raw_db_history)
         logger.debug(f"Loaded {len(initial_history)} messages for template rendering.")
 
     else:
@@ -35,8 +41,10 @@ def chat_index(request):
 
     context = {
         'chat_list': chat_list,
+        'chat_list_next_cursor': chat_list_next_cursor,
         'viewed_chat_id': viewed_chat_id,
         'chat_history': initial_history,
+        'history_cursor': history_cursor,
         'service_available': services.direct_genai_model is not None and services.chat_collection is not None,
     }
     return render(request, "index.html", context)